@@ -0,0 +1,198 @@
+"""
+Admission control in front of the model server
+A bounded priority queue with a global concurrency limit plus per-session
+token buckets. Requests that can't be served soon are shed right away with
+429 (session over its rate) or 503 (server full), both with Retry-After,
+so sessions that do get in keep a stable time-to-first-token.
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+
+from fastapi import HTTPException
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 1
+
+
+def turn_priority(text: str) -> int:
+    """Short, interactive turns ("yeah", "wait what?") jump the queue"""
+    words = text.split()
+    if len(words) <= 6 or text.rstrip().endswith("?"):
+        return PRIORITY_INTERACTIVE
+    return PRIORITY_NORMAL
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens/second, up to `burst` stored"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Take one token. Returns 0 on success, else seconds until one is free"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class Ticket:
+    """A granted generation slot. release() is idempotent and thread-safe"""
+
+    def __init__(self, controller: "AdmissionController", loop: asyncio.AbstractEventLoop):
+        self._controller = controller
+        self._loop = loop
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self) -> None:
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._controller._release()
+        else:
+            # Streaming generators finish in the threadpool
+            self._loop.call_soon_threadsafe(self._controller._release)
+
+
+class AdmissionController:
+    """
+    Global concurrency limit + bounded priority queue + per-session buckets
+
+    max_concurrent: generations forwarded to the upstream at once
+    max_queue:      waiters allowed before new requests are shed (503)
+    queue_timeout:  max seconds a request waits for a slot before 503
+    session_rate:   sustained turns/second per session (429 above it)
+    session_burst:  turns a session may send back-to-back
+    """
+
+    def __init__(self, max_concurrent=4, max_queue=16, queue_timeout=2.0,
+                 session_rate=1.0, session_burst=3):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.session_rate = session_rate
+        self.session_burst = session_burst
+        self.active = 0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._buckets = {}
+        self.admitted = 0
+        self.rejected_rate = 0
+        self.rejected_busy = 0
+
+    def _bucket(self, session_id: str) -> TokenBucket:
+        bucket = self._buckets.get(session_id)
+        if bucket is None:
+            if len(self._buckets) > 10000:
+                self._prune_buckets()
+            bucket = TokenBucket(self.session_rate, self.session_burst)
+            self._buckets[session_id] = bucket
+        return bucket
+
+    def _prune_buckets(self) -> None:
+        """Drop buckets that have refilled completely (idle sessions)"""
+        now = time.monotonic()
+        idle = self.session_burst / self.session_rate
+        for key in [k for k, b in self._buckets.items() if now - b.updated > idle]:
+            del self._buckets[key]
+
+    def _retry_after(self) -> int:
+        # Rough guess: one queue "generation" per concurrency slot
+        waiting = len(self._waiters) + 1
+        return max(1, math.ceil(waiting / self.max_concurrent))
+
+    async def acquire(self, session_id: str, priority: int = PRIORITY_NORMAL) -> Ticket:
+        """Wait for a slot or raise HTTPException(429/503) with Retry-After"""
+        loop = asyncio.get_running_loop()
+
+        wait = self._bucket(session_id).take()
+        if wait > 0:
+            self.rejected_rate += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests for this session, slow down",
+                headers={"Retry-After": str(max(1, math.ceil(wait)))},
+            )
+
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return Ticket(self, loop)
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_busy += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Server busy, try again shortly",
+                headers={"Retry-After": str(self._retry_after())},
+            )
+
+        future = loop.create_future()
+        entry = [priority, next(self._seq), future]
+        heapq.heappush(self._waiters, entry)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # Slot was handed over just as we timed out - keep it
+                self.admitted += 1
+                return Ticket(self, loop)
+            self._drop_waiter(entry)
+            self.rejected_busy += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Server busy, try again shortly",
+                headers={"Retry-After": str(self._retry_after())},
+            )
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release()
+            else:
+                self._drop_waiter(entry)
+            raise
+        self.admitted += 1
+        return Ticket(self, loop)
+
+    def _drop_waiter(self, entry: list) -> None:
+        entry[2].cancel()
+        if entry in self._waiters:
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+
+    def _release(self) -> None:
+        # Hand the slot straight to the best live waiter, if any
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(True)
+                return
+        self.active -= 1
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "queued": len(self._waiters),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected_rate_limited": self.rejected_rate,
+            "rejected_busy": self.rejected_busy,
+        }
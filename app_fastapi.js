@@ -1,13 +1,41 @@
 // Global state
 let isListening = false;
-let mediaRecorder = null;
 let audioContext = null;
 let conversationHistory = [];
 let isSpeaking = false;
-let currentAudio = null;
 let audioQueue = [];
 const MAX_HISTORY = 20;
 
+// Binary audio over WebSocket (see audio_codec.py)
+// Frame = u8 codec, u8 flags, u16 samples, u32 seq (little-endian) + payload
+const FRAME_HEADER = 8;
+const CODEC_PCM16 = 0;
+const CODEC_OPUS = 1;
+const FLAG_END = 1;
+const SAMPLE_RATE = 16000;
+const FRAME_SAMPLES = 320;      // 20 ms at 16 kHz
+const SILENCE_RMS = 0.01;       // below this a block counts as silence
+const SILENCE_MS = 700;         // this much silence after speech ends the utterance
+const canOpus = 'AudioEncoder' in window && 'AudioDecoder' in window;
+
+let micStream = null;
+let micSource = null;
+let micProcessor = null;
+let audioSocket = null;
+let opusEncoder = null;
+let serverCodecs = ['pcm16'];   // what /ws/audio can decode (its "ready" reply)
+let frameSeq = 0;
+let pendingSamples = new Float32Array(0);
+let heardSpeech = false;
+let silenceMs = 0;
+let ttsSocket = null;
+let playbackNodes = [];
+let currentPlayback = null;
+let currentTurnId = null;       // ties server spans for one turn together (see /api/traces)
+let historyVersion = 0;         // server history version our copy matches (delta protocol)
+const sessionId = localStorage.getItem('sessionId') || newTurnId();
+localStorage.setItem('sessionId', sessionId);
+
 // DOM elements
 const startBtn = document.getElementById('startBtn');
 const stopBtn = document.getElementById('stopBtn');
@@ -59,12 +87,201 @@ function initAudioContext() {
     }
 }
 
+function wsUrl(path) {
+    return backendUrlInput.value.replace(/^http/, 'ws') + path;
+}
+
+// Build one binary frame; payload is a Uint8Array
+function packFrame(codec, seq, samples, payload, end) {
+    const frame = new Uint8Array(FRAME_HEADER + payload.byteLength);
+    const view = new DataView(frame.buffer);
+    view.setUint8(0, codec);
+    view.setUint8(1, end ? FLAG_END : 0);
+    view.setUint16(2, samples, true);
+    view.setUint32(4, seq, true);
+    frame.set(payload, FRAME_HEADER);
+    return frame.buffer;
+}
+
+function floatToPcm16(samples) {
+    const pcm = new Int16Array(samples.length);
+    for (let i = 0; i < samples.length; i++) {
+        const s = Math.max(-1, Math.min(1, samples[i]));
+        pcm[i] = s * 32767;
+    }
+    return new Uint8Array(pcm.buffer);
+}
+
+function pcm16ToFloat(buffer) {
+    const pcm = new Int16Array(buffer);
+    const samples = new Float32Array(pcm.length);
+    for (let i = 0; i < pcm.length; i++) {
+        samples[i] = pcm[i] / 32768;
+    }
+    return samples;
+}
+
+// Average down to 16 kHz (the mic usually runs at 44.1/48 kHz)
+function downsample(input, fromRate) {
+    if (fromRate === SAMPLE_RATE) return Float32Array.from(input);
+    const ratio = fromRate / SAMPLE_RATE;
+    const output = new Float32Array(Math.floor(input.length / ratio));
+    for (let i = 0; i < output.length; i++) {
+        const start = Math.floor(i * ratio);
+        const end = Math.min(input.length, Math.floor((i + 1) * ratio));
+        let sum = 0;
+        for (let j = start; j < end; j++) sum += input[j];
+        output[i] = sum / Math.max(1, end - start);
+    }
+    return output;
+}
+
+// Opus via WebCodecs when the browser and the server both support it, else raw PCM16
+async function createOpusEncoder() {
+    if (!canOpus || !serverCodecs.includes('opus')) return null;
+    const config = { codec: 'opus', sampleRate: SAMPLE_RATE, numberOfChannels: 1, bitrate: 24000 };
+    try {
+        const { supported } = await AudioEncoder.isConfigSupported(config);
+        if (!supported) return null;
+        const encoder = new AudioEncoder({
+            output: (chunk) => {
+                const payload = new Uint8Array(chunk.byteLength);
+                chunk.copyTo(payload);
+                sendAudioFrame(packFrame(CODEC_OPUS, frameSeq++, FRAME_SAMPLES, payload, false));
+            },
+            error: (error) => console.error('Opus encoder error:', error)
+        });
+        encoder.configure(config);
+        return encoder;
+    } catch (error) {
+        return null;
+    }
+}
+
+function sendAudioFrame(frame) {
+    if (audioSocket && audioSocket.readyState === WebSocket.OPEN) {
+        audioSocket.send(frame);
+    }
+}
+
+function sendSamples(samples) {
+    if (opusEncoder) {
+        opusEncoder.encode(new AudioData({
+            format: 'f32',
+            sampleRate: SAMPLE_RATE,
+            numberOfFrames: samples.length,
+            numberOfChannels: 1,
+            timestamp: frameSeq * 20000,
+            data: samples
+        }));
+    } else {
+        sendAudioFrame(packFrame(CODEC_PCM16, frameSeq++, samples.length, floatToPcm16(samples), false));
+    }
+}
+
+// Mic block -> 20 ms frames, plus a simple energy check to find the end of an utterance
+function handleMicBlock(event) {
+    if (!isListening) return;
+    const block = downsample(event.inputBuffer.getChannelData(0), audioContext.sampleRate);
+    
+    const merged = new Float32Array(pendingSamples.length + block.length);
+    merged.set(pendingSamples);
+    merged.set(block, pendingSamples.length);
+    let offset = 0;
+    for (; offset + FRAME_SAMPLES <= merged.length; offset += FRAME_SAMPLES) {
+        sendSamples(merged.slice(offset, offset + FRAME_SAMPLES));
+    }
+    pendingSamples = merged.slice(offset);
+    
+    let energy = 0;
+    for (let i = 0; i < block.length; i++) energy += block[i] * block[i];
+    const rms = Math.sqrt(energy / Math.max(1, block.length));
+    if (rms > SILENCE_RMS) {
+        heardSpeech = true;
+        silenceMs = 0;
+    } else if (heardSpeech) {
+        silenceMs += block.length / SAMPLE_RATE * 1000;
+        if (silenceMs >= SILENCE_MS) {
+            heardSpeech = false;
+            silenceMs = 0;
+            endUtterance();
+        }
+    }
+}
+
+// Tell the server the utterance is over; it answers with a "final" transcript
+let utteranceEnding = null;
+let awaitingFinal = false;
+
+function endUtterance() {
+    utteranceEnding = (async () => {
+        if (opusEncoder) {
+            await opusEncoder.flush();
+        }
+        if (audioSocket && audioSocket.readyState === WebSocket.OPEN) {
+            updateStatus('🔄 Transcribing...', true);
+            awaitingFinal = true;
+            audioSocket.send(JSON.stringify({ type: 'stop' }));
+        }
+    })();
+    return utteranceEnding;
+}
+
+function openAudioSocket() {
+    return new Promise((resolve, reject) => {
+        const socket = new WebSocket(wsUrl('/ws/audio'));
+        socket.binaryType = 'arraybuffer';
+        socket.onopen = () => {
+            socket.send(JSON.stringify({ type: 'start', sample_rate: SAMPLE_RATE, session_id: sessionId }));
+        };
+        socket.onerror = () => reject(new Error('Could not open audio socket'));
+        // Closed before "ready": overloaded or speech recognition unavailable
+        socket.onclose = () => reject(new Error('Audio socket closed'));
+        socket.onmessage = async (event) => {
+            const message = JSON.parse(event.data);
+            if (message.type === 'ready') {
+                // Mic frames can go out now, in a codec the server decodes
+                serverCodecs = message.audio_codecs || ['pcm16'];
+                resolve(socket);
+            } else if (message.type === 'words') {
+                // The server drops words that are only the AI's own voice
+                if (message.echo) return;
+                userTranscriptEl.textContent = message.words.join(' ');
+                // User is talking - stop the AI voice
+                if (isSpeaking) {
+                    pauseTTS();
+                }
+            } else if (message.type === 'final') {
+                awaitingFinal = false;
+                if (!isListening) {
+                    socket.close();
+                }
+                const transcript = message.echo ? '' : (message.text || '');
+                if (transcript.trim()) {
+                    userTranscriptEl.textContent = transcript;
+                    if (isSpeaking) {
+                        pauseTTS();
+                    }
+                    await sendToAI(transcript);
+                }
+                if (isListening) {
+                    updateStatus('🎤 Listening...', true);
+                }
+            } else if (message.type === 'error') {
+                updateStatus('❌ Error: ' + message.message, false);
+                // Before "ready" this is why the socket is closing
+                reject(new Error(message.message));
+            }
+        };
+    });
+}
+
 // Start listening to microphone
 async function startListening() {
     try {
         updateStatus('🎤 Requesting microphone access...', false);
         
-        const stream = await navigator.mediaDevices.getUserMedia({ 
+        micStream = await navigator.mediaDevices.getUserMedia({ 
             audio: {
                 echoCancellation: true,
                 noiseSuppression: true,
@@ -75,39 +292,24 @@ async function startListening() {
         
         initAudioContext();
         
-        // Create media recorder
-        const options = { mimeType: 'audio/webm' };
-        mediaRecorder = new MediaRecorder(stream, options);
+        audioSocket = await openAudioSocket();
+        opusEncoder = await createOpusEncoder();
+        frameSeq = 0;
+        pendingSamples = new Float32Array(0);
+        awaitingFinal = false;
         
-        let audioChunks = [];
-        
-        mediaRecorder.ondataavailable = (event) => {
-            if (event.data.size > 0) {
-                audioChunks.push(event.data);
-            }
-        };
-        
-        mediaRecorder.onstop = async () => {
-            if (audioChunks.length > 0) {
-                const audioBlob = new Blob(audioChunks, { type: 'audio/webm' });
-                audioChunks = [];
-                
-                // Process the audio
-                await processAudio(audioBlob);
-            }
-        };
-        
-        // Start recording in chunks
-        mediaRecorder.start(1000);
+        // Stream mic audio as 20 ms frames - no more 3 second webm blobs
+        micSource = audioContext.createMediaStreamSource(micStream);
+        micProcessor = audioContext.createScriptProcessor(4096, 1, 1);
+        micProcessor.onaudioprocess = handleMicBlock;
+        micSource.connect(micProcessor);
+        micProcessor.connect(audioContext.destination);
         
         isListening = true;
         startBtn.disabled = true;
         stopBtn.disabled = false;
         updateStatus('🎤 Listening...', true);
         
-        // Auto-process every 3 seconds
-        startContinuousListening();
-        
     } catch (error) {
         console.error('Error accessing microphone:', error);
         updateStatus('❌ Error: ' + error.message, false);
@@ -115,81 +317,44 @@ async function startListening() {
     }
 }
 
-// Continuous listening with auto-processing
-function startContinuousListening() {
-    if (!isListening) return;
-    
-    setTimeout(() => {
-        if (isListening && mediaRecorder && mediaRecorder.state === 'recording') {
-            // Stop current recording to process
-            mediaRecorder.stop();
-            
-            // Restart recording after a brief pause
-            setTimeout(() => {
-                if (isListening) {
-                    mediaRecorder.start(1000);
-                    startContinuousListening();
-                }
-            }, 100);
-        }
-    }, 3000);
-}
-
 // Stop listening
-function stopListening() {
+async function stopListening() {
     isListening = false;
     
-    if (mediaRecorder && mediaRecorder.state !== 'inactive') {
-        mediaRecorder.stop();
-        mediaRecorder.stream.getTracks().forEach(track => track.stop());
+    if (micProcessor) {
+        micProcessor.disconnect();
+        micSource.disconnect();
+        micProcessor = null;
+        micSource = null;
     }
-    
-    startBtn.disabled = false;
+    if (micStream) {
+        micStream.getTracks().forEach(track => track.stop());
+        micStream = null;
+    }
+    startBtn.disabled = true;
     stopBtn.disabled = true;
-    updateStatus('⏹️ Stopped', false);
-}
-
-// Process audio and send to STT
-async function processAudio(audioBlob) {
-    try {
-        const backendUrl = backendUrlInput.value;
-        
-        // Create form data
-        const formData = new FormData();
-        formData.append('audio', audioBlob, 'audio.webm');
-        
-        updateStatus('🔄 Transcribing...', true);
-        
-        const response = await fetch(`${backendUrl}/api/transcribe`, {
-            method: 'POST',
-            body: formData
-        });
-        
-        if (!response.ok) {
-            throw new Error('STT request failed');
+    if (heardSpeech) {
+        // Finish the last utterance; the socket closes after its "final".
+        // The encoder must stay open until its flush has sent the last frames
+        heardSpeech = false;
+        await endUtterance().catch(error => console.error('Could not finish utterance:', error));
+    } else {
+        // A silence-triggered stop may still be flushing
+        if (utteranceEnding) {
+            await utteranceEnding.catch(() => {});
         }
-        
-        const data = await response.json();
-        const transcript = data.text || '';
-        
-        if (transcript.trim()) {
-            userTranscriptEl.textContent = transcript;
-            
-            // Pause TTS if speaking
-            if (isSpeaking) {
-                pauseTTS();
-            }
-            
-            // Send to AI
-            await sendToAI(transcript);
+        if (audioSocket && !awaitingFinal) {
+            audioSocket.close();
         }
-        
-        updateStatus('🎤 Listening...', true);
-        
-    } catch (error) {
-        console.error('Error processing audio:', error);
-        updateStatus('❌ Error: ' + error.message, false);
     }
+    if (opusEncoder) {
+        opusEncoder.close();
+        opusEncoder = null;
+    }
+    
+    startBtn.disabled = false;
+    stopBtn.disabled = true;
+    updateStatus('⏹️ Stopped', false);
 }
 
 // Send text to AI backend
@@ -197,7 +362,9 @@ async function sendToAI(userText) {
     try {
         updateStatus('🤔 AI thinking...', true);
         
-        // Add user message to history
+        // Add user message to history (replaced by the server's copy below);
+        // `confirmed` is the copy the server's delta applies to
+        const confirmed = conversationHistory.slice();
         conversationHistory.push({
             role: 'user',
             content: userText
@@ -211,15 +378,22 @@ async function sendToAI(userText) {
         updateConversationDisplay();
         
         const backendUrl = backendUrlInput.value;
+        currentTurnId = newTurnId();
+        
+        // The server answers with a short filler ("Hmm.") if the reply will be slow to start
+        const filler = speakChunk(userText, true);
         
         const response = await fetch(`${backendUrl}/api/chat`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
             },
+            // Only the new turn - the server keeps the history
             body: JSON.stringify({
                 text: userText,
-                history: conversationHistory
+                session_id: sessionId,
+                history_version: historyVersion,
+                turn_id: currentTurnId
             })
         });
         
@@ -230,13 +404,20 @@ async function sendToAI(userText) {
         const data = await response.json();
         const aiText = data.response;
         
-        // Update history from backend
-        conversationHistory = data.history;
+        // Apply what this turn appended, or take the whole history if we were out of sync
+        if (data.resync) {
+            conversationHistory = data.history;
+        } else {
+            conversationHistory = confirmed.concat(data.appended);
+        }
+        conversationHistory = conversationHistory.slice(-MAX_HISTORY * 2);
+        historyVersion = data.history_version;
         
         aiResponseEl.textContent = aiText;
         updateConversationDisplay();
         
-        // Convert to speech
+        // Convert to speech once the filler has finished
+        await filler;
         await textToSpeech(aiText);
         
         updateStatus('🎤 Listening...', true);
@@ -248,6 +429,11 @@ async function sendToAI(userText) {
     }
 }
 
+function newTurnId() {
+    const id = crypto.randomUUID ? crypto.randomUUID() : String(Math.random()).slice(2) + Date.now();
+    return id.replace(/-/g, '').slice(0, 16);
+}
+
 // Convert text to speech and play
 async function textToSpeech(text) {
     try {
@@ -287,59 +473,146 @@ function breakIntoChunks(text) {
     return chunks.filter(c => c);
 }
 
-// Speak a single chunk
-async function speakChunk(text) {
-    return new Promise(async (resolve, reject) => {
-        try {
-            const backendUrl = backendUrlInput.value;
-            
-            const response = await fetch(`${backendUrl}/api/tts`, {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify({ text: text })
-            });
-            
-            if (!response.ok) {
-                throw new Error('TTS request failed');
-            }
-            
-            const audioBlob = await response.blob();
-            const audioUrl = URL.createObjectURL(audioBlob);
-            
-            const audio = new Audio(audioUrl);
-            currentAudio = audio;
-            isSpeaking = true;
-            
-            audio.onended = () => {
-                isSpeaking = false;
-                URL.revokeObjectURL(audioUrl);
-                resolve();
-            };
-            
-            audio.onerror = (error) => {
+function getTtsSocket() {
+    if (ttsSocket && ttsSocket.readyState === WebSocket.OPEN) {
+        return Promise.resolve(ttsSocket);
+    }
+    return new Promise((resolve, reject) => {
+        const socket = new WebSocket(wsUrl('/ws/tts'));
+        socket.binaryType = 'arraybuffer';
+        socket.onopen = () => {
+            ttsSocket = socket;
+            resolve(socket);
+        };
+        socket.onerror = () => reject(new Error('Could not open TTS socket'));
+    });
+}
+
+// Speak a single chunk - playback starts on the first audio frame.
+// With filler set, text is the user's words and the server picks the filler
+async function speakChunk(text, filler = false) {
+    initAudioContext();
+    let socket;
+    try {
+        socket = await getTtsSocket();
+    } catch (error) {
+        console.error('Error speaking chunk:', error);
+        return; // Continue even if one chunk fails
+    }
+    
+    return new Promise((resolve) => {
+        let rate = SAMPLE_RATE;
+        let decoder = null;
+        let nextTime = 0;
+        let lastSource = null;
+        
+        const done = () => {
+            if (currentPlayback && currentPlayback.resolve === done) {
+                currentPlayback = null;
                 isSpeaking = false;
-                reject(error);
-            };
-            
-            await audio.play();
-            
-        } catch (error) {
-            console.error('Error speaking chunk:', error);
-            isSpeaking = false;
-            resolve(); // Continue even if one chunk fails
+                playbackNodes = [];
+            }
+            if (decoder && decoder.state !== 'closed') {
+                decoder.close();
+            }
+            resolve();
+        };
+        currentPlayback = { resolve: done };
+        isSpeaking = true;
+        
+        const schedule = (samples) => {
+            if (!isSpeaking || samples.length === 0) return;
+            const buffer = audioContext.createBuffer(1, samples.length, rate);
+            buffer.copyToChannel(samples, 0);
+            const source = audioContext.createBufferSource();
+            source.buffer = buffer;
+            source.connect(audioContext.destination);
+            nextTime = Math.max(nextTime, audioContext.currentTime + 0.02);
+            source.start(nextTime);
+            nextTime += buffer.duration;
+            playbackNodes.push(source);
+            lastSource = source;
+        };
+        
+        socket.onmessage = (event) => {
+            if (typeof event.data === 'string') {
+                const message = JSON.parse(event.data);
+                if (message.type === 'start') {
+                    rate = message.sample_rate;
+                    if (message.codec === 'opus') {
+                        decoder = new AudioDecoder({
+                            output: (data) => {
+                                const samples = new Float32Array(data.numberOfFrames);
+                                data.copyTo(samples, { planeIndex: 0, format: 'f32-planar' });
+                                data.close();
+                                schedule(samples);
+                            },
+                            error: (error) => console.error('Opus decoder error:', error)
+                        });
+                        decoder.configure({ codec: 'opus', sampleRate: rate, numberOfChannels: 1 });
+                    }
+                } else if (message.type === 'end') {
+                    const flushed = decoder ? decoder.flush() : Promise.resolve();
+                    flushed.then(() => {
+                        if (lastSource && isSpeaking) {
+                            lastSource.onended = done;
+                        } else {
+                            done();
+                        }
+                    });
+                } else if (message.type === 'error') {
+                    console.error('TTS error:', message.message);
+                    done();
+                }
+                return;
+            }
+            const view = new DataView(event.data);
+            const codec = view.getUint8(0);
+            const seq = view.getUint32(4, true);
+            const payload = event.data.slice(FRAME_HEADER);
+            if (codec === CODEC_OPUS && decoder) {
+                decoder.decode(new EncodedAudioChunk({ type: 'key', timestamp: seq * 20000, data: payload }));
+            } else {
+                schedule(pcm16ToFloat(payload));
+            }
+        };
+        
+        // Server closed on an error - don't leave the chunk loop waiting
+        socket.onclose = done;
+        
+        const request = { text: text, codec: canOpus ? 'opus' : 'pcm16', turn_id: currentTurnId, session_id: sessionId };
+        if (filler) {
+            request.type = 'filler';
         }
+        socket.send(JSON.stringify(request));
     });
 }
 
 // Pause TTS
 function pauseTTS() {
-    if (currentAudio) {
-        currentAudio.pause();
-        currentAudio = null;
+    playbackNodes.forEach(source => {
+        try { source.stop(); } catch (error) { /* already stopped */ }
+    });
+    playbackNodes = [];
+    if (isSpeaking) {
+        // Let the echo filter know the AI voice was cut off
+        fetch(`${backendUrlInput.value}/api/echo/stopped`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ session_id: sessionId })
+        }).catch(() => {});
     }
     isSpeaking = false;
+    if (ttsSocket) {
+        // Drop the rest of this utterance's frames
+        ttsSocket.close();
+        ttsSocket = null;
+    }
+    if (currentPlayback) {
+        const playback = currentPlayback;
+        currentPlayback = null;
+        playback.resolve();
+    }
 }
 
 // Clear conversation history
@@ -347,11 +620,14 @@ async function clearHistory() {
     try {
         const backendUrl = backendUrlInput.value;
         
-        await fetch(`${backendUrl}/api/history`, {
+        const response = await fetch(`${backendUrl}/api/history?session_id=${encodeURIComponent(sessionId)}`, {
             method: 'DELETE'
         });
+        const data = await response.json();
         
+        // Our (now empty) copy matches the server's version after the clear
         conversationHistory = [];
+        historyVersion = data.history_version ?? 0;
         conversationHistoryEl.innerHTML = '<p style="color: #999; text-align: center;">No messages yet. Start speaking!</p>';
         userTranscriptEl.textContent = 'Waiting for input...';
         aiResponseEl.textContent = 'Waiting for your message...';
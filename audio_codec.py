@@ -0,0 +1,216 @@
+"""
+Compact binary audio framing for WebSocket transport
+Replaces whole-WAV responses and webm blobs with small frames that can be
+played (or transcribed) as soon as the first one arrives.
+
+Each binary WebSocket message is one frame:
+
+    +-------+-------+---------+---------+----------------+
+    | codec | flags | samples |   seq   |    payload     |
+    |  u8   |  u8   |  u16 LE |  u32 LE |                |
+    +-------+-------+---------+---------+----------------+
+
+codec: 0 = raw 16-bit little-endian PCM, 1 = one Opus packet
+flags: bit 0 = last frame of the stream
+samples: audio samples in this frame (per channel)
+
+Sample rate and codec are announced once, in a JSON "start" message.
+Opus needs the optional `opuslib` package (and libopus); without it
+everything falls back to PCM16.
+"""
+
+import asyncio
+import io
+import os
+import struct
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+from lazy_import import lazy_module
+
+np = lazy_module("numpy")
+
+CODEC_PCM16 = 0
+CODEC_OPUS = 1
+CODECS = {"pcm16": CODEC_PCM16, "opus": CODEC_OPUS}
+CODEC_NAMES = {v: k for k, v in CODECS.items()}
+
+FLAG_END = 1
+HEADER = struct.Struct("<BBHI")
+
+TRANSPORT_RATE = 16000   # speech: 16 kHz mono is plenty
+FRAME_MS = 20
+OPUS_RATES = (8000, 12000, 16000, 24000, 48000)
+OPUS_BITRATE = 24000
+
+_opus_checked = None
+
+
+def opus_available() -> bool:
+    global _opus_checked
+    if _opus_checked is None:
+        try:
+            import opuslib  # noqa: F401
+            _opus_checked = True
+        except Exception:
+            _opus_checked = False
+    return _opus_checked
+
+
+def available_codecs() -> List[str]:
+    """Codec names this process can decode (and encode)"""
+    return ["pcm16", "opus"] if opus_available() else ["pcm16"]
+
+
+def pack_frame(codec: int, seq: int, samples: int, payload: bytes, end: bool = False) -> bytes:
+    return HEADER.pack(codec, FLAG_END if end else 0, samples, seq & 0xFFFFFFFF) + payload
+
+
+def unpack_frame(data: bytes) -> Tuple[int, int, int, int, bytes]:
+    """Returns (codec, flags, samples, seq, payload)"""
+    codec, flags, samples, seq = HEADER.unpack_from(data)
+    return codec, flags, samples, seq, data[HEADER.size:]
+
+
+def wav_to_float(wav_bytes: bytes):
+    """Decode a PCM WAV file to (mono float32 array, sample_rate)"""
+    with wave.open(io.BytesIO(wav_bytes), "rb") as wav:
+        rate = wav.getframerate()
+        channels = wav.getnchannels()
+        width = wav.getsampwidth()
+        raw = wav.readframes(wav.getnframes())
+    dtype = {1: np.uint8, 2: np.int16, 4: np.int32}[width]
+    audio = np.frombuffer(raw, dtype=dtype).astype(np.float32)
+    if width == 1:
+        audio = (audio - 128.0) / 128.0
+    else:
+        audio /= float(2 ** (8 * width - 1))
+    if channels > 1:
+        audio = audio.reshape(-1, channels).mean(axis=1)
+    return audio, rate
+
+
+def resample(audio, src_rate: int, dst_rate: int):
+    """Linear resampling - good enough for speech going to a speaker or Whisper"""
+    if src_rate == dst_rate or len(audio) == 0:
+        return audio.astype(np.float32, copy=False)
+    n_out = int(round(len(audio) * dst_rate / src_rate))
+    x_out = np.arange(n_out, dtype=np.float64) * (src_rate / dst_rate)
+    return np.interp(x_out, np.arange(len(audio)), audio).astype(np.float32)
+
+
+def float_to_pcm16(audio) -> bytes:
+    return (np.clip(audio, -1.0, 1.0) * 32767.0).astype("<i2").tobytes()
+
+
+def pcm16_to_float(payload: bytes):
+    return np.frombuffer(payload, dtype="<i2").astype(np.float32) / 32768.0
+
+
+class FrameEncoder:
+    """Stateful per-stream encoder: float32 audio in, framed packets out"""
+
+    def __init__(self, codec: str = "pcm16", sample_rate: int = TRANSPORT_RATE):
+        if codec == "opus" and (not opus_available() or sample_rate not in OPUS_RATES):
+            codec = "pcm16"
+        self.codec = codec
+        self.sample_rate = sample_rate
+        self.frame_samples = sample_rate * FRAME_MS // 1000
+        self._seq = 0
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._opus = None
+        if codec == "opus":
+            import opuslib
+            self._opus = opuslib.Encoder(sample_rate, 1, opuslib.APPLICATION_VOIP)
+            self._opus.bitrate = OPUS_BITRATE
+
+    def _frame(self, chunk, end: bool) -> bytes:
+        if self._opus is not None:
+            payload = self._opus.encode(float_to_pcm16(chunk), len(chunk))
+        else:
+            payload = float_to_pcm16(chunk)
+        frame = pack_frame(CODECS[self.codec], self._seq, len(chunk), payload, end)
+        self._seq += 1
+        return frame
+
+    def encode(self, audio) -> List[bytes]:
+        """Encode every full frame; a partial tail waits for the next call"""
+        if len(self._pending):
+            audio = np.concatenate((self._pending, audio))
+        n_full = len(audio) // self.frame_samples * self.frame_samples
+        frames = [
+            self._frame(audio[i:i + self.frame_samples], False)
+            for i in range(0, n_full, self.frame_samples)
+        ]
+        self._pending = audio[n_full:]
+        return frames
+
+    def finish(self) -> List[bytes]:
+        """Flush the tail (zero-padded for Opus) and mark the end of stream"""
+        tail = self._pending
+        self._pending = np.zeros(0, dtype=np.float32)
+        if self._opus is not None:
+            tail = np.concatenate((tail, np.zeros(self.frame_samples - len(tail), dtype=np.float32)))
+        return [self._frame(tail, True)]
+
+
+class FrameDecoder:
+    """Decodes frames from one incoming stream back to float32 audio"""
+
+    def __init__(self, sample_rate: int = TRANSPORT_RATE):
+        self.sample_rate = sample_rate
+        self._opus = None
+
+    def decode(self, data: bytes):
+        codec, flags, samples, seq, payload = unpack_frame(data)
+        if codec == CODEC_OPUS:
+            if self._opus is None:
+                if not opus_available():
+                    raise ValueError("Opus frames need opuslib on the server - send pcm16")
+                import opuslib
+                self._opus = opuslib.Decoder(self.sample_rate, 1)
+            payload = self._opus.decode(payload, max(samples, self.sample_rate * 120 // 1000))
+        elif codec != CODEC_PCM16:
+            raise ValueError(f"unknown codec {codec}")
+        return pcm16_to_float(payload), bool(flags & FLAG_END)
+
+
+class EncoderPool:
+    """Runs encode/decode work in a small thread pool, off the event loop"""
+
+    def __init__(self, workers: int = 0):
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="audio-codec")
+
+    async def run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+
+
+SEND_SLICE = TRANSPORT_RATE // 4   # encode 250 ms at a time so the first frames go out early
+
+
+async def send_audio(websocket, chunks, codec: str, pool: EncoderPool, source_rate: int,
+                     sample_rate: int = TRANSPORT_RATE) -> int:
+    """
+    Send audio as a JSON "start", binary frames and a JSON "end".
+    chunks: async iterable of float32 arrays at source_rate, e.g. a TTS
+    engine's stream() - each chunk goes out as soon as it is encoded.
+    Resampling and encoding run in the pool; returns the bytes sent.
+    """
+    encoder = FrameEncoder(codec, sample_rate)
+    await websocket.send_json({
+        "type": "start", "codec": encoder.codec, "sample_rate": sample_rate, "frame_ms": FRAME_MS,
+    })
+    sent = 0
+    async for chunk in chunks:
+        chunk = await pool.run(resample, chunk, source_rate, sample_rate)
+        for i in range(0, len(chunk), SEND_SLICE):
+            for frame in await pool.run(encoder.encode, chunk[i:i + SEND_SLICE]):
+                await websocket.send_bytes(frame)
+                sent += len(frame)
+    for frame in await pool.run(encoder.finish):
+        await websocket.send_bytes(frame)
+        sent += len(frame)
+    await websocket.send_json({"type": "end", "bytes": sent})
+    return sent
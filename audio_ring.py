@@ -0,0 +1,94 @@
+"""
+Preallocated float32 ring buffer for streaming microphone audio
+Replaces np.concatenate + re-slicing in the STT loop. The storage is
+mirrored (every sample is written twice, at i and i + capacity), so
+any window up to `capacity` samples is one contiguous view. Windows go
+straight to Whisper with no gather copy. Memory per session is fixed at
+2 * capacity * 4 bytes, however long the stream runs.
+"""
+
+import threading
+from typing import Optional
+
+import numpy as np
+
+
+class AudioRingBuffer:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._buf = np.zeros(2 * capacity, dtype=np.float32)
+        self._written = 0   # total samples ever written
+        self._read = 0      # absolute start of the next window
+        self.dropped = 0    # samples overwritten before they were read
+        self._cond = threading.Condition()
+
+    def write(self, samples: np.ndarray) -> None:
+        """Append samples (any 1-D float array/view, e.g. indata[:, 0])"""
+        n = len(samples)
+        cap = self.capacity
+        if n > cap:
+            samples = samples[-cap:]
+            self._written += n - cap
+            n = cap
+        with self._cond:
+            pos = self._written % cap
+            first = min(n, cap - pos)
+            self._buf[pos:pos + first] = samples[:first]
+            self._buf[pos + cap:pos + cap + first] = samples[:first]
+            rest = n - first
+            if rest:
+                self._buf[:rest] = samples[first:]
+                self._buf[cap:cap + rest] = samples[first:]
+            self._written += n
+            if self._written - self._read > cap:
+                self.dropped += self._written - cap - self._read
+                self._read = self._written - cap
+            self._cond.notify_all()
+
+    @property
+    def available(self) -> int:
+        return self._written - self._read
+
+    @property
+    def position(self) -> int:
+        """Absolute sample index of the next window's first sample"""
+        return self._read
+
+    def window(self, size: int) -> Optional[np.ndarray]:
+        """
+        View of the next `size` unread samples, or None if not enough yet.
+        The view aliases the ring: copy or consume it before the writer
+        has laid down another (capacity - size) samples.
+        """
+        if size > self.capacity:
+            raise ValueError("window larger than ring capacity")
+        with self._cond:
+            if self._written - self._read < size:
+                return None
+            start = self._read % self.capacity
+            return self._buf[start:start + size]
+
+    def wait_window(self, size: int, timeout: Optional[float] = None) -> Optional[np.ndarray]:
+        """Block until `size` samples are available, then return window(size)"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._written - self._read >= size, timeout):
+                return None
+            return self.window(size)
+
+    def advance(self, n: int) -> None:
+        """Consume n samples - keep (size - n) of them as overlap for the next window"""
+        with self._cond:
+            self._read = min(self._read + n, self._written)
+
+    def flush(self) -> np.ndarray:
+        """View of whatever is left unread (end of stream), then mark it consumed"""
+        with self._cond:
+            size = self._written - self._read
+            start = self._read % self.capacity
+            self._read = self._written
+            return self._buf[start:start + size]
+
+    def reset(self) -> None:
+        with self._cond:
+            self._written = self._read = 0
+            self.dropped = 0
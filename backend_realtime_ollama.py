@@ -3,19 +3,41 @@ Real-time AI Voice Assistant - Natural Human-like Conversation
 Using Ollama Phi3 Mini for local inference
 """
 
-from fastapi import FastAPI, HTTPException, File, UploadFile, WebSocket
+from fastapi import FastAPI, HTTPException, File, UploadFile, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
-import tempfile
+from starlette.background import BackgroundTask
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from starlette.requests import HTTPConnection
+from typing import Dict, List, Optional
 import os
 import io
-import ollama
 import json
 import asyncio
+import threading
+from session_store import DEFAULT_SESSION, create_store
+from admission import AdmissionController, turn_priority
+from transcript_log import TranscriptLog
+from turn_budget import classify_turn
+from sentence_stop import SentenceStopper
+from lazy_import import lazy_module, prewarm
+from keepalive import KeepAliveScheduler
+from audio_codec import FrameDecoder, EncoderPool, TRANSPORT_RATE, available_codecs, resample, send_audio
+from tts_engines import ClipCache, engine_names, float_to_wav, get_engine, pyttsx3
+from echo_filter import BARGE_IN, ECHO, EchoFilter
+from single_flight import SingleFlight, flight_key
+from tracing import TURN_HEADER, Tracer, new_turn_id, now_us
+from degradation import DegradationController, InFlight
+from model_router import ModelRouter
+from filler_bank import FillerBank
+from semantic_memory import SemanticMemory
+from context_budget import ContextBudget
+from session_replay import SessionRecorder
+import runtime_profile
+from runtime_profile import sse
 
-app = FastAPI(title="AI Voice Assistant - Real-time (Ollama)")
+app = FastAPI(title="AI Voice Assistant - Real-time (Ollama)", default_response_class=runtime_profile.response_class())
 
 app.add_middleware(
     CORSMiddleware,
@@ -23,23 +45,365 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[TURN_HEADER],
 )
 
 # Configuration
 OLLAMA_MODEL = "phi3:mini"
-conversation_history = []
 MAX_HISTORY = 20
 
+# Model routing: quick turns go to OLLAMA_MODEL, deeper ones to
+# OLLAMA_LARGE_MODEL while it meets LATENCY_SLO_MS (model_router.py)
+OLLAMA_LARGE_MODEL = os.environ.get("OLLAMA_LARGE_MODEL", "")
+LATENCY_SLO_MS = float(os.environ.get("LATENCY_SLO_MS", "800"))
+router = ModelRouter(OLLAMA_MODEL, OLLAMA_LARGE_MODEL, LATENCY_SLO_MS)
+
+# Fast start: heavy imports wait until first use and the upstream check runs
+# in the background, so the port is bound right away. FAST_START=0 restores
+# the old blocking startup.
+FAST_START = os.environ.get("FAST_START", "1") != "0"
+PREWARM = os.environ.get("PREWARM", "1") != "0"
+ollama = lazy_module("ollama", eager=not FAST_START)
+
+# Multi-worker mode: WORKERS>1 needs a shared store (sqlite:// or redis://)
+WORKERS = int(os.environ.get("WORKERS", "1"))
+SESSION_STORE = os.environ.get(
+    "SESSION_STORE", "sqlite:///sessions.db" if WORKERS > 1 else "memory://"
+)
+store = create_store(SESSION_STORE)
+# Upstream status checks are cached in the store, so all workers share one answer
+STATUS_CACHE_TTL = float(os.environ.get("STATUS_CACHE_TTL", "5"))
+
+# Admission control - limits are per worker, so Ollama sees at most
+# ADMISSION_MAX_CONCURRENT generations in total (match OLLAMA_NUM_PARALLEL)
+ADMISSION_MAX_CONCURRENT = int(os.environ.get("ADMISSION_MAX_CONCURRENT", "4"))
+admission = AdmissionController(
+    max_concurrent=max(1, ADMISSION_MAX_CONCURRENT // WORKERS),
+    max_queue=int(os.environ.get("ADMISSION_MAX_QUEUE", "16")),
+    queue_timeout=float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "2.0")),
+    session_rate=float(os.environ.get("SESSION_RATE", "1.0")),
+    session_burst=int(os.environ.get("SESSION_BURST", "3")),
+)
+
+# Append-only transcript log (survives restarts, shared by all workers)
+TRANSCRIPT_LOG = os.environ.get("TRANSCRIPT_LOG", "transcripts.db")
+transcript_log = TranscriptLog(TRANSCRIPT_LOG)
+_restored_sessions = set()
+# Semantic memory is indexed from the transcript log, so turns served by
+# other workers get recalled too: session -> newest row id indexed here
+_memory_synced: Dict[str, int] = {}
+_memory_sync_lock = threading.Lock()
+
+# Per-turn budgets (turn_budget.py) never go above this backend's old fixed
+# num_predict, so they only ever shorten replies here
+TURN_MAX_TOKENS = int(os.environ.get("TURN_MAX_TOKENS", "35"))
+
+# Early stop: close the stream after this many finished sentences (0 = off)
+MAX_REPLY_SENTENCES = int(os.environ.get("MAX_REPLY_SENTENCES", "2"))
+
+# System prompt - module level so warm-up primes the exact same prefix
+SYSTEM_PROMPT = (
+    "You're a chill person chatting. Keep it real and short:\n"
+    "- Simple stuff: 3-5 words (\"cool\", \"nice\", \"I feel you\")\n"
+    "- Normal chat: 1 sentence max\n"
+    "- Deep stuff: 2 sentences max\n\n"
+    "Talk like texting: yeah, nah, totally, I get it, fair enough.\n"
+    "DON'T ask questions back. DON'T be philosophical. DON'T explain.\n"
+    "Just react and keep it moving."
+)
+
+# Keep-alive: re-prime the model every KEEPALIVE_INTERVAL seconds while any
+# session had a turn in the last KEEPALIVE_IDLE seconds (interval 0 = off)
+KEEPALIVE_INTERVAL = float(os.environ.get("KEEPALIVE_INTERVAL", "60"))
+KEEPALIVE_IDLE = float(os.environ.get("KEEPALIVE_IDLE", "600"))
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "15m")
+
+# Binary audio over WebSocket: /ws/tts streams speech out, /ws/audio takes
+# mic audio in (PCM16 or Opus frames, see audio_codec.py)
+STT_MODEL = os.environ.get("STT_MODEL", "tiny")
+AUDIO_ENCODER_WORKERS = int(os.environ.get("AUDIO_ENCODER_WORKERS", "0"))
+encoder_pool = EncoderPool(AUDIO_ENCODER_WORKERS)
+stt_stream = lazy_module("stt_stream")
+np = lazy_module("numpy")
+
+# TTS engine for /api/tts and /ws/tts when the request doesn't name one
+# (pyttsx3 or piper - see tts_engines.py; PIPER_MODEL points at the voice)
+TTS_ENGINE = os.environ.get("TTS_ENGINE", "pyttsx3")
+
+# Identical concurrent upstream calls (same messages + params) share one request
+flights = SingleFlight()
+
+# Per-turn latency spans, kept in a ring buffer (see /api/traces)
+tracer = Tracer(int(os.environ.get("TRACE_BUFFER", "4096")))
+
+# Graceful degradation under overload (degradation.py): as event-loop lag,
+# the admission queue or TTS load build up, replies get shorter, context
+# leaner, TTS comes from a clip cache, STT drops to STT_FALLBACK_MODEL and
+# finally new sessions are turned away
+TTS_CAPACITY = int(os.environ.get("TTS_CAPACITY", "2"))
+STT_FALLBACK_MODEL = os.environ.get("STT_FALLBACK_MODEL", "tiny")
+tts_in_flight = InFlight()
+clip_cache = ClipCache(int(os.environ.get("TTS_CLIP_CACHE", "256")))
+degrade = DegradationController(
+    signals={
+        "upstream_queue": (lambda: admission.stats()["queued"], max(1, admission.max_queue // 2)),
+        "tts_in_flight": (lambda: tts_in_flight.value, TTS_CAPACITY),
+    },
+    lag_budget_ms=float(os.environ.get("LOOP_LAG_BUDGET_MS", "100")),
+)
+
+# Filler clips (filler_bank.py): when the model is predicted to take longer
+# than FILLER_TTFT_MS to its first token, the turn opens with a short
+# pre-synthesised "Hmm." / "Oh nice." in the same voice (0 disables)
+FILLER_TTFT_MS = float(os.environ.get("FILLER_TTFT_MS", "400"))
+filler_bank = FillerBank()
+
+# Long-term memory (semantic_memory.py): every turn is embedded, and the
+# MEMORY_TOP_K older turns most related to the new one go into the system
+# prompt next to the recent history (0 disables)
+MEMORY_TOP_K = int(os.environ.get("MEMORY_TOP_K", "3"))
+memory = SemanticMemory(
+    model_name=os.environ.get("MEMORY_EMBED_MODEL", "all-MiniLM-L6-v2"),
+    max_turns=int(os.environ.get("MEMORY_MAX_TURNS", "1000")),
+    max_sessions=int(os.environ.get("MEMORY_SESSIONS", "500")),
+    min_score=float(os.environ["MEMORY_MIN_SCORE"]) if os.environ.get("MEMORY_MIN_SCORE") else None,
+)
+
+# Prompt size (context_budget.py): the newest history messages that fit in
+# CONTEXT_TOKENS, counted with the model's tokenizer - CONTEXT_TOKENIZER
+# (tokenizer.json path or Hugging Face id, needs `pip install tokenizers`)
+CONTEXT_TOKENS = int(os.environ.get("CONTEXT_TOKENS", "512"))
+context = ContextBudget(
+    CONTEXT_TOKENS,
+    os.environ.get("CONTEXT_TOKENIZER", "microsoft/Phi-3-mini-4k-instruct"),
+)
+
+# Session recording (session_replay.py): SESSION_RECORD=session.jsonl.gz
+# writes every request, mic frame and upstream token timing to a file that
+# `python session_replay.py replay` plays back against the mock model
+recorder = SessionRecorder(os.environ.get("SESSION_RECORD", ""))
+
+# Echo filter: what each session is hearing right now, so transcripts of the
+# AI's own voice don't interrupt it or start a new generation
+echo_filter = EchoFilter(n=int(os.environ.get("ECHO_NGRAM", "3")))
+
 class ChatRequest(BaseModel):
     text: str
-    history: Optional[List[dict]] = []
+    history: Optional[List[dict]] = []      # ignored - the server keeps the history
+    session_id: Optional[str] = DEFAULT_SESSION
+    turn_id: Optional[str] = None
+    history_version: Optional[int] = None  # set = only send back what this turn appended
 
 class ChatResponse(BaseModel):
     response: str
-    history: List[dict]
+    history: Optional[List[dict]] = None
+    history_version: Optional[int] = None
+    appended: Optional[List[dict]] = None
+    resync: Optional[bool] = None
 
 class TTSRequest(BaseModel):
     text: str
+    engine: Optional[str] = None
+    turn_id: Optional[str] = None
+
+class CancelRequest(BaseModel):
+    session_id: Optional[str] = DEFAULT_SESSION
+
+class ClientSpan(BaseModel):
+    name: str
+    start_ms: float          # epoch milliseconds (Date.now())
+    duration_ms: float
+    attrs: Optional[dict] = None
+
+class ClientSpans(BaseModel):
+    turn_id: str
+    spans: List[ClientSpan]
+
+class EchoRequest(BaseModel):
+    text: str = ""
+    session_id: Optional[str] = DEFAULT_SESSION
+    duration: Optional[float] = None
+
+
+def remember(session_id: str, message: dict):
+    """Add a message to the live context and queue it for the transcript log"""
+    store.append_history(session_id, message, MAX_HISTORY * 2)
+    transcript_log.append(session_id, message)
+    context.count(message)
+
+
+def recall(session_id: str, text: str, last: int) -> str:
+    """Older turns related to this one, as a note for the system prompt"""
+    if MEMORY_TOP_K <= 0:
+        return ""
+    # The last `last` messages are in the prompt already
+    hits = memory.recall(session_id, text, MEMORY_TOP_K, skip_last=last)
+    if not hits:
+        return ""
+    lines = [f"{'User' if m['role'] == 'user' else 'You'}: {m['content']}" for m in hits]
+    return "\n\nEarlier in this conversation:\n" + "\n".join(lines)
+
+
+def history_delta(session_id: str, since: int) -> dict:
+    """
+    Messages appended since the client's history version, or the whole
+    history with "resync" when its copy can't be brought up to date (a clear,
+    another tab, or too far behind)
+    """
+    version = store.history_version(session_id)
+    behind = version - since
+    if 0 <= behind <= MAX_HISTORY * 2:
+        appended = store.get_history(session_id, last=behind) if behind else []
+        if len(appended) == behind:
+            return {"history_version": version, "appended": appended}
+    return {"history_version": version, "history": store.get_history(session_id), "resync": True}
+
+
+def chat_response(session_id: str, text: str, since: Optional[int]) -> ChatResponse:
+    """Full history for clients without a history version, otherwise the delta"""
+    if since is None:
+        return ChatResponse(response=text, history=store.get_history(session_id))
+    return ChatResponse(response=text, **history_delta(session_id, since))
+
+
+def build_prompt(session_id: str, system_prompt: str, text: str) -> list:
+    """System prompt, recalled older turns and the recent history that fits in CONTEXT_TOKENS"""
+    history = store.get_history(session_id, last=degrade.history(MAX_HISTORY * 2))
+    history = context.pack(history, CONTEXT_TOKENS - context.count_text(system_prompt))
+    system_prompt += recall(session_id, text, len(history))
+    history = context.pack(history, CONTEXT_TOKENS - context.count_text(system_prompt))
+    return [{"role": "system", "content": system_prompt}] + history
+
+
+def client_key(session_id: Optional[str], connection: HTTPConnection) -> str:
+    """
+    Key for per-client state such as the rate limit and the echo filter: the
+    session id, or the caller's address for pages that send none (they still
+    share the DEFAULT_SESSION history, but not each other's limits or audio)
+    """
+    if session_id and session_id != DEFAULT_SESSION:
+        return session_id
+    return f"client:{connection.client.host if connection.client else 'unknown'}"
+
+
+def turn_id_for(request: ChatRequest, http_request: Request) -> str:
+    """Client's turn id (body or X-Turn-Id header), or a new one"""
+    return request.turn_id or http_request.headers.get(TURN_HEADER) or new_turn_id()
+
+
+def shed_if_overloaded(session_id: str) -> None:
+    """503 for sessions we haven't seen lately while the server sheds load"""
+    if not degrade.admit_session(session_id):
+        raise HTTPException(
+            status_code=503,
+            detail="Server overloaded, try again shortly",
+            headers={"Retry-After": "10"},
+        )
+
+
+def pick_filler(session_id: str, budget, engine_name: str = TTS_ENGINE) -> Optional[str]:
+    """A filler to open the turn with, if the model is expected to be slow to start"""
+    if FILLER_TTFT_MS <= 0:
+        return None
+    predicted = router.predicted_ttft_ms(budget)
+    if predicted is None or predicted < FILLER_TTFT_MS:
+        return None
+    return filler_bank.choose(budget.kind, session_id, engine_name)
+
+
+def warm_fillers():
+    """Synthesise the filler bank in the default voice"""
+    try:
+        count = filler_bank.warm(get_engine(TTS_ENGINE))
+        print(f"🗣️ Filler bank ready: {count} clips ({TTS_ENGINE})")
+    except Exception as e:
+        print(f"⚠️ Filler bank not available: {e}")
+
+
+async def tts_chunks(engine, text: str):
+    """engine.stream() off the event loop; fillers from the bank, the clip cache when degraded"""
+    audio = filler_bank.clip(engine.name, text)
+    if audio is not None:
+        yield audio
+        return
+    with tts_in_flight.track():
+        if degrade.tier.cached_audio:
+            audio = clip_cache.get(engine.name, text)
+            if audio is not None:
+                yield audio
+                return
+        chunks = []
+        async for chunk in iterate_in_threadpool(engine.stream(text)):
+            chunks.append(chunk)
+            yield chunk
+        if degrade.tier.cached_audio:
+            clip_cache.put(engine.name, text, chunks)
+
+
+def filter_echo(request: ChatRequest, http_request: Request) -> bool:
+    """True if the turn is only the AI's own voice; otherwise strips any echoed words"""
+    echo_key = client_key(request.session_id, http_request)
+    verdict = echo_filter.classify(echo_key, request.text)
+    if verdict.kind == ECHO:
+        print(f"🔇 Echo ignored: {request.text[:60]}")
+        return True
+    if verdict.kind == BARGE_IN:
+        echo_filter.stopped(echo_key)
+        request.text = verdict.text
+    return False
+
+
+def echo_stream():
+    yield sse({'echo': True, 'done': True, 'full_text': ''})
+
+
+def restore_context(session_id: str):
+    """Rebuild the history from the transcript log the first time a session is seen"""
+    if session_id in _restored_sessions:
+        return
+    _restored_sessions.add(session_id)
+    if store.get_history(session_id, last=1):
+        return
+    for message in transcript_log.tail(session_id, MAX_HISTORY * 2):
+        store.append_history(session_id, message, MAX_HISTORY * 2)
+
+
+def sync_memory(session_id: str):
+    """
+    Index the session's log rows this process hasn't seen yet - every worker
+    writes the log, so this also picks up turns and clears from the others
+    """
+    if MEMORY_TOP_K <= 0:
+        return
+    with _memory_sync_lock:
+        # A session evicted from the index starts over
+        after = _memory_synced.get(session_id, 0) if session_id in memory else 0
+        messages, _memory_synced[session_id], cleared = transcript_log.since(session_id, after, memory.max_turns)
+        if cleared:
+            memory.clear(session_id)
+    memory.extend(session_id, [
+        {"role": m["role"], "content": m["content"].replace("/no_think", "")} for m in messages
+    ])
+
+
+def open_turn(session_id: str, user_message: dict, system_prompt: str, text: str) -> list:
+    """
+    Record the user's turn and build the prompt. Memory embedding and recall
+    and the store/log I/O block, so endpoints run this in the threadpool.
+    """
+    restore_context(session_id)
+    remember(session_id, user_message)
+    sync_memory(session_id)
+    store.clear_cancel(session_id)
+    return build_prompt(session_id, system_prompt, text)
+
+
+def release_when_done(stream, ticket):
+    """Hold the admission slot until the stream finishes or the client leaves"""
+    try:
+        yield from stream
+    finally:
+        ticket.release()
 
 
 def check_ollama():
@@ -61,31 +425,105 @@ def check_ollama():
         return False
 
 
+def upstream_status() -> bool:
+    """check_ollama() shared through the session store for STATUS_CACHE_TTL seconds"""
+    cached = store.cache_get("ollama_connected")
+    if cached is not None:
+        return cached == "1"
+    connected = check_ollama()
+    store.cache_set("ollama_connected", "1" if connected else "0", ttl=STATUS_CACHE_TTL)
+    return connected
+
+
+def prime_upstream():
+    """
+    One-token request with the real system prompt - keeps the routed models
+    loaded and their prefix cached. Each is also a time-to-first-token sample
+    for the router
+    """
+    for model in filter(None, (OLLAMA_MODEL, OLLAMA_LARGE_MODEL)):
+        start = now_us()
+        ollama.chat(
+            model=model,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": "hi"},
+            ],
+            options={"num_predict": 1},
+            keep_alive=OLLAMA_KEEP_ALIVE,
+        )
+        router.observe_reply(model, (now_us() - start) / 1e6, 1)
+
+
+keepalive = KeepAliveScheduler(prime_upstream, KEEPALIVE_INTERVAL, KEEPALIVE_IDLE)
+
+
+def warm_start():
+    """Check Ollama, then prime it"""
+    if check_ollama():
+        keepalive.warm_up()
+    # Everything loaded so far lives for the whole process
+    runtime_profile.freeze()
+
+
 @app.on_event("startup")
 async def startup_event():
+    runtime_profile.tune_gc()
     print("=" * 70)
     print("🎙️ Real-time AI Voice Assistant - Natural Conversation (Ollama)")
     print("=" * 70)
     print()
     print(f"🤖 Model: {OLLAMA_MODEL}")
     print(f"⚡ Mode: Real-time streaming")
+    print(f"🏎️ Runtime: {runtime_profile.describe()}")
     print(f"🎯 Goal: Natural human-like conversation")
     print()
-    check_ollama()
+    if FAST_START:
+        # Runs after the port is bound; the first request doesn't wait on it
+        if PREWARM:
+            prewarm([ollama, pyttsx3], then=warm_start)
+        else:
+            asyncio.get_running_loop().run_in_executor(None, warm_start)
+    else:
+        if check_ollama():
+            asyncio.get_running_loop().run_in_executor(None, keepalive.warm_up)
+        runtime_profile.freeze()
+    keepalive.start()
+    degrade.start()
+    if MEMORY_TOP_K > 0:
+        # Load the embedding model before the first turn needs it
+        asyncio.get_running_loop().run_in_executor(None, lambda: memory.embedder)
+    asyncio.get_running_loop().run_in_executor(None, lambda: context.counter)
+    if FILLER_TTFT_MS > 0:
+        asyncio.get_running_loop().run_in_executor(None, warm_fillers)
     print()
     print("🚀 Server ready on: http://localhost:8000")
     print("=" * 70)
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    # uvicorn re-raises SIGINT/SIGTERM after shutdown, so atexit handlers never run
+    await run_in_threadpool(recorder.close)
+    await run_in_threadpool(transcript_log.close)
+
+
 @app.get("/")
 async def root():
-    ollama_connected = check_ollama()
+    # Every open tab polls this - one check answers all of them, on every worker
+    ollama_connected = await run_in_threadpool(flights.do, "check_ollama", upstream_status)
     return {
         "status": "running",
         "backend": "Ollama",
         "ollama_connected": ollama_connected,
         "model": OLLAMA_MODEL,
         "mode": "real-time streaming",
+        "admission": admission.stats(),
+        "keepalive": keepalive.stats(),
+        "single_flight": flights.stats(),
+        "router": router.stats(),
+        "audio_codecs": available_codecs(),
+        "tts_engines": engine_names(),
         "optimizations": [
             "Low latency response",
             "Streaming text generation",
@@ -97,6 +535,10 @@ async def root():
             "chat": "/api/chat",
             "stream_chat": "/api/stream_chat",
             "tts": "/api/tts",
+            "tts_stream": "/ws/tts",
+            "audio_stream": "/ws/audio",
+            "traces": "/api/traces",
+            "metrics": "/api/metrics",
             "history": "/api/history"
         }
     }
@@ -112,56 +554,60 @@ async def transcribe_audio(audio: UploadFile = File(...)):
     })
 
 
-@app.post("/api/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+@app.post("/api/chat", response_model=ChatResponse, response_model_exclude_none=True)
+async def chat(request: ChatRequest, http_request: Request):
     """
     Generate AI response with optimizations for natural conversation
     """
-    global conversation_history
+    session_id = request.session_id or DEFAULT_SESSION
+    recorder.request(session_id, "POST", "/api/chat", request.model_dump(exclude={"history"}, exclude_none=True))
+    turn_id = turn_id_for(request, http_request)
+    if filter_echo(request, http_request):
+        return chat_response(session_id, "", request.history_version)
+    shed_if_overloaded(session_id)
+    with tracer.span(turn_id, "admission"):
+        ticket = await admission.acquire(client_key(request.session_id, http_request), turn_priority(request.text))
+    keepalive.touch()
+    budget = degrade.budget(classify_turn(request.text, TURN_MAX_TOKENS))
     
     try:
+        prompt_start = now_us()
         # Add user message
         user_message = {"role": "user", "content": request.text}
-        conversation_history.append(user_message)
-        
-        # Maintain history
-        if len(conversation_history) > MAX_HISTORY * 2:
-            conversation_history = conversation_history[-MAX_HISTORY * 2:]
-        
         # Build optimized prompt for natural conversation
-        messages = [
-            {
-                "role": "system",
-                "content": (
-                    "You're a chill person chatting. Keep it real and short:\n"
-                    "- Simple stuff: 3-5 words (\"cool\", \"nice\", \"I feel you\")\n"
-                    "- Normal chat: 1 sentence max\n"
-                    "- Deep stuff: 2 sentences max\n\n"
-                    "Talk like texting: yeah, nah, totally, I get it, fair enough.\n"
-                    "DON'T ask questions back. DON'T be philosophical. DON'T explain.\n"
-                    "Just react and keep it moving."
-                )
-            }
-        ]
-        
-        # Add recent context (last 8 messages for speed)
-        messages.extend(conversation_history[-8:])
+        messages = await run_in_threadpool(open_turn, session_id, user_message, SYSTEM_PROMPT, request.text)
         
-        print(f"💬 User: {request.text}")
+        tracer.record(turn_id, "prompt_build", prompt_start, now_us(), messages=len(messages))
+        print(f"💬 User: {request.text} [{budget.kind}, {budget.max_tokens} tokens]")
         
         # Send to Ollama with DYNAMIC response settings
-        response = ollama.chat(
-            model=OLLAMA_MODEL,
-            messages=messages,
-            options={
-                "temperature": 0.7,      # Focused but natural
-                "num_predict": 35,       # Shorter max (dynamic: 5-35 tokens)
-                "top_p": 0.85,
-                "top_k": 30,
-                "repeat_penalty": 1.3,
-                "stop": ["\n\n"],        # Stop at double newline only
-            }
-        )
+        options = {
+            "temperature": 0.7,      # Focused but natural
+            "num_predict": budget.max_tokens,  # Per-turn budget (8-TURN_MAX_TOKENS tokens)
+            "top_p": 0.85,
+            "top_k": 30,
+            "repeat_penalty": 1.3,
+            "stop": budget.stop,
+        }
+        model = router.choose(budget)
+        start = now_us()
+        with tracer.span(turn_id, "generation"):
+            try:
+                response = await run_in_threadpool(
+                    flights.do,
+                    flight_key(model, messages, options),
+                    lambda: recorder.completion(
+                        messages,
+                        lambda: ollama.chat(model=model, messages=messages, keep_alive=OLLAMA_KEEP_ALIVE, options=options),
+                        lambda reply: reply['message']['content']
+                    )
+                )
+            except Exception:
+                router.failed(model)
+                raise
+        # The stream path measures in generate(); this is the same latency
+        # for clients that only use /api/chat
+        router.observe_reply(model, (now_us() - start) / 1e6, response.get('eval_count'))
         
         ai_text = response['message']['content'].strip()
         
@@ -187,14 +633,11 @@ async def chat(request: ChatRequest):
         
         # Add to history
         assistant_message = {"role": "assistant", "content": ai_text}
-        conversation_history.append(assistant_message)
+        await run_in_threadpool(remember, session_id, assistant_message)
         
         print(f"🤖 AI: {ai_text}")
         
-        return ChatResponse(
-            response=ai_text,
-            history=conversation_history
-        )
+        return chat_response(session_id, ai_text, request.history_version)
     
     except Exception as e:
         print(f"❌ Error: {e}")
@@ -204,66 +647,111 @@ async def chat(request: ChatRequest):
                 detail="Cannot connect to Ollama. Make sure it's running: ollama serve"
             )
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        ticket.release()
 
 
 @app.post("/api/stream_chat")
-async def stream_chat(request: ChatRequest):
+async def stream_chat(request: ChatRequest, http_request: Request):
     """
     Streaming chat for even lower latency
     Tokens arrive as they're generated
     """
-    global conversation_history
+    session_id = request.session_id or DEFAULT_SESSION
+    recorder.request(session_id, "POST", "/api/stream_chat", request.model_dump(exclude={"history"}, exclude_none=True))
+    turn_id = turn_id_for(request, http_request)
+    if filter_echo(request, http_request):
+        return StreamingResponse(echo_stream(), media_type="text/event-stream", headers={TURN_HEADER: turn_id})
+    shed_if_overloaded(session_id)
+    with tracer.span(turn_id, "admission"):
+        ticket = await admission.acquire(client_key(request.session_id, http_request), turn_priority(request.text))
+    keepalive.touch()
+    budget = degrade.budget(classify_turn(request.text, TURN_MAX_TOKENS))
     
     try:
+        prompt_start = now_us()
         user_message = {"role": "user", "content": request.text}
-        conversation_history.append(user_message)
-        
-        if len(conversation_history) > MAX_HISTORY * 2:
-            conversation_history = conversation_history[-MAX_HISTORY * 2:]
+        messages = await run_in_threadpool(open_turn, session_id, user_message, SYSTEM_PROMPT, request.text)
         
-        messages = [
-            {
-                "role": "system",
-                "content": (
-                    "You're a chill person chatting. Keep it real and short:\n"
-                    "- Simple stuff: 3-5 words (\"cool\", \"nice\", \"I feel you\")\n"
-                    "- Normal chat: 1 sentence max\n"
-                    "- Deep stuff: 2 sentences max\n\n"
-                    "Talk like texting: yeah, nah, totally, I get it, fair enough.\n"
-                    "DON'T ask questions back. DON'T be philosophical. DON'T explain.\n"
-                    "Just react and keep it moving."
-                )
-            }
-        ]
-        messages.extend(conversation_history[-6:])
-        
-        print(f"💬 User: {request.text}")
+        tracer.record(turn_id, "prompt_build", prompt_start, now_us(), messages=len(messages))
+        print(f"💬 User: {request.text} [{budget.kind}, {budget.max_tokens} tokens]")
         
-        async def generate():
+        # Plain generator: Starlette iterates it in the threadpool, so the
+        # blocking Ollama stream doesn't stall other sessions
+        def generate():
             full_response = ""
+            model = router.choose(budget)
+            filler = pick_filler(session_id, budget)
+            if filler:
+                # Played while the model gets to its first token
+                tracer.record(turn_id, "filler", now_us(), now_us(), text=filler)
+                yield sse({'filler': filler})
+            start = now_us()
+            first_chunk = None
+            last_chunk = None
+            chunks = 0
+            tokens = 0
             
             try:
                 # Stream from Ollama with DYNAMIC response settings
-                stream = ollama.chat(
-                    model=OLLAMA_MODEL,
-                    messages=messages,
-                    stream=True,
-                    options={
-                        "temperature": 0.7,      # Focused but natural
-                        "num_predict": 35,       # Shorter max (dynamic: 5-35 tokens)
-                        "top_p": 0.85,
-                        "top_k": 30,
-                        "repeat_penalty": 1.3,
-                        "stop": ["\n\n"],        # Stop at double newline only
-                    }
+                options = {
+                    "temperature": 0.7,      # Focused but natural
+                    "num_predict": budget.max_tokens,  # Per-turn budget (8-TURN_MAX_TOKENS tokens)
+                    "top_p": 0.85,
+                    "top_k": 30,
+                    "repeat_penalty": 1.3,
+                    "stop": budget.stop,
+                }
+                # Identical concurrent requests share one Ollama stream;
+                # late joiners get the chunks so far replayed
+                stream = flights.stream(
+                    flight_key(model, messages, options),
+                    lambda: recorder.upstream(
+                        messages,
+                        ollama.chat(
+                            model=model,
+                            messages=messages,
+                            keep_alive=OLLAMA_KEEP_ALIVE,
+                            stream=True,
+                            options=options
+                        ),
+                        lambda chunk: chunk['message'].get('content', '') if 'message' in chunk else ''
+                    )
                 )
                 
+                # Close the stream once the reply has enough finished sentences
+                max_sentences = min(budget.max_sentences, MAX_REPLY_SENTENCES) if MAX_REPLY_SENTENCES > 0 else 0
+                stopper = SentenceStopper(max_sentences)
+                
                 for chunk in stream:
+                    if first_chunk is None:
+                        first_chunk = now_us()
+                        tracer.record(turn_id, "upstream_ttft", start, first_chunk, coalesced=not stream.leader, model=model)
+                    last_chunk = now_us()
+                    chunks += 1
+                    if store.is_cancelled(session_id):
+                        # Cancelled from any worker via /api/cancel
+                        print("⏹️ Generation cancelled")
+                        break
                     if 'message' in chunk:
-                        content = chunk['message'].get('content', '')
+                        content = stopper.feed(chunk['message'].get('content', ''))
                         if content:
+                            if not tokens:
+                                tracer.record(turn_id, "think_buffer", first_chunk, now_us())
+                            tokens += 1
                             full_response += content
-                            yield f"data: {json.dumps({'token': content})}\n\n"
+                            yield sse({'token': content})
+                        if stopper.done:
+                            print(f"✂️ Early stop after {stopper.sentences} sentence(s)")
+                            break
+                stream.close()
+                tracer.record(turn_id, "generation", start, now_us(), tokens=tokens, early_stop=stopper.done)
+                if first_chunk is not None and stream.leader:
+                    router.observe(model, (first_chunk - start) / 1e6, chunks, (last_chunk - first_chunk) / 1e6)
+                content = stopper.flush()
+                if content:
+                    full_response += content
+                    yield sse({'token': content})
                 
                 # Clean up response
                 import re
@@ -282,19 +770,29 @@ async def stream_chat(request: ChatRequest):
                 
                 # Save to history
                 assistant_message = {"role": "assistant", "content": full_response}
-                conversation_history.append(assistant_message)
+                remember(session_id, assistant_message)
                 
                 print(f"🤖 AI: {full_response}")
                 
-                yield f"data: {json.dumps({'done': True, 'full_text': full_response})}\n\n"
+                done = {'done': True, 'full_text': full_response}
+                if request.history_version is not None:
+                    done.update(history_delta(session_id, request.history_version))
+                yield sse(done)
                 
             except Exception as e:
                 print(f"❌ Stream error: {e}")
-                yield f"data: {json.dumps({'error': str(e)})}\n\n"
+                router.failed(model)
+                yield sse({'error': str(e)})
         
-        return StreamingResponse(generate(), media_type="text/event-stream")
+        return StreamingResponse(
+            release_when_done(generate(), ticket),
+            media_type="text/event-stream",
+            headers={TURN_HEADER: turn_id},
+            background=BackgroundTask(ticket.release)
+        )
     
     except Exception as e:
+        ticket.release()
         print(f"❌ Stream error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -304,48 +802,254 @@ async def text_to_speech(request: TTSRequest):
     """
     Fast TTS for real-time response
     """
+    recorder.request(None, "POST", "/api/tts", request.model_dump(exclude_none=True))
     try:
         text = request.text
         
         if not text:
             raise HTTPException(status_code=400, detail="No text provided")
         
-        import pyttsx3
-        engine = pyttsx3.init()
-        
-        # Optimize for natural speech
-        engine.setProperty('rate', 160)  # Slightly faster for natural flow
-        engine.setProperty('volume', 1.0)
-        
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as temp_audio:
-            engine.save_to_file(text, temp_audio.name)
-            engine.runAndWait()
-            temp_path = temp_audio.name
-        
-        with open(temp_path, 'rb') as f:
-            audio_data = f.read()
-        
-        os.unlink(temp_path)
+        try:
+            engine = await run_in_threadpool(get_engine, request.engine or TTS_ENGINE)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        with tracer.span(request.turn_id, "tts", engine=engine.name, chars=len(text)):
+            filler = filler_bank.clip(engine.name, text)
+            if filler is not None:
+                audio_data = await run_in_threadpool(float_to_wav, filler, engine.sample_rate)
+            elif degrade.tier.cached_audio:
+                chunks = [chunk async for chunk in tts_chunks(engine, text)]
+                audio_data = await run_in_threadpool(float_to_wav, np.concatenate(chunks), engine.sample_rate)
+            else:
+                with tts_in_flight.track():
+                    audio_data = await run_in_threadpool(engine.synthesize_wav, text)
         
         return StreamingResponse(io.BytesIO(audio_data), media_type="audio/wav")
     
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ TTS error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.websocket("/ws/tts")
+async def tts_socket(websocket: WebSocket):
+    """
+    Streaming TTS - send {"text": ..., "codec": "pcm16" | "opus", "engine": ..., "turn_id": ...}
+    and get a JSON "start", binary audio frames and a JSON "end" back. The
+    client can start playing on the first frame. One socket serves many
+    utterances.
+
+    {"type": "filler", "text": <user's words>, ...} at turn start plays a
+    filler clip if the reply is expected to be slow to start, or answers
+    with just {"type": "end", "bytes": 0}.
+    """
+    await websocket.accept()
+    socket_id = recorder.socket()
+    try:
+        while True:
+            request = await websocket.receive_json()
+            recorder.ws(socket_id, request.get("session_id"), "/ws/tts", request)
+            text = request.get("text", "")
+            if not text:
+                await websocket.send_json({"type": "error", "message": "No text provided"})
+                continue
+            try:
+                engine = await run_in_threadpool(get_engine, request.get("engine") or TTS_ENGINE)
+            except ValueError as e:
+                await websocket.send_json({"type": "error", "message": str(e)})
+                continue
+            session_id = request.get("session_id") or DEFAULT_SESSION
+            turn_id = request.get("turn_id")
+            if request.get("type") == "filler":
+                filler_bank.warm_in_background(engine)
+                text = pick_filler(session_id, degrade.budget(classify_turn(text, TURN_MAX_TOKENS)), engine.name)
+                if not text:
+                    await websocket.send_json({"type": "end", "bytes": 0})
+                    continue
+                tracer.record(turn_id, "filler", now_us(), now_us(), text=text)
+            # Playback starts with the first frame - the user hears it from now on
+            echo_filter.speaking(client_key(request.get("session_id"), websocket), text)
+            with tracer.span(turn_id, "tts", engine=engine.name, chars=len(text)):
+                chunks = tracer.mark_first(turn_id, "tts_first_audio", tts_chunks(engine, text))
+                await send_audio(websocket, chunks, request.get("codec", "pcm16"), encoder_pool, engine.sample_rate)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"❌ TTS socket error: {e}")
+        await websocket.close(code=1011)
+    finally:
+        recorder.ws(socket_id, None, "/ws/tts", close=True)
+
+
+@app.websocket("/ws/audio")
+async def audio_socket(websocket: WebSocket):
+    """
+    Streaming STT - send {"type": "start", "sample_rate": 16000} and wait for
+    {"type": "ready", "audio_codecs": [...]}, then binary mic frames in one of
+    those codecs (PCM16 always works), then {"type": "stop"} when the utterance
+    ends. Words come back as {"type": "words"} while the user is talking and
+    the whole utterance as {"type": "final"} after each stop. Both carry
+    "echo": true when the words are only the AI's own voice.
+    """
+    await websocket.accept()
+    socket_id = recorder.socket()
+    try:
+        start = await websocket.receive_json()
+        rate = int(start.get("sample_rate", TRANSPORT_RATE))
+        session_id = start.get("session_id") or DEFAULT_SESSION
+        echo_key = client_key(start.get("session_id"), websocket)
+        recorder.ws(socket_id, session_id, "/ws/audio", start)
+        if not degrade.admit_session(session_id):
+            await websocket.send_json({"type": "error", "message": "Server overloaded, try again shortly"})
+            await websocket.close(code=1013)
+            return
+        stt_model = STT_FALLBACK_MODEL if degrade.tier.small_stt else STT_MODEL
+        model = await run_in_threadpool(stt_stream.load_model, stt_model)
+    except WebSocketDisconnect:
+        return
+    except Exception as e:
+        print(f"❌ STT load error: {e}")
+        await websocket.send_json({"type": "error", "message": f"Speech recognition unavailable: {e}"})
+        await websocket.close(code=1011)
+        return
+
+    decoder = FrameDecoder(rate)
+    transcriber = stt_stream.StreamingTranscriber(model, samplerate=TRANSPORT_RATE)
+    decode_failed = False
+    try:
+        await websocket.send_json({"type": "ready", "audio_codecs": available_codecs()})
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes") is not None:
+                recorder.ws(socket_id, session_id, "/ws/audio", data=message["bytes"])
+                # Decoding one 20 ms frame is cheap enough to do inline
+                try:
+                    audio, _ = decoder.decode(message["bytes"])
+                except Exception as e:
+                    # A bad frame (or a codec we can't decode) drops the frame, not the socket
+                    if not decode_failed:
+                        print(f"❌ Audio decode error: {e}")
+                        await websocket.send_json({"type": "error", "message": f"Could not decode audio: {e}"})
+                        decode_failed = True
+                    continue
+                transcriber.write(resample(audio, rate, TRANSPORT_RATE))
+                if transcriber.ring.available >= transcriber.window_size:
+                    words = await run_in_threadpool(transcriber.process)
+                    if words:
+                        verdict = echo_filter.classify(echo_key, " ".join(words))
+                        await websocket.send_json({"type": "words", "words": words, "echo": verdict.kind == ECHO})
+            elif json.loads(message.get("text") or "{}").get("type") == "stop":
+                recorder.ws(socket_id, session_id, "/ws/audio", {"type": "stop"})
+                words = await run_in_threadpool(transcriber.finish)
+                verdict = echo_filter.classify(echo_key, transcriber.stitcher.text)
+                await websocket.send_json({
+                    "type": "final", "words": words, "text": verdict.text,
+                    "echo": verdict.kind == ECHO, "kind": verdict.kind,
+                })
+                transcriber.stitcher.reset()
+                transcriber.ring.reset()
+                decode_failed = False
+    except WebSocketDisconnect:
+        pass
+    finally:
+        recorder.ws(socket_id, session_id, "/ws/audio", close=True)
+
+
+@app.get("/api/metrics")
+async def metrics():
+    """Load and degradation state - tier, pressure, signal readings, transitions"""
+    return {
+        "degradation": degrade.stats(),
+        "admission": admission.stats(),
+        "single_flight": flights.stats(),
+        "router": router.stats(),
+        "tts_in_flight": tts_in_flight.value,
+        "clip_cache": clip_cache.stats(),
+        "fillers": filler_bank.stats(),
+        "memory": memory.stats(),
+        "context": context.stats(),
+        "runtime": runtime_profile.stats(),
+        "recorder": recorder.stats(),
+    }
+
+
+@app.get("/api/traces")
+async def get_traces(format: str = "json", limit: int = 50, turn_id: Optional[str] = None):
+    """
+    Recent per-turn traces. format=chrome gives Chrome trace JSON - save it
+    and open in chrome://tracing or ui.perfetto.dev
+    """
+    limit = max(1, min(limit, 500))
+    if format == "chrome":
+        return tracer.chrome_trace(limit, turn_id)
+    return {"traces": tracer.traces(limit, turn_id)}
+
+
+@app.post("/api/traces")
+async def post_client_spans(request: ClientSpans):
+    """Spans measured in the browser (speech recognition, queue wait, playback)"""
+    for span in request.spans[:100]:
+        start_us = int(span.start_ms * 1000)
+        tracer.add(request.turn_id, span.name, start_us, start_us + int(span.duration_ms * 1000),
+                   "client", dict(span.attrs or {}))
+    return {"status": "success"}
+
+
+@app.post("/api/echo/speaking")
+async def echo_speaking(request: EchoRequest, http_request: Request):
+    """Tell the echo filter what the client is playing (for browser-side TTS)"""
+    recorder.request(request.session_id, "POST", "/api/echo/speaking", request.model_dump(exclude_none=True))
+    echo_filter.speaking(client_key(request.session_id, http_request), request.text, request.duration)
+    return {"status": "success"}
+
+
+@app.post("/api/echo/stopped")
+async def echo_stopped(request: EchoRequest, http_request: Request):
+    """Playback was cut off early"""
+    recorder.request(request.session_id, "POST", "/api/echo/stopped", request.model_dump(exclude_none=True))
+    echo_filter.stopped(client_key(request.session_id, http_request))
+    return {"status": "success"}
+
+
+@app.post("/api/echo/check")
+async def echo_check(request: EchoRequest, http_request: Request):
+    """Classify a transcript as echo, barge_in or user without generating anything"""
+    verdict = echo_filter.classify(client_key(request.session_id, http_request), request.text)
+    return {"kind": verdict.kind, "text": verdict.text, "echo_ratio": verdict.echo_ratio}
+
+
+@app.post("/api/cancel")
+async def cancel_generation(request: CancelRequest):
+    """Stop the running generation for a session (seen by every worker)"""
+    recorder.request(request.session_id, "POST", "/api/cancel", request.model_dump(exclude_none=True))
+    store.set_cancel(request.session_id or DEFAULT_SESSION)
+    return {"status": "success", "message": "Generation cancelled"}
+
+
 @app.delete("/api/history")
-async def clear_history():
+async def clear_history(session_id: str = DEFAULT_SESSION):
     """Clear conversation history"""
-    global conversation_history
-    conversation_history = []
-    return {"status": "success", "message": "History cleared"}
+    recorder.request(session_id, "DELETE", "/api/history", params={"session_id": session_id})
+    store.clear_history(session_id)
+    transcript_log.clear(session_id)
+    memory.clear(session_id)
+    # The clear bumps the version - clients adopt it so their next delta has the right base
+    return {"status": "success", "message": "History cleared", "history_version": store.history_version(session_id)}
 
 
 @app.get("/api/history")
-async def get_history():
-    """Get conversation history"""
-    return {"history": conversation_history}
+async def get_history(session_id: str = DEFAULT_SESSION, limit: int = MAX_HISTORY * 2, before: Optional[int] = None):
+    """
+    Get conversation history, one page at a time (newest page first)
+    Pass `next_before` from the response as `before` to load older messages
+    """
+    limit = max(1, min(limit, 500))
+    history, next_before = await run_in_threadpool(transcript_log.page, session_id, limit, before)
+    return {"history": history, "next_before": next_before}
 
 
 if __name__ == "__main__":
@@ -361,7 +1065,17 @@ if __name__ == "__main__":
     print()
     print(f"🤖 Model: {OLLAMA_MODEL}")
     print(f"🔧 Backend: Ollama (local)")
+    print(f"👷 Workers: {WORKERS} (session store: {SESSION_STORE})")
+    if WORKERS > 1:
+        # Memory follows the shared transcript log; these two don't
+        print("⚠️ Echo filter and degradation tiers are per worker: each worker sheds its own load, and a")
+        print("   session's TTS / echo reports and its mic or chat turns are only matched on the same worker")
     print()
     print("=" * 70)
     print()
-    uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
+    if WORKERS > 1:
+        # Workers need an import string; state is shared through the session store
+        uvicorn.run("backend_realtime_ollama:app", host="0.0.0.0", port=8000, log_level="info", workers=WORKERS,
+                    **runtime_profile.server_options())
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info", **runtime_profile.server_options())
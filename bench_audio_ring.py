@@ -0,0 +1,115 @@
+"""
+Benchmark: np.concatenate buffering (old tes.py) vs AudioRingBuffer
+
+Feeds N concurrent sessions with mic-sized callback blocks and cuts
+3 s windows with 1 s overlap, exactly like the STT loop, minus Whisper.
+Reports time per callback block and Python-side memory (tracemalloc).
+The ring's memory is fixed up front (2 x capacity float32 plus one
+window for normalising), so it costs more than concatenate at rest in
+exchange for no allocation per block.
+
+    python bench_audio_ring.py
+    python bench_audio_ring.py --sessions 200 --seconds 30 --block 512
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from audio_ring import AudioRingBuffer
+
+SAMPLERATE = 16000
+WINDOW = 3 * SAMPLERATE
+OVERLAP = 1 * SAMPLERATE
+
+
+class ConcatSession:
+    """The old tes.py path: indata.copy() + concatenate + re-slice + normalise"""
+
+    def __init__(self):
+        self.buffer = np.zeros(0, dtype=np.float32)
+        self.windows = 0
+
+    def feed(self, indata):
+        data = indata.copy()
+        self.buffer = np.concatenate((self.buffer, data[:, 0]))
+        while len(self.buffer) >= WINDOW:
+            segment = self.buffer[:WINDOW]
+            self.buffer = self.buffer[WINDOW - OVERLAP:]
+            segment = segment / (np.max(np.abs(segment)) + 1e-9)
+            self.windows += 1
+
+
+class RingSession:
+    """The new path: write into the ring, normalise into a reused buffer"""
+
+    def __init__(self):
+        # Sized like StreamingTranscriber's default: one window plus 0.25 s
+        self.ring = AudioRingBuffer(WINDOW + SAMPLERATE // 4)
+        self.segment = np.empty(WINDOW, dtype=np.float32)
+        self.windows = 0
+
+    def feed(self, indata):
+        self.ring.write(indata[:, 0])
+        while True:
+            window = self.ring.window(WINDOW)
+            if window is None:
+                break
+            peak = max(float(window.max()), -float(window.min()))
+            np.multiply(window, 1.0 / (peak + 1e-9), out=self.segment)
+            self.ring.advance(WINDOW - OVERLAP)
+            self.windows += 1
+
+
+def run(session_cls, sessions, seconds, block):
+    rng = np.random.default_rng(0)
+    blocks = [rng.standard_normal((block, 1)).astype(np.float32) * 0.1 for _ in range(64)]
+    steps = seconds * SAMPLERATE // block
+
+    def feed_all(pool):
+        for step in range(steps):
+            indata = blocks[step % len(blocks)]
+            for session in pool:
+                session.feed(indata)
+
+    # Timing pass (tracemalloc hooks every allocation, so keep it off here)
+    pool = [session_cls() for _ in range(sessions)]
+    start = time.perf_counter()
+    feed_all(pool)
+    elapsed = time.perf_counter() - start
+    windows = sum(s.windows for s in pool)
+
+    # Memory pass - `current` is measured with the sessions still alive
+    tracemalloc.start()
+    pool = [session_cls() for _ in range(sessions)]
+    feed_all(pool)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    per_block_us = elapsed / (steps * sessions) * 1e6
+    return per_block_us, current, peak, windows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--seconds", type=int, default=30, help="audio per session")
+    parser.add_argument("--block", type=int, default=512, help="frames per mic callback")
+    args = parser.parse_args()
+
+    print(f"{args.sessions} sessions x {args.seconds}s audio, {args.block}-frame callbacks, "
+          f"{WINDOW // SAMPLERATE}s windows / {OVERLAP // SAMPLERATE}s overlap\n")
+    results = {}
+    for name, cls in (("concatenate", ConcatSession), ("ring buffer", RingSession)):
+        per_block_us, current, peak, windows = run(cls, args.sessions, args.seconds, args.block)
+        results[name] = per_block_us
+        print(f"{name:<12} {per_block_us:7.2f} us/block   windows {windows:6d}   "
+              f"mem now {current / 1e6:7.2f} MB   peak {peak / 1e6:7.2f} MB   "
+              f"per session {current / args.sessions / 1e3:7.1f} KB")
+    print(f"\nSpeed-up per callback block: {results['concatenate'] / results['ring buffer']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark: in-process GGUF backend with continuous batching
+
+Runs N sessions at once (default 1, 4, 16). Each session streams one reply
+to a different prompt. For each N it reports
+  tok/s       aggregate generated tokens per second, all sessions together
+  per-session tokens per second one session sees
+  TTFT        time until a session's first text
+  avg batch   tokens per llama_decode call (decode + prefill)
+  speedup     aggregate tok/s vs the 1-session run
+
+With batching the aggregate should grow with N while per-session speed
+drops only a little; without it, aggregate would stay flat and TTFT would
+grow with N.
+
+    pip install llama-cpp-python
+    python bench_gguf_batching.py --model qwen3-0.6b-q8_0.gguf
+    python bench_gguf_batching.py --model model.gguf --sessions 1,4,16,32 --max-tokens 96
+"""
+
+import argparse
+import os
+import statistics
+import threading
+import time
+
+PROMPTS = [
+    "what do you think about rainy days?",
+    "I just got back from a long walk by the river",
+    "can you explain why coffee keeps me awake?",
+    "I'm thinking about learning to cook this year",
+    "what's a good book for a long train ride?",
+    "my cat keeps knocking things off the table",
+    "should I start running in the mornings?",
+    "tell me something interesting about the ocean",
+]
+SYSTEM = "You're a warm, friendly person chatting casually. Keep it to two sentences."
+
+
+def run_sessions(engine, sessions, max_tokens):
+    ttft = [None] * sessions
+    done = [0.0] * sessions
+    errors = []
+    before = engine.generated_tokens
+    start = time.perf_counter()
+
+    def session(i):
+        messages = [{"role": "system", "content": SYSTEM},
+                    {"role": "user", "content": PROMPTS[i % len(PROMPTS)]}]
+        try:
+            for _ in engine.stream(messages, max_tokens=max_tokens, temperature=0.7, seed=i):
+                if ttft[i] is None:
+                    ttft[i] = time.perf_counter() - start
+        except Exception as e:
+            errors.append(e)
+        done[i] = time.perf_counter() - start
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+    tokens = engine.generated_tokens - before
+    return tokens, wall, [t * 1000 for t in ttft if t is not None], done, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=os.environ.get("GGUF_MODEL", "qwen3-0.6b-q8_0.gguf"))
+    parser.add_argument("--sessions", default="1,4,16", help="comma-separated concurrency levels")
+    parser.add_argument("--max-tokens", type=int, default=64)
+    parser.add_argument("--ctx", type=int, default=1024, help="context per session")
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+    levels = [int(s) for s in args.sessions.split(",")]
+
+    from gguf_backend import GGUFEngine
+
+    engine = GGUFEngine(args.model, n_ctx=args.ctx, n_parallel=max(levels), n_threads=args.threads)
+    run_sessions(engine, 1, 4)    # warm up
+
+    print(f"\n{args.max_tokens} max tokens per reply\n")
+    print(f"{'sessions':>8} {'tok/s':>8} {'per-session':>12} {'TTFT p50':>9} {'TTFT max':>9} "
+          f"{'avg batch':>10} {'speedup':>8}")
+    base = None
+    for sessions in levels:
+        steps, batched = engine.steps, engine.batched_tokens
+        tokens, wall, ttft, done, errors = run_sessions(engine, sessions, args.max_tokens)
+        if errors:
+            print(f"{sessions:8d} failed: {errors[0]}")
+            continue
+        throughput = tokens / wall
+        per_session = statistics.mean((tokens / sessions) / d for d in done if d > 0)
+        avg_batch = (engine.batched_tokens - batched) / max(1, engine.steps - steps)
+        base = base or throughput
+        print(f"{sessions:8d} {throughput:8.1f} {per_session:12.1f} {statistics.median(ttft):9.0f} "
+              f"{max(ttft):9.0f} {avg_batch:10.1f} {throughput / base:7.2f}x")
+    print("\nTTFT in ms. Speedup is aggregate tok/s relative to one session.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+Benchmark: RUNTIME_PROFILE=fast vs the default runtime
+
+1. Micro: the per-token work in isolation
+   - parse an upstream chunk and encode the SSE frame, stdlib json vs orjson
+   - GC pauses during a simulated token loop with a large long-lived heap
+     (standing in for loaded modules and models), default thresholds vs
+     GC_THRESHOLD + gc.freeze()
+2. End to end: mock_llm_server.py and the backend under uvicorn, run twice -
+   default (asyncio loop, h11) and fast (RUNTIME_PROFILE=fast, plus uvloop
+   and httptools when installed) - with concurrent /api/stream_chat sessions
+   and no think time (load_test.one_turn).
+
+    pip install uvloop httptools orjson
+    python bench_runtime_profile.py
+    python bench_runtime_profile.py --sessions 200 --seconds 20 --tps 200
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from load_test import TURNS, StageStats, one_turn
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CHUNK = json.dumps({
+    "id": "chatcmpl-1", "object": "chat.completion.chunk", "created": 0, "model": "mock",
+    "choices": [{"index": 0, "delta": {"content": " word"}, "finish_reason": None}],
+})
+STREAMS = 50
+TURN_TOKENS = 150
+
+
+def installed(module):
+    try:
+        __import__(module)
+        return True
+    except ImportError:
+        return False
+
+
+def bench_json(tokens):
+    """Return {name: microseconds per token} for parse chunk + encode frame"""
+    codecs = {"stdlib json": (json.loads, json.dumps)}
+    if orjson is not None:
+        codecs["orjson"] = (orjson.loads, lambda obj: orjson.dumps(obj).decode("utf-8"))
+    results = {}
+    for name, (loads, dumps) in codecs.items():
+        start = time.perf_counter()
+        for _ in range(tokens):
+            token = loads(CHUNK)["choices"][0]["delta"]["content"]
+            frame = f"data: {dumps({'token': token})}\n\n"
+        results[name] = (time.perf_counter() - start) / tokens * 1e6
+    del frame
+    return results
+
+
+def bench_gc(tokens, heap_objects, threshold, freeze):
+    """Token loop with GC pauses timed via gc.callbacks"""
+    pauses = []
+    started = [0.0]
+
+    def callback(phase, info):
+        if phase == "start":
+            started[0] = time.perf_counter()
+        else:
+            pauses.append((time.perf_counter() - started[0]) * 1000)
+
+    gc.collect()
+    heap = [{"id": i, "name": f"object-{i}", "refs": [i]} for i in range(heap_objects)]
+    default = gc.get_threshold()
+    gc.set_threshold(*threshold)
+    if freeze:
+        gc.collect()
+        gc.freeze()
+    gc.callbacks.append(callback)
+    try:
+        # STREAMS interleaved turns, each holding its parsed chunks until done
+        start = time.perf_counter()
+        turns = [[] for _ in range(STREAMS)]
+        for i in range(tokens):
+            turn = turns[i % STREAMS]
+            turn.append(json.loads(CHUNK)["choices"])
+            if len(turn) == TURN_TOKENS:
+                turn.clear()
+        elapsed = time.perf_counter() - start
+    finally:
+        gc.callbacks.remove(callback)
+        gc.set_threshold(*default)
+        gc.unfreeze()
+        del heap
+        gc.collect()
+    return {
+        "elapsed_ms": elapsed * 1000,
+        "collections": len(pauses),
+        "gc_ms": sum(pauses),
+        "max_pause_ms": max(pauses, default=0.0),
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(proc, port, timeout=60.0):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"process exited with code {proc.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.05):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"port {port} did not accept connections in time")
+
+
+async def drive(url, sessions, seconds, seed):
+    """Closed-loop load with no think time; returns StageStats"""
+    stats = StageStats()
+    limits = httpx.Limits(max_connections=sessions, max_keepalive_connections=sessions)
+    async with httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(60.0)) as client:
+        # One warm-up turn so first-request costs aren't measured
+        await one_turn(client, url, "warmup", TURNS[0], StageStats())
+        stop_at = time.perf_counter() + seconds
+
+        async def loop(i):
+            rng = random.Random(seed + i)
+            while time.perf_counter() < stop_at:
+                await one_turn(client, url, f"bench-{i}", rng.choice(TURNS), stats)
+
+        await asyncio.gather(*(loop(i) for i in range(sessions)))
+    return stats
+
+
+def run_backend(args, mock_url, fast):
+    port = free_port()
+    env = dict(os.environ)
+    env.update({
+        "LM_STUDIO_BASE": mock_url,
+        "OLLAMA_HOST": mock_url,
+        "SESSION_STORE": "memory://",
+        "SESSION_RATE": "10000",
+        "SESSION_BURST": "10000",
+        "ADMISSION_MAX_CONCURRENT": str(args.sessions),
+        "ADMISSION_MAX_QUEUE": str(args.sessions * 2),
+        "LOOP_LAG_BUDGET_MS": "100000",
+        "KEEPALIVE_INTERVAL": "0",
+        "FILLER_TTFT_MS": "0",
+        "MEMORY_EMBED_MODEL": "hashing",
+        "RUNTIME_PROFILE": "fast" if fast else "",
+    })
+    cmd = [sys.executable, "-m", "uvicorn", f"{args.module}:app", "--port", str(port), "--log-level", "warning"]
+    if fast:
+        cmd += ["--loop", "uvloop" if installed("uvloop") else "asyncio",
+                "--http", "httptools" if installed("httptools") else "h11"]
+    else:
+        cmd += ["--loop", "asyncio", "--http", "h11"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env["TRANSCRIPT_LOG"] = os.path.join(tmp, "transcripts.db")
+        proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for_port(proc, port)
+            url = f"http://127.0.0.1:{port}/api/stream_chat"
+            return asyncio.run(drive(url, args.sessions, args.seconds, args.seed))
+        finally:
+            proc.terminate()
+            proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="backend_realtime")
+    parser.add_argument("--sessions", type=int, default=100, help="concurrent sessions (end to end)")
+    parser.add_argument("--seconds", type=float, default=10.0, help="load duration per run")
+    parser.add_argument("--ttft-ms", type=float, default=20.0, help="mock time to first token")
+    parser.add_argument("--tps", type=float, default=300.0, help="mock tokens per second per stream")
+    parser.add_argument("--tokens", type=int, default=200000, help="tokens in the micro benchmarks")
+    parser.add_argument("--heap", type=int, default=500000, help="long-lived objects in the GC benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--micro-only", action="store_true")
+    args = parser.parse_args()
+
+    print("Micro: parse chunk + encode SSE frame")
+    for name, us in bench_json(args.tokens).items():
+        print(f"  {name:12s} {us:6.2f} µs/token")
+    if orjson is None:
+        print("  (orjson not installed)")
+
+    print(f"\nMicro: GC during {args.tokens} tokens with {args.heap} long-lived objects")
+    print(f"  {'':18s} {'loop ms':>8} {'GCs':>6} {'GC ms':>8} {'max pause':>10}")
+    threshold = tuple(int(n) for n in os.environ.get("GC_THRESHOLD", "50000,20,100").split(","))
+    for name, thr, freeze in (("default", gc.get_threshold(), False), ("tuned + freeze", threshold, True)):
+        r = bench_gc(args.tokens, args.heap, thr, freeze)
+        print(f"  {name:18s} {r['elapsed_ms']:8.0f} {r['collections']:6d} {r['gc_ms']:8.1f} "
+              f"{r['max_pause_ms']:8.2f} ms")
+
+    if args.micro_only:
+        return
+
+    mock_port = free_port()
+    mock = subprocess.Popen(
+        [sys.executable, "mock_llm_server.py", "--port", str(mock_port), "--ttft-ms", str(args.ttft_ms),
+         "--tps", str(args.tps), "--jitter", "0", "--parallel", str(args.sessions * 2), "--seed", str(args.seed)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_port(mock, mock_port)
+        mock_url = f"http://127.0.0.1:{mock_port}"
+        print(f"\nEnd to end: {args.module}, {args.sessions} sessions, {args.seconds:.0f}s, "
+              f"mock {args.ttft_ms:.0f} ms TTFT / {args.tps:.0f} tok/s")
+        print(f"  {'':8s} {'turns/s':>8} {'TTFT p50':>9} {'TTFT p99':>9} {'turn p99':>9} {'failed':>7}")
+        rows = {}
+        for name, fast in (("default", False), ("fast", True)):
+            stats = run_backend(args, mock_url, fast)
+            rows[name] = (
+                stats.completed / args.seconds,
+                stats.percentile(stats.ttft, 0.5),
+                stats.percentile(stats.ttft, 0.99),
+                stats.percentile(stats.total, 0.99),
+            )
+            print(f"  {name:8s} {rows[name][0]:8.1f} {rows[name][1]:9.0f} {rows[name][2]:9.0f} "
+                  f"{rows[name][3]:9.0f} {stats.failed + stats.shed:7d}")
+    finally:
+        mock.terminate()
+        mock.wait()
+
+    base, fast = rows["default"], rows["fast"]
+    print(f"\nfast vs default: {(fast[0] / base[0] - 1) * 100:+.0f}% turns/s, "
+          f"TTFT p99 {fast[2] - base[2]:+.0f} ms, turn p99 {fast[3] - base[3]:+.0f} ms")
+    missing = [m for m in ("uvloop", "httptools", "orjson") if not installed(m)]
+    if missing:
+        print(f"(not installed: {', '.join(missing)} - the fast run used the defaults for those)")
+
+
+if __name__ == "__main__":
+    main()
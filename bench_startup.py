@@ -0,0 +1,99 @@
+"""
+Benchmark: backend cold start, FAST_START=1 (lazy) vs FAST_START=0 (eager)
+
+1. Import-time profile via `python -X importtime` - total import time and
+   the heaviest top-level modules.
+2. Time until the server accepts TCP connections (uvicorn in a subprocess).
+
+    python bench_startup.py
+    python bench_startup.py --module backend_realtime_ollama --runs 5
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def import_profile(module, env):
+    """Return (total_ms, [(cumulative_ms, name), ...]) for top-level imports"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    total_us = 0
+    top_level = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        total_us += int(self_us)
+        # Top-level imports have exactly one space of indentation
+        if name.startswith(" ") and not name.startswith("  "):
+            top_level.append((int(cumulative_us) / 1000, name.strip()))
+    top_level.sort(reverse=True)
+    return total_us / 1000, top_level
+
+
+def time_to_accept(module, env, port, timeout=30.0):
+    """Start uvicorn and measure until the port accepts a connection"""
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", f"{module}:app", "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {proc.returncode}")
+            try:
+                with socket.create_connection(("127.0.0.1", port), timeout=0.05):
+                    return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.005)
+        raise RuntimeError("server did not accept connections in time")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="backend_realtime")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--top", type=int, default=8)
+    args = parser.parse_args()
+
+    for mode in ("0", "1"):
+        env = dict(os.environ, FAST_START=mode, TRANSCRIPT_LOG=os.path.join(tempfile.gettempdir(), "bench_startup_transcripts.db"))
+        label = "lazy (FAST_START=1)" if mode == "1" else "eager (FAST_START=0)"
+        print(f"\n=== {args.module} - {label} ===")
+
+        try:
+            totals = []
+            for _ in range(args.runs):
+                total_ms, top_level = import_profile(args.module, env)
+                totals.append(total_ms)
+            print(f"Import time: median {statistics.median(totals):.0f} ms over {args.runs} runs")
+            for cumulative_ms, name in top_level[:args.top]:
+                print(f"   {cumulative_ms:8.1f} ms  {name}")
+        except RuntimeError as e:
+            print(f"Import profile failed: {e}")
+            continue
+
+        try:
+            accepts = [time_to_accept(args.module, env, args.port) for _ in range(args.runs)]
+            print(f"Accepting connections after: median {statistics.median(accepts) * 1000:.0f} ms")
+        except RuntimeError as e:
+            print(f"Time-to-accept failed: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Benchmark: streaming STT on recorded WAV files - no microphone needed
+
+Feeds each fixture in stt_fixtures/manifest.json through
+stt_stream.StreamingTranscriber the way /ws/audio does: 20 ms frames are
+written to the ring and a window is transcribed inline whenever one is full,
+then finish() runs at the end of the file (the client's "stop"). Frames are
+paced at --speed x real time (0 = as fast as possible), so a slow config
+falls behind the way it would live.
+
+For every model size x compute type x window/overlap x beam size:
+  RTF        transcription time / audio duration (< 1 = keeps up)
+  finalize   end of speech -> final transcript, including any backlog
+  CPU        process CPU seconds per audio second, per stream (100% = one core)
+  WER        word error rate against the manifest transcripts
+
+The fixtures are not checked in. Record your own (any rate, 16-bit PCM
+WAV, one entry per file in the manifest) or synthesise the manifest's
+sentences with one of the optional TTS engines. Each needs its own
+install (see FIXTURE_ENGINES); without fixtures the benchmark is skipped:
+
+    pip install piper-tts   # plus a voice file in PIPER_MODEL
+    python bench_stt.py --make-fixtures piper
+    python bench_stt.py
+    python bench_stt.py --models tiny,base,small --compute-types int8,float32 \\
+        --windows 3:1,2:0.5,4:1 --streams 4 --speed 1 --json stt.json
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import stt_stream
+from audio_codec import TRANSPORT_RATE, pcm16_to_float, resample
+
+FRAME_MS = 20
+_WORD_RE = re.compile(r"[^\w']+")
+
+# TTS engines that can render the fixtures, and what each one needs
+FIXTURE_ENGINES = {
+    "piper": "pip install piper-tts, and a voice file in PIPER_MODEL",
+    "pyttsx3": "pip install pyttsx3, and a system voice (espeak on Linux)",
+}
+
+
+def load_manifest(path):
+    """[(wav path, reference text)] with paths relative to the manifest"""
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+    root = os.path.dirname(os.path.abspath(path))
+    return [(os.path.join(root, e["audio"]), e["text"]) for e in entries]
+
+
+def read_wav(path):
+    """16-bit PCM WAV -> mono float32 at TRANSPORT_RATE"""
+    with wave.open(path, "rb") as wav:
+        if wav.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit PCM WAV is supported")
+        channels, rate = wav.getnchannels(), wav.getframerate()
+        audio = pcm16_to_float(wav.readframes(wav.getnframes()))
+    if channels > 1:
+        audio = audio.reshape(-1, channels).mean(axis=1)
+    return resample(audio, rate, TRANSPORT_RATE)
+
+
+def make_fixtures(manifest, engine_name):
+    from tts_engines import float_to_wav, get_engine
+
+    engine = get_engine(engine_name)
+    for path, text in manifest:
+        if os.path.exists(path):
+            continue
+        try:
+            audio = engine.synthesize(text)
+        except Exception as e:
+            raise SystemExit(f"{engine_name} could not synthesise fixtures ({e}) - needs {FIXTURE_ENGINES[engine_name]}")
+        # Half a second of silence either side, like a real utterance
+        pad = np.zeros(engine.sample_rate // 2, dtype=np.float32)
+        with open(path, "wb") as f:
+            f.write(float_to_wav(np.concatenate((pad, audio, pad)), engine.sample_rate))
+        print(f"🔊 {os.path.basename(path)} ({len(audio) / engine.sample_rate:.1f}s)")
+
+
+def words(text):
+    return [w for w in (_WORD_RE.sub("", t.lower()) for t in text.split()) if w]
+
+
+def edit_distance(ref, hyp):
+    """Word-level Levenshtein distance"""
+    row = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        prev, row[0] = row[0], i
+        for j, h in enumerate(hyp, 1):
+            prev, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, prev + (r != h))
+    return row[-1]
+
+
+def run_stream(model, audio, window, overlap, beam, speed):
+    """One utterance through a fresh transcriber; returns timings and the text"""
+    transcriber = stt_stream.StreamingTranscriber(
+        model, samplerate=TRANSPORT_RATE, window=window, overlap=overlap, beam_size=beam
+    )
+    frame = TRANSPORT_RATE * FRAME_MS // 1000
+    busy = 0.0
+    start = time.perf_counter()
+    for i in range(0, len(audio), frame):
+        if speed > 0:
+            # Frame i arrives once it has been spoken
+            delay = start + (i + frame) / TRANSPORT_RATE / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        transcriber.write(audio[i:i + frame])
+        if transcriber.ring.available >= transcriber.window_size:
+            t = time.perf_counter()
+            transcriber.process()
+            busy += time.perf_counter() - t
+    end_of_speech = start + len(audio) / TRANSPORT_RATE / speed if speed > 0 else time.perf_counter()
+    t = time.perf_counter()
+    transcriber.finish()
+    done = time.perf_counter()
+    busy += done - t
+    return {
+        "busy_s": busy,
+        "finalize_ms": (done - end_of_speech) * 1000,
+        "text": transcriber.stitcher.text,
+    }
+
+
+def bench_config(model, fixtures, window, overlap, beam, speed, streams):
+    """Every fixture through `streams` concurrent transcribers sharing one model"""
+    results = []
+    lock = threading.Lock()
+
+    def one_stream(stream):
+        for (path, ref), audio in fixtures:
+            r = run_stream(model, audio, window, overlap, beam, speed)
+            r.update(audio_s=len(audio) / TRANSPORT_RATE, ref=ref, fixture=os.path.basename(path), stream=stream)
+            with lock:
+                results.append(r)
+
+    cpu, wall = time.process_time(), time.perf_counter()
+    with ThreadPoolExecutor(streams) as pool:
+        list(pool.map(one_stream, range(streams)))
+    cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+
+    audio_s = sum(r["audio_s"] for r in results)
+    ref_words = sum(len(words(r["ref"])) for r in results)
+    errors = sum(edit_distance(words(r["ref"]), words(r["text"])) for r in results)
+    finalize = sorted(r["finalize_ms"] for r in results)
+    return {
+        "rtf": sum(r["busy_s"] for r in results) / audio_s,
+        "finalize_p50_ms": statistics.median(finalize),
+        "finalize_p95_ms": finalize[min(len(finalize) - 1, int(len(finalize) * 0.95))],
+        "cpu_per_stream": cpu / audio_s,
+        "wer": errors / max(1, ref_words),
+        "wall_s": wall,
+        "transcripts": [{"fixture": r["fixture"], "ref": r["ref"], "hyp": r["text"]}
+                        for r in results if r["stream"] == 0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--manifest", default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                           "stt_fixtures", "manifest.json"))
+    parser.add_argument("--make-fixtures", metavar="ENGINE", choices=list(FIXTURE_ENGINES),
+                        help="synthesise missing WAVs with a TTS engine and exit")
+    parser.add_argument("--models", default="tiny", help="comma-separated Whisper sizes")
+    parser.add_argument("--compute-types", default="int8", help="comma-separated, e.g. int8,int8_float32,float32")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--windows", default="3:1", help="comma-separated window:overlap seconds")
+    parser.add_argument("--beams", default="3", help="comma-separated beam sizes")
+    parser.add_argument("--speed", type=float, default=0.0, help="1 = real-time pacing, 0 = as fast as possible")
+    parser.add_argument("--streams", type=int, default=1, help="concurrent streams sharing one model")
+    parser.add_argument("--json", help="write all results here")
+    parser.add_argument("--show-text", action="store_true", help="print reference vs hypothesis")
+    args = parser.parse_args()
+
+    manifest = load_manifest(args.manifest)
+    if args.make_fixtures:
+        make_fixtures(manifest, args.make_fixtures)
+        return
+    missing = [os.path.basename(path) for path, _ in manifest if not os.path.exists(path)]
+    if missing:
+        print(f"⏭️ STT benchmark skipped: {len(missing)} of {len(manifest)} fixture(s) missing "
+              f"({', '.join(missing[:3])}{'...' if len(missing) > 3 else ''}) in {os.path.dirname(args.manifest)}")
+        print("   Record them, or synthesise them with one of:")
+        for name, needs in FIXTURE_ENGINES.items():
+            print(f"     python bench_stt.py --make-fixtures {name}   ({needs})")
+        return
+    fixtures = [((path, ref), read_wav(path)) for path, ref in manifest]
+    total_audio = sum(len(audio) for _, audio in fixtures) / TRANSPORT_RATE
+    windows = [tuple(float(x) for x in w.split(":")) for w in args.windows.split(",")]
+    pace = f"{args.speed:g}x real time" if args.speed > 0 else "as fast as possible"
+    print(f"{len(fixtures)} fixtures, {total_audio:.1f}s of audio, {args.streams} stream(s), {pace}\n")
+    print(f"{'model':8s} {'compute':13s} {'win/ovl':>8} {'beam':>4} {'load s':>7} {'RTF':>6} "
+          f"{'final p50':>10} {'final p95':>10} {'CPU/stream':>10} {'WER':>6}")
+
+    results = []
+    for size in args.models.split(","):
+        for compute_type in args.compute_types.split(","):
+            t = time.perf_counter()
+            try:
+                model = stt_stream.load_model(size, device=args.device, compute_type=compute_type)
+            except Exception as e:
+                print(f"{size:8s} {compute_type:13s} skipped: {e}")
+                continue
+            load_s = time.perf_counter() - t
+            # Warm-up: the first transcription pays one-off setup costs
+            run_stream(model, fixtures[0][1], *windows[0], int(args.beams.split(",")[0]), 0)
+            for window, overlap in windows:
+                for beam in (int(b) for b in args.beams.split(",")):
+                    r = bench_config(model, fixtures, window, overlap, beam, args.speed, args.streams)
+                    r.update(model=size, compute_type=compute_type, window=window, overlap=overlap,
+                             beam=beam, load_s=load_s, speed=args.speed, streams=args.streams)
+                    results.append(r)
+                    print(f"{size:8s} {compute_type:13s} {f'{window:g}/{overlap:g}':>8} {beam:4d} {load_s:7.1f} "
+                          f"{r['rtf']:6.2f} {r['finalize_p50_ms']:8.0f}ms {r['finalize_p95_ms']:8.0f}ms "
+                          f"{r['cpu_per_stream'] * 100:9.0f}% {r['wer'] * 100:5.1f}%")
+                    if args.show_text:
+                        for t in r["transcripts"]:
+                            print(f"    {t['fixture']}\n      ref: {t['ref']}\n      hyp: {t['hyp']}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n📝 Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark: TTS engines - load time, time-to-first-audio and real-time factor
+
+For each engine and each sentence, measures
+  TTFA  time from the call until the first audio chunk is ready
+  RTF   synthesis time / duration of the audio produced (< 1 = faster than real time)
+
+Engines that can't load here (missing package or voice file) are skipped.
+
+    python bench_tts_engines.py
+    python bench_tts_engines.py --engines piper --piper-model en_US-amy-low.onnx --repeat 5
+"""
+
+import argparse
+import os
+import statistics
+import time
+
+SENTENCES = [
+    "Yeah, totally.",
+    "Honestly I think that's a great idea.",
+    "Oh really? I didn't know that, tell me more about it.",
+    "I guess it depends on the weather, but a walk by the river sounds lovely this time of year. "
+    "We could grab coffee on the way and just take it slow.",
+]
+
+
+def bench_engine(engine, repeat):
+    ttfa, rtf, total = [], [], []
+    for _ in range(repeat):
+        for text in SENTENCES:
+            start = time.perf_counter()
+            first = None
+            samples = 0
+            for chunk in engine.stream(text):
+                if first is None:
+                    first = time.perf_counter() - start
+                samples += len(chunk)
+            elapsed = time.perf_counter() - start
+            duration = samples / engine.sample_rate
+            ttfa.append(first * 1000)
+            total.append(elapsed * 1000)
+            if duration > 0:
+                rtf.append(elapsed / duration)
+    return ttfa, rtf, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engines", default="pyttsx3,piper", help="comma-separated engine names")
+    parser.add_argument("--piper-model", help="Piper .onnx voice (default: PIPER_MODEL env)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    if args.piper_model:
+        os.environ["PIPER_MODEL"] = args.piper_model
+
+    import tts_engines
+
+    print(f"{len(SENTENCES)} sentences x {args.repeat} runs\n")
+    print(f"{'engine':<10} {'load ms':>8} {'TTFA p50':>9} {'TTFA p95':>9} {'total p50':>10} {'RTF mean':>9}")
+    for name in args.engines.split(","):
+        name = name.strip()
+        start = time.perf_counter()
+        try:
+            engine = tts_engines.get_engine(name)
+            engine.synthesize("Warm up.")
+        except Exception as e:
+            print(f"{name:<10} skipped: {e}")
+            continue
+        load_ms = (time.perf_counter() - start) * 1000
+        ttfa, rtf, total = bench_engine(engine, args.repeat)
+        ttfa.sort()
+        print(f"{name:<10} {load_ms:8.0f} {statistics.median(ttfa):9.0f} "
+              f"{ttfa[int(len(ttfa) * 0.95) - 1]:9.0f} {statistics.median(total):10.0f} "
+              f"{statistics.mean(rtf) if rtf else float('nan'):9.3f}")
+    print("\nTTFA/total in ms. Streaming engines (piper) reach first audio after the first "
+          "sentence; pyttsx3 only after the whole clip.")
+
+
+if __name__ == "__main__":
+    main()
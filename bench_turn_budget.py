@@ -0,0 +1,161 @@
+"""
+Benchmark: fixed max_tokens vs adaptive per-turn budget (turn_budget.py)
+
+Live - the evidence. Sends the sample transcript to a running model
+server with both budgets, alternating which goes first on each turn, and
+reads the real generated tokens and wall time. LM Studio / OpenAI URLs use
+max_tokens; Ollama's /api/chat uses num_predict (with --cap, like the
+Ollama backend's TURN_MAX_TOKENS):
+    python bench_turn_budget.py --url http://localhost:1234/v1/chat/completions
+    python bench_turn_budget.py --url http://localhost:11434/api/chat --model phi3:mini --cap 35
+
+Simulated - only a sanity check of the arithmetic: reply lengths are drawn
+from the NATURAL_TOKENS table below, so it measures those assumptions,
+not the model:
+    python bench_turn_budget.py --simulate
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+from turn_budget import classify_turn
+
+FIXED_MAX_TOKENS = 50
+
+# Sample voice-chat transcript (user turns as the browser STT delivers them)
+SAMPLE_TRANSCRIPT = [
+    "hey", "hi how are you", "yeah", "I just got back from the gym", "oh nice",
+    "hmm", "what do you think about learning piano as an adult", "really",
+    "okay", "I had pizza for lunch", "lol", "why do cats knock things off tables",
+    "test test test", "...", "yeah totally", "my boss moved the deadline again",
+    "that sucks right", "can you recommend a good sci-fi book", "cool thanks",
+    "I think I'm gonna take a nap", "mhm", "tell me something interesting",
+    "no way", "I'm thinking about moving to a new city next year", "uh",
+    "how do you stay motivated when you're tired", "exactly", "same",
+    "it's raining again here", "oh really", "what if we could live on Mars",
+    "nah", "I finally finished that project I was stressing about", "wow",
+    "should I learn Python or JavaScript first", "right", "hello",
+    "I watched a really weird movie last night", "huh", "bye",
+]
+
+# Tokens the model would produce if left alone, per input kind
+NATURAL_TOKENS = {
+    "noise": (10, 30),
+    "backchannel": (12, 40),
+    "chat": (25, 60),
+    "deep": (40, 80),
+}
+
+
+def percentile(values, p):
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    lo, hi = int(k), min(int(k) + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def simulate(turns, budget_fn, ttft, tokens_per_sec, seed):
+    rng = random.Random(seed)
+    tokens, latencies = [], []
+    for text in turns:
+        kind = classify_turn(text).kind
+        natural = rng.randint(*NATURAL_TOKENS[kind])
+        generated = min(natural, budget_fn(text)[0])
+        tokens.append(generated)
+        latencies.append(ttft + generated / tokens_per_sec)
+    return tokens, latencies
+
+
+def complete(url, model, text, max_tokens, stop):
+    """One non-streamed reply; returns (generated tokens, seconds)"""
+    import requests
+    messages = [
+        {"role": "system", "content": "You are a friendly person chatting casually. /no_think"},
+        {"role": "user", "content": f"/no_think {text}"},
+    ]
+    if url.rstrip("/").endswith("/api/chat"):
+        payload = {"model": model, "messages": messages, "stream": False,
+                   "options": {"num_predict": max_tokens, "stop": stop}}
+    else:
+        payload = {"messages": messages, "max_tokens": max_tokens, "stop": stop, "stream": False}
+        if model:
+            payload["model"] = model
+    start = time.perf_counter()
+    response = requests.post(url, json=payload, timeout=120)
+    elapsed = time.perf_counter() - start
+    response.raise_for_status()
+    data = response.json()
+    return data.get("eval_count") or (data.get("usage") or {}).get("completion_tokens", 0), elapsed
+
+
+def run_live(turns, budgets, url, model):
+    """Each turn under every budget, the order alternating so drift hits both alike"""
+    results = {name: ([], []) for name in budgets}
+    names = list(budgets)
+    for i, text in enumerate(turns):
+        for name in (names if i % 2 == 0 else names[::-1]):
+            tokens, elapsed = complete(url, model, text, *budgets[name](text))
+            results[name][0].append(tokens)
+            results[name][1].append(elapsed)
+    return results
+
+
+def report(name, tokens, latencies):
+    print(f"{name:<10} mean tokens {statistics.mean(tokens):6.1f}   "
+          f"latency p50 {percentile(latencies, 50) * 1000:7.1f} ms   "
+          f"p75 {percentile(latencies, 75) * 1000:7.1f} ms   "
+          f"p95 {percentile(latencies, 95) * 1000:7.1f} ms   "
+          f"max {max(latencies) * 1000:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="chat URL: LM Studio /v1/chat/completions or Ollama /api/chat")
+    parser.add_argument("--model", default="", help="model name (required for Ollama)")
+    parser.add_argument("--cap", type=int, help="adaptive budget cap, e.g. the Ollama backend's TURN_MAX_TOKENS")
+    parser.add_argument("--simulate", action="store_true", help="no server: replay the NATURAL_TOKENS assumptions")
+    parser.add_argument("--ttft", type=float, default=0.15, help="simulated time to first token (s)")
+    parser.add_argument("--tps", type=float, default=40.0, help="simulated decode tokens/sec")
+    parser.add_argument("--repeat", type=int, help="passes over the transcript (default 3 live, 50 simulated)")
+    args = parser.parse_args()
+    if not args.url and not args.simulate:
+        parser.error("pass --url of a running model server (or --simulate for the arithmetic only)")
+
+    kinds = {}
+    for text in SAMPLE_TRANSCRIPT:
+        kind = classify_turn(text).kind
+        kinds[kind] = kinds.get(kind, 0) + 1
+    print(f"Corpus: {len(SAMPLE_TRANSCRIPT)} turns {kinds}")
+
+    fixed = lambda text: (FIXED_MAX_TOKENS, None)
+    adaptive = lambda text: (classify_turn(text, args.cap).max_tokens, classify_turn(text).stop)
+
+    if args.url:
+        print(f"Live: {args.url} {args.model}")
+        turns = SAMPLE_TRANSCRIPT * (args.repeat or 3)
+        results = run_live(turns, {"fixed": fixed, "adaptive": adaptive}, args.url, args.model)
+    else:
+        print("Simulated: reply lengths come from NATURAL_TOKENS - this checks the arithmetic, not the model")
+        turns = SAMPLE_TRANSCRIPT * (args.repeat or 50)
+        results = {
+            "fixed": simulate(turns, fixed, args.ttft, args.tps, seed=1),
+            "adaptive": simulate(turns, adaptive, args.ttft, args.tps, seed=1),
+        }
+
+    for name, (tokens, latencies) in results.items():
+        report(name, tokens, latencies)
+
+    fixed_tokens = statistics.mean(results["fixed"][0])
+    adaptive_tokens = statistics.mean(results["adaptive"][0])
+    # Adaptive vs fixed; negative is better
+    print(f"\nMean generated tokens: {(adaptive_tokens / fixed_tokens - 1) * 100:+.0f}%")
+    for p in (50, 75, 95):
+        fixed_p = percentile(results["fixed"][1], p)
+        adaptive_p = percentile(results["adaptive"][1], p)
+        print(f"p{p} latency:           {(adaptive_p / fixed_p - 1) * 100:+.0f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Token-based context budget
+Trimming history by message count lets the prompt swing from a few dozen
+tokens to several hundred depending on how long the messages were, and
+prefill time swings with it. This packs the newest history messages into
+a fixed token budget instead, so every turn's prompt is about the same
+size.
+
+Tokens are counted with the model's own tokenizer: the in-process GGUF
+model's, or a Hugging Face `tokenizers` tokenizer (a tokenizer.json path or
+hub id) for LM Studio / Ollama. Without one, ~4 characters per token is
+used. Each message is tokenized once, when it is added to the history;
+after that packing is dictionary lookups, a running sum and a bisect.
+"""
+
+import math
+import os
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from itertools import accumulate
+from typing import Callable, List, Optional, Union
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough count for English text with a BPE tokenizer"""
+    return max(1, math.ceil(len(text) / 4))
+
+
+def load_tokenizer(name: str) -> Callable[[str], int]:
+    """Token counter from a tokenizer.json path or Hugging Face hub id"""
+    from tokenizers import Tokenizer
+
+    tokenizer = Tokenizer.from_file(name) if os.path.exists(name) else Tokenizer.from_pretrained(name)
+    return lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+class ContextBudget:
+    """
+    max_tokens: prompt budget (system prompt + history)
+    tokenizer: a callable text -> token count, or a name for load_tokenizer;
+    loaded on first use, falls back to estimate_tokens
+    per_message: chat-template tokens around each message (role markers etc.)
+    """
+
+    def __init__(self, max_tokens: int, tokenizer: Union[Callable[[str], int], str, None] = None,
+                 per_message: int = 4, max_cached: int = 20000):
+        self.max_tokens = max_tokens
+        self.tokenizer = tokenizer
+        self.per_message = per_message
+        self.max_cached = max_cached
+        self._counter = tokenizer if callable(tokenizer) else None
+        self._counter_name = "callable" if callable(tokenizer) else None
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def counter(self) -> Callable[[str], int]:
+        if self._counter is None:
+            with self._load_lock:
+                if self._counter is None:
+                    self._counter, self._counter_name = estimate_tokens, "estimate"
+                    if self.tokenizer:
+                        try:
+                            self._counter, self._counter_name = load_tokenizer(self.tokenizer), self.tokenizer
+                        except Exception as e:
+                            print(f"⚠️ Tokenizer {self.tokenizer} unavailable ({e}), estimating token counts")
+        return self._counter
+
+    def count_text(self, text: str) -> int:
+        with self._lock:
+            tokens = self._cache.get(text)
+            if tokens is not None:
+                self._cache.move_to_end(text)
+                self.hits += 1
+                return tokens
+        try:
+            tokens = self.counter(text)
+        except Exception:
+            tokens = estimate_tokens(text)
+        with self._lock:
+            self.misses += 1
+            self._cache[text] = tokens
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+        return tokens
+
+    def count(self, message: dict) -> int:
+        """Tokens one history message adds to the prompt (cached)"""
+        return self.count_text(message.get("content", "")) + self.per_message
+
+    def pack(self, messages: List[dict], budget: Optional[int] = None) -> List[dict]:
+        """
+        The newest messages that fit in `budget` tokens (default max_tokens),
+        oldest first. The newest message is always kept.
+        """
+        if not messages:
+            return []
+        budget = self.max_tokens if budget is None else budget
+        # totals[i] = tokens of the i + 1 newest messages
+        totals = list(accumulate(self.count(m) for m in reversed(messages)))
+        keep = max(1, bisect_right(totals, budget))
+        return messages[-keep:]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_tokens": self.max_tokens,
+                "tokenizer": self._counter_name,
+                "cached": len(self._cache),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
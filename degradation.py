@@ -0,0 +1,214 @@
+"""
+Load-adaptive graceful degradation
+When the box is saturated, every session slows down the same way. The
+controller watches three signals and steps through tiers that each give
+up a little quality to keep turn latency inside budget:
+
+    0 normal
+    1 short_replies      max_tokens cut to 60%
+    2 lean_context       + only the last 4 history messages in the prompt
+    3 cached_audio       + TTS served from a clip cache, smaller STT model
+    4 shed_new_sessions  + sessions not seen recently get 503 + Retry-After
+
+Signals, each divided by its budget to give a pressure (1.0 = at budget):
+    event-loop lag      how late a 100 ms timer fires (worst of the last second)
+    upstream queue      turns waiting for an admission slot
+    TTS saturation      syntheses in flight / TTS capacity
+
+The controller moves one tier at a time. It steps up when the worst
+pressure has been above the next tier's threshold for `up_after` seconds,
+and steps down only after pressure has stayed below `down_ratio` of the
+current tier's threshold for `down_after` seconds, so it doesn't flap at
+the edge. Transitions are kept for /api/metrics.
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Callable, Dict, NamedTuple, Tuple
+
+
+class Tier(NamedTuple):
+    name: str
+    enter: float           # pressure that moves the controller into this tier
+    token_scale: float     # multiplier on max_tokens
+    history: int           # max history messages in the prompt (0 = no cap)
+    cached_audio: bool     # serve TTS from the clip cache
+    small_stt: bool        # use the fallback STT model
+    shed: bool             # reject sessions not seen recently
+
+
+TIERS = [
+    Tier("normal", 0.0, 1.0, 0, False, False, False),
+    Tier("short_replies", 0.6, 0.6, 0, False, False, False),
+    Tier("lean_context", 0.8, 0.6, 4, False, False, False),
+    Tier("cached_audio", 1.0, 0.5, 4, True, True, False),
+    Tier("shed_new_sessions", 1.3, 0.5, 4, True, True, True),
+]
+
+
+class InFlight:
+    """Counter for work in progress (e.g. TTS syntheses)"""
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def track(self):
+        with self._lock:
+            self.value += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.value -= 1
+
+
+class DegradationController:
+    """
+    signals: name -> (callable returning the current value, budget)
+    interval: seconds between checks (also the event-loop lag probe period)
+    lag_budget_ms: event-loop lag that counts as full pressure
+    """
+
+    def __init__(self, signals: Dict[str, Tuple[Callable[[], float], float]], interval: float = 0.1,
+                 lag_budget_ms: float = 100.0, up_after: float = 1.0, down_after: float = 10.0,
+                 down_ratio: float = 0.7, session_ttl: float = 600.0, max_sessions: int = 10000):
+        self.signals = signals
+        self.interval = interval
+        self.lag_budget_ms = lag_budget_ms
+        self.up_after = up_after
+        self.down_after = down_after
+        self.down_ratio = down_ratio
+        self.session_ttl = session_ttl
+        self.max_sessions = max_sessions
+        self.level = 0
+        self.pressure = 0.0
+        self.readings: Dict[str, float] = {}
+        self.transitions = deque(maxlen=50)
+        self.transition_count = 0
+        self.shed = 0
+        self._lags = deque(maxlen=max(1, int(1 / interval)))
+        self._above_since = None
+        self._below_since = None
+        self._entered = time.monotonic()
+        self._time_in_tier = [0.0] * len(TIERS)
+        self._sessions: "OrderedDict[str, float]" = OrderedDict()
+        self._task = None
+
+    @property
+    def tier(self) -> Tier:
+        return TIERS[self.level]
+
+    # --- per-turn knobs ---------------------------------------------------
+
+    def budget(self, budget):
+        """Scale a TurnBudget's max_tokens for the current tier"""
+        scale = self.tier.token_scale
+        if scale >= 1.0:
+            return budget
+        return budget._replace(max_tokens=max(8, int(budget.max_tokens * scale)))
+
+    def history(self, last: int) -> int:
+        """How many history messages to put in the prompt"""
+        cap = self.tier.history
+        return min(last, cap) if cap else last
+
+    def admit_session(self, session_id: str) -> bool:
+        """False if the session is new and the controller is shedding"""
+        now = time.monotonic()
+        known = session_id in self._sessions and now - self._sessions[session_id] < self.session_ttl
+        if not known and self.tier.shed:
+            self.shed += 1
+            return False
+        self._sessions[session_id] = now
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        return True
+
+    # --- control loop -----------------------------------------------------
+
+    def sample(self) -> float:
+        """Read all signals and return the worst pressure"""
+        readings = {"loop_lag_ms": max(self._lags, default=0.0)}
+        pressures = [readings["loop_lag_ms"] / self.lag_budget_ms]
+        for name, (read, budget) in self.signals.items():
+            try:
+                value = float(read())
+            except Exception:
+                continue
+            readings[name] = value
+            if budget > 0:
+                pressures.append(value / budget)
+        self.readings = readings
+        self.pressure = max(pressures)
+        return self.pressure
+
+    def update(self, pressure: float, now: float = None) -> None:
+        """Apply hysteresis and move at most one tier"""
+        now = time.monotonic() if now is None else now
+        if self.level + 1 < len(TIERS) and pressure >= TIERS[self.level + 1].enter:
+            self._below_since = None
+            if self._above_since is None:
+                self._above_since = now
+            elif now - self._above_since >= self.up_after:
+                self._move(self.level + 1, pressure, now)
+        elif self.level > 0 and pressure < self.tier.enter * self.down_ratio:
+            self._above_since = None
+            if self._below_since is None:
+                self._below_since = now
+            elif now - self._below_since >= self.down_after:
+                self._move(self.level - 1, pressure, now)
+        else:
+            self._above_since = None
+            self._below_since = None
+
+    def _move(self, level: int, pressure: float, now: float) -> None:
+        old = self.tier.name
+        arrow = "⬆️" if level > self.level else "⬇️"
+        self._time_in_tier[self.level] += now - self._entered
+        self.level = level
+        self._entered = now
+        self._above_since = None
+        self._below_since = None
+        self.transition_count += 1
+        self.transitions.append({
+            "at": time.time(),
+            "from": old,
+            "to": self.tier.name,
+            "pressure": round(pressure, 2),
+            "readings": {k: round(v, 1) for k, v in self.readings.items()},
+        })
+        print(f"{arrow} Degradation: {old} -> {self.tier.name} (pressure {pressure:.2f})")
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self._lags.append(max(0.0, (loop.time() - expected) * 1000))
+            self.update(self.sample())
+
+    def start(self) -> None:
+        """Start the background loop (call from a startup event)"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        time_in_tier = list(self._time_in_tier)
+        time_in_tier[self.level] += now - self._entered
+        return {
+            "tier": self.level,
+            "tier_name": self.tier.name,
+            "pressure": round(self.pressure, 2),
+            "readings": {k: round(v, 1) for k, v in self.readings.items()},
+            "transitions": self.transition_count,
+            "shed_sessions": self.shed,
+            "seconds_in_tier": {t.name: round(s, 1) for t, s in zip(TIERS, time_in_tier)},
+            "recent_transitions": list(self.transitions)[-10:],
+        }
@@ -0,0 +1,144 @@
+"""
+Server-side echo filter for interruption detection
+While the AI is talking, the mic (or browser speech recognition) often
+picks up the AI's own voice. Instead of fuzzy-matching every transcript
+against the reply in the browser, the server remembers the last few
+sentences it played for each session and indexes them as word n-grams.
+An incoming transcript is checked one n-gram at a time against that
+index, so the cost is O(transcript length) however much was spoken.
+
+Words covered by a spoken n-gram are treated as echo. What's left decides:
+    echo      nothing (or almost nothing) left - drop it
+    barge_in  real words left while the AI is still audible - interrupt
+    user      the AI isn't audible - normal turn
+
+State is per process (like the admission counters). Keep a session's
+TTS socket and chat requests on the same worker.
+"""
+
+import re
+import threading
+import time
+from collections import Counter, deque
+from typing import Dict, List, NamedTuple, Optional
+
+ECHO = "echo"
+BARGE_IN = "barge_in"
+USER = "user"
+
+WORDS_PER_SECOND = 2.7   # pyttsx3 at rate 160, used when the audio length is unknown
+
+_WORD_RE = re.compile(r"[\w']+")
+
+
+def _words(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+def _ngrams(words: List[str], n: int):
+    return [tuple(words[i:i + n]) for i in range(len(words) - n + 1)]
+
+
+class EchoVerdict(NamedTuple):
+    kind: str            # ECHO, BARGE_IN or USER
+    text: str            # the transcript with echoed words removed
+    echo_ratio: float    # share of words that matched what was spoken
+
+
+class _SessionEcho:
+    def __init__(self, keep_sentences: int):
+        self.sentences = deque()            # (ngrams, words), oldest first
+        self.keep_sentences = keep_sentences
+        self.ngrams = Counter()
+        self.vocab = Counter()
+        self.audible_until = 0.0
+
+    def add(self, ngrams: list, words: list) -> None:
+        self.sentences.append((ngrams, words))
+        self.ngrams.update(ngrams)
+        self.vocab.update(words)
+        while len(self.sentences) > self.keep_sentences:
+            old_ngrams, old_words = self.sentences.popleft()
+            self.ngrams.subtract(old_ngrams)
+            self.vocab.subtract(old_words)
+            # Counter.subtract keeps zero counts - drop them so lookups stay exact
+            for gram in old_ngrams:
+                if self.ngrams[gram] <= 0:
+                    del self.ngrams[gram]
+            for word in old_words:
+                if self.vocab[word] <= 0:
+                    del self.vocab[word]
+
+
+class EchoFilter:
+    """
+    n: n-gram length used to recognise echo (3 = three words in a row)
+    keep_sentences: spoken sentences remembered per session
+    tail: seconds after playback ends during which echo is still expected
+    min_residual: words that must be left after removing echo to count as speech
+    """
+
+    def __init__(self, n: int = 3, keep_sentences: int = 6, tail: float = 1.5, min_residual: int = 2):
+        self.n = n
+        self.keep_sentences = keep_sentences
+        self.tail = tail
+        self.min_residual = min_residual
+        self._sessions: Dict[str, _SessionEcho] = {}
+        self._lock = threading.Lock()
+
+    def speaking(self, session_id: str, text: str, duration: Optional[float] = None) -> None:
+        """Record text that is being played now; duration in seconds if known"""
+        words = _words(text)
+        if not words:
+            return
+        if duration is None:
+            duration = len(words) / WORDS_PER_SECOND
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = _SessionEcho(self.keep_sentences)
+            session.add(_ngrams(words, self.n), words)
+            # Queued sentences play back to back
+            now = time.monotonic()
+            session.audible_until = max(session.audible_until, now) + duration
+
+    def stopped(self, session_id: str) -> None:
+        """Playback was cut short (user interrupted) - only the tail is left"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.audible_until = min(session.audible_until, time.monotonic())
+
+    def audible(self, session_id: str) -> bool:
+        session = self._sessions.get(session_id)
+        return session is not None and time.monotonic() < session.audible_until + self.tail
+
+    def classify(self, session_id: str, transcript: str) -> EchoVerdict:
+        words = _words(transcript)
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if not words or session is None or not self.audible(session_id):
+                return EchoVerdict(USER, transcript, 0.0)
+
+            n = self.n
+            echoed = [False] * len(words)
+            if len(words) < n:
+                # Too short for an n-gram: echo only if every word was just spoken
+                if all(word in session.vocab for word in words):
+                    echoed = [True] * len(words)
+            else:
+                for i, gram in enumerate(_ngrams(words, n)):
+                    if gram in session.ngrams:
+                        echoed[i:i + n] = [True] * n
+
+        residual = [word for word, is_echo in zip(words, echoed) if not is_echo]
+        ratio = 1 - len(residual) / len(words)
+        if ratio == 0:
+            return EchoVerdict(BARGE_IN, transcript, 0.0)
+        if len(residual) < self.min_residual:
+            return EchoVerdict(ECHO, "", ratio)
+        return EchoVerdict(BARGE_IN, " ".join(residual), ratio)
+
+    def forget(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
@@ -0,0 +1,99 @@
+"""
+Pre-synthesised filler / backchannel clips
+Even with streaming there is a silent gap between the end of the user's
+turn and the first reply audio. When the model is expected to be slow to
+start, the server plays a short filler ("Hmm.", "Oh nice.") right away and
+the real reply follows it, so the user hears a response almost at once.
+
+Clips are synthesised once per TTS engine (voice) and kept in memory, so
+playing one costs no synthesis at all. The filler is picked to fit the
+turn (a question gets "Hmm, let me think.", a statement "Oh nice.") and a
+session never hears the same filler twice in a row.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# turn kind (turn_budget.py) -> fillers that fit it; noise gets none
+FILLERS: Dict[str, List[str]] = {
+    "backchannel": ["Mm-hmm.", "Yeah.", "Mm."],
+    "chat": ["Oh nice.", "Yeah.", "Oh, okay."],
+    "deep": ["Hmm.", "Hmm, let me think.", "Oh, good question."],
+}
+
+
+def _key(text: str) -> str:
+    return text.strip().lower()
+
+
+class FillerBank:
+    def __init__(self, fillers: Dict[str, List[str]] = None, max_sessions: int = 10000):
+        self.fillers = fillers or FILLERS
+        self.max_sessions = max_sessions
+        self._clips: Dict[Tuple[str, str], object] = {}
+        self._ready = set()
+        self._warming = set()
+        self._last: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.played = 0
+
+    def texts(self) -> List[str]:
+        return sorted({text for texts in self.fillers.values() for text in texts})
+
+    def warm(self, engine) -> int:
+        """Synthesise every filler with this engine (blocking); returns clip count"""
+        with self._lock:
+            if engine.name in self._ready or engine.name in self._warming:
+                return 0
+            self._warming.add(engine.name)
+        try:
+            clips = {(engine.name, _key(text)): engine.synthesize(text) for text in self.texts()}
+            with self._lock:
+                self._clips.update(clips)
+                self._ready.add(engine.name)
+            return len(clips)
+        finally:
+            with self._lock:
+                self._warming.discard(engine.name)
+
+    def warm_in_background(self, engine) -> None:
+        """Start warming an engine that isn't ready yet; returns immediately"""
+        if engine.name in self._ready or engine.name in self._warming:
+            return
+
+        def run():
+            try:
+                count = self.warm(engine)
+                if count:
+                    print(f"🗣️ Filler bank ready for {engine.name}: {count} clips")
+            except Exception as e:
+                print(f"⚠️ Filler bank warm-up failed for {engine.name}: {e}")
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def ready(self, engine_name: str) -> bool:
+        return engine_name in self._ready
+
+    def clip(self, engine_name: str, text: str) -> Optional[object]:
+        """The pre-synthesised audio for `text`, if it is a filler"""
+        return self._clips.get((engine_name, _key(text)))
+
+    def choose(self, kind: str, session_id: str, engine_name: str) -> Optional[str]:
+        """A filler for this turn, or None if there's none for the kind / voice"""
+        options = self.fillers.get(kind)
+        if not options or not self.ready(engine_name):
+            return None
+        with self._lock:
+            last = self._last.get(session_id)
+            start = (options.index(last) + 1) if last in options else 0
+            text = options[start % len(options)]
+            self._last[session_id] = text
+            self._last.move_to_end(session_id)
+            while len(self._last) > self.max_sessions:
+                self._last.popitem(last=False)
+            self.played += 1
+        return text
+
+    def stats(self) -> dict:
+        return {"voices": sorted(self._ready), "clips": len(self._clips), "played": self.played}
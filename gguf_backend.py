@@ -0,0 +1,337 @@
+"""
+In-process GGUF inference with continuous batching (llama.cpp)
+Runs a local .gguf model on CPU instead of calling LM Studio over HTTP.
+All active sessions share one llama.cpp context, with one KV-cache
+sequence per session. A single scheduler thread runs decode steps. Each
+step puts the next token of *every* generating session into one batch,
+then fills the rest of the batch with prompt tokens from new sessions
+(chunked prefill, so a long prompt never stalls the streams already
+talking). A new session joins at the next step, not after the current
+replies finish, so aggregate tokens/sec grows with the number of
+sessions instead of each turn queuing behind the last.
+
+    engine = get_engine("qwen3-0.6b-q8_0.gguf", n_parallel=16)
+    for text in engine.stream(messages, max_tokens=50, stop=["\\n\\n"]):
+        ...
+
+Needs `pip install llama-cpp-python`. The backend uses it when
+LLM_BACKEND=gguf (see backend_realtime.py).
+"""
+
+import codecs
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterator, List, Optional
+
+from lazy_import import lazy_module
+
+np = lazy_module("numpy")
+llama_cpp = lazy_module("llama_cpp")
+
+_DONE = object()
+
+# Fallback when the GGUF file has no chat template
+CHATML = (
+    "{% for message in messages %}"
+    "<|im_start|>{{ message['role'] }}\n{{ message['content'] }}<|im_end|>\n"
+    "{% endfor %}<|im_start|>assistant\n"
+)
+
+
+class _Sequence:
+    """One generation: its prompt, KV-cache slot and output queue"""
+
+    def __init__(self, prompt: List[int], max_tokens: int, stop: List[str],
+                 temperature: float, top_p: float, top_k: int, seed: Optional[int]):
+        self.prompt = prompt
+        self.max_tokens = max_tokens
+        self.stop = [s for s in stop if s]
+        self.temperature = temperature
+        self.top_p = top_p
+        self.top_k = top_k
+        self.rng = np.random.default_rng(seed)
+        self.seq_id = None
+        self.fed = 0          # prompt tokens already in the KV cache
+        self.pos = 0          # next position in this sequence
+        self.last = None      # sampled token to feed on the next step
+        self.generated = 0
+        self.pending = ""     # text held back while it could still become a stop string
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        self.out = queue.Queue()
+        self.cancelled = False
+        self.submitted = time.perf_counter()
+
+
+class GGUFEngine:
+    """
+    model_path: .gguf file
+    n_ctx: context length per session (prompt + reply)
+    n_parallel: sessions decoded together; more wait for a free slot
+    n_batch: tokens per decode step (one per generating session, rest prefill)
+    """
+
+    def __init__(self, model_path: str, n_ctx: int = 2048, n_parallel: int = 16,
+                 n_batch: int = 512, n_threads: Optional[int] = None):
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"GGUF model not found: {model_path}")
+        self.model_path = model_path
+        self.n_ctx = n_ctx
+        self.n_parallel = n_parallel
+        self.n_batch = max(n_batch, n_parallel)
+        n_threads = n_threads or max(1, (os.cpu_count() or 2) // 2)
+
+        load_start = time.perf_counter()
+        # The high-level object loads the weights and gives us the tokenizer
+        # and chat template; generation runs on our own multi-sequence context
+        self._llm = llama_cpp.Llama(model_path=model_path, n_ctx=256, n_threads=n_threads, verbose=False)
+        params = llama_cpp.llama_context_default_params()
+        params.n_ctx = n_ctx * n_parallel
+        params.n_batch = self.n_batch
+        params.n_ubatch = self.n_batch
+        params.n_seq_max = n_parallel
+        params.n_threads = n_threads
+        params.n_threads_batch = n_threads
+        new_context = getattr(llama_cpp, "llama_init_from_model", None) or llama_cpp.llama_new_context_with_model
+        self._ctx = new_context(self._llm.model, params)
+        if not self._ctx:
+            raise RuntimeError("llama.cpp could not create a context")
+        self._batch = llama_cpp.llama_batch_init(self.n_batch, 0, 1)
+        self._n_vocab = self._llm.n_vocab()
+        self._seq_rm = self._resolve_seq_rm()
+        self._setup_chat_format()
+        self.load_seconds = time.perf_counter() - load_start
+
+        self._cond = threading.Condition()
+        self._waiting = deque()
+        self._active: List[_Sequence] = []
+        self._free = list(range(n_parallel - 1, -1, -1))
+        self.steps = 0
+        self.batched_tokens = 0
+        self.generated_tokens = 0
+        self._started = time.perf_counter()
+        threading.Thread(target=self._run, daemon=True, name="gguf-scheduler").start()
+        print(f"✅ GGUF model loaded in {self.load_seconds:.1f}s: {os.path.basename(model_path)} "
+              f"({n_parallel} parallel sequences, {n_ctx} tokens each)")
+
+    # --- setup ------------------------------------------------------------
+
+    def _resolve_seq_rm(self):
+        # The KV-cache API was renamed across llama.cpp versions
+        if hasattr(llama_cpp, "llama_memory_seq_rm"):
+            return lambda seq_id: llama_cpp.llama_memory_seq_rm(llama_cpp.llama_get_memory(self._ctx), seq_id, -1, -1)
+        seq_rm = getattr(llama_cpp, "llama_kv_self_seq_rm", None) or llama_cpp.llama_kv_cache_seq_rm
+        return lambda seq_id: seq_rm(self._ctx, seq_id, -1, -1)
+
+    def _token_text(self, token: int) -> str:
+        if token < 0:
+            return ""
+        return self._llm.detokenize([token], special=True).decode("utf-8", errors="ignore")
+
+    def _setup_chat_format(self):
+        from llama_cpp.llama_chat_format import Jinja2ChatFormatter
+
+        eos = self._llm.token_eos()
+        self._bos_text = self._token_text(self._llm.token_bos())
+        template = self._llm.metadata.get("tokenizer.chat_template") or CHATML
+        self._formatter = Jinja2ChatFormatter(template=template, eos_token=self._token_text(eos),
+                                              bos_token=self._bos_text)
+        # Tokens that end a reply: EOS plus the template's end-of-turn markers
+        self._eog = {eos}
+        for marker in ("<|im_end|>", "<|eot_id|>", "<|end|>", "<end_of_turn>", "<|endoftext|>"):
+            ids = self._llm.tokenize(marker.encode("utf-8"), add_bos=False, special=True)
+            if len(ids) == 1:
+                self._eog.add(ids[0])
+
+    def format_prompt(self, messages: List[dict]) -> List[int]:
+        prompt = self._formatter(messages=messages).prompt
+        add_bos = not (self._bos_text and prompt.startswith(self._bos_text))
+        return self._llm.tokenize(prompt.encode("utf-8"), add_bos=add_bos, special=True)
+
+    # --- public API -------------------------------------------------------
+
+    def count_tokens(self, text: str) -> int:
+        return len(self._llm.tokenize(text.encode("utf-8"), add_bos=False, special=True))
+
+    def stream(self, messages: List[dict], max_tokens: int = 64, stop: Optional[List[str]] = None,
+               temperature: float = 0.7, top_p: float = 0.9, top_k: int = 40,
+               seed: Optional[int] = None) -> Iterator[str]:
+        """Yield reply text as it's generated; closing the iterator frees the slot"""
+        prompt = self.format_prompt(messages)
+        # Keep the newest part of an over-long prompt, leaving room for the reply
+        limit = max(1, self.n_ctx - max_tokens)
+        if len(prompt) > limit:
+            prompt = prompt[-limit:]
+        seq = _Sequence(prompt, max_tokens, stop or [], temperature, top_p, top_k, seed)
+        with self._cond:
+            self._waiting.append(seq)
+            self._cond.notify()
+        try:
+            while True:
+                item = seq.out.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            seq.cancelled = True
+            with self._cond:
+                if seq in self._waiting:
+                    self._waiting.remove(seq)
+
+    def complete(self, messages: List[dict], **kwargs) -> str:
+        return "".join(self.stream(messages, **kwargs))
+
+    def stats(self) -> dict:
+        elapsed = time.perf_counter() - self._started
+        return {
+            "model": os.path.basename(self.model_path),
+            "active": len(self._active),
+            "waiting": len(self._waiting),
+            "parallel": self.n_parallel,
+            "steps": self.steps,
+            "avg_batch": round(self.batched_tokens / self.steps, 1) if self.steps else 0.0,
+            "tokens_per_sec": round(self.generated_tokens / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+
+    # --- scheduler --------------------------------------------------------
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._waiting and not self._active:
+                    self._cond.wait()
+                while self._waiting and self._free:
+                    seq = self._waiting.popleft()
+                    seq.seq_id = self._free.pop()
+                    self._active.append(seq)
+            try:
+                self._step()
+            except Exception as e:
+                # Don't let one bad step kill the scheduler - fail the current batch
+                print(f"❌ GGUF decode error: {e}")
+                for seq in list(self._active):
+                    self._finish(seq, e)
+
+    def _step(self):
+        for seq in [s for s in self._active if s.cancelled]:
+            self._finish(seq)
+        if not self._active:
+            return
+
+        batch = self._batch
+        n = 0
+        rows = []   # (sequence, batch index) whose logits we sample from
+
+        def add(token, seq, logits):
+            nonlocal n
+            batch.token[n] = token
+            batch.pos[n] = seq.pos
+            batch.n_seq_id[n] = 1
+            batch.seq_id[n][0] = seq.seq_id
+            batch.logits[n] = 1 if logits else 0
+            seq.pos += 1
+            n += 1
+
+        # Generating sessions first: one token each, so they never wait on a prefill
+        for seq in self._active:
+            if seq.last is not None:
+                rows.append((seq, n))
+                add(seq.last, seq, True)
+        # Then prompt chunks with whatever room is left
+        for seq in self._active:
+            if seq.fed < len(seq.prompt) and n < self.n_batch:
+                chunk = seq.prompt[seq.fed:seq.fed + self.n_batch - n]
+                for i, token in enumerate(chunk):
+                    last = seq.fed + i == len(seq.prompt) - 1
+                    if last:
+                        rows.append((seq, n))
+                    add(token, seq, last)
+                seq.fed += len(chunk)
+        batch.n_tokens = n
+        if n == 0:
+            return
+
+        rc = llama_cpp.llama_decode(self._ctx, batch)
+        if rc != 0:
+            raise RuntimeError(f"llama_decode returned {rc} (KV cache full? lower GGUF_PARALLEL or raise GGUF_CTX)")
+        self.steps += 1
+        self.batched_tokens += n
+
+        for seq, index in rows:
+            logits = np.ctypeslib.as_array(llama_cpp.llama_get_logits_ith(self._ctx, index), shape=(self._n_vocab,))
+            self._emit(seq, self._sample(logits, seq))
+
+    def _sample(self, logits, seq: _Sequence) -> int:
+        if seq.temperature <= 0:
+            return int(np.argmax(logits))
+        k = min(seq.top_k, logits.size) if seq.top_k > 0 else logits.size
+        top = np.argpartition(logits, -k)[-k:]
+        scores = logits[top].astype(np.float64) / seq.temperature
+        probs = np.exp(scores - scores.max())
+        probs /= probs.sum()
+        order = np.argsort(-probs)
+        cutoff = int(np.searchsorted(np.cumsum(probs[order]), seq.top_p)) + 1
+        keep = order[:cutoff]
+        p = probs[keep] / probs[keep].sum()
+        return int(top[keep[seq.rng.choice(len(keep), p=p)]])
+
+    def _emit(self, seq: _Sequence, token: int):
+        seq.generated += 1
+        self.generated_tokens += 1
+        if token in self._eog:
+            self._finish(seq)
+            return
+        seq.pending += seq.decoder.decode(self._llm.detokenize([token]))
+        for stop in seq.stop:
+            cut = seq.pending.find(stop)
+            if cut >= 0:
+                if cut:
+                    seq.out.put(seq.pending[:cut])
+                self._finish(seq)
+                return
+        # Hold back a tail that could still turn into a stop string
+        hold = 0
+        for stop in seq.stop:
+            for size in range(min(len(stop) - 1, len(seq.pending)), hold, -1):
+                if seq.pending.endswith(stop[:size]):
+                    hold = size
+                    break
+        ready = seq.pending[:len(seq.pending) - hold]
+        seq.pending = seq.pending[len(seq.pending) - hold:]
+        if ready:
+            seq.out.put(ready)
+        if seq.generated >= seq.max_tokens:
+            if seq.pending:
+                seq.out.put(seq.pending)
+            self._finish(seq)
+            return
+        seq.last = token
+
+    def _finish(self, seq: _Sequence, error: Optional[Exception] = None):
+        if seq not in self._active:
+            return
+        self._active.remove(seq)
+        self._seq_rm(seq.seq_id)
+        with self._cond:
+            self._free.append(seq.seq_id)
+        seq.out.put(error if error is not None else _DONE)
+
+
+_instances: Dict[str, GGUFEngine] = {}
+_instances_lock = threading.Lock()
+
+
+def get_engine(model_path: str, **kwargs) -> GGUFEngine:
+    """Shared engine for this process (the model is loaded on first use)"""
+    with _instances_lock:
+        if model_path not in _instances:
+            _instances[model_path] = GGUFEngine(model_path, **kwargs)
+        return _instances[model_path]
+
+
+def loaded_engine(model_path: str) -> Optional[GGUFEngine]:
+    return _instances.get(model_path)
@@ -0,0 +1,72 @@
+"""
+Model warm-up and keep-alive for the upstream LLM
+LM Studio and Ollama unload idle models (and drop the cached system-prompt
+prefix), so the first turn after a quiet spell pays the load penalty. The
+scheduler sends a tiny prime request with the real system prompts at
+startup and then at a fixed interval, but only while sessions are active.
+"""
+
+import asyncio
+import time
+from typing import Callable
+
+from starlette.concurrency import run_in_threadpool
+
+
+class KeepAliveScheduler:
+    """
+    ping:      blocking callable that sends the prime request(s)
+    interval:  seconds between pings while active (0 disables pings)
+    idle_after: seconds without a turn after which pinging stops
+    """
+
+    def __init__(self, ping: Callable[[], None], interval: float = 60.0, idle_after: float = 600.0):
+        self.ping = ping
+        self.interval = interval
+        self.idle_after = idle_after
+        self.last_activity = 0.0
+        self.last_ping_ms = None
+        self.pings = 0
+        self._task = None
+
+    def touch(self) -> None:
+        """Call on every turn - keeps the pings going"""
+        self.last_activity = time.monotonic()
+
+    @property
+    def active(self) -> bool:
+        return time.monotonic() - self.last_activity < self.idle_after
+
+    def warm_up(self) -> None:
+        """One blocking prime request (run it off the event loop)"""
+        self._ping("Warm-up")
+
+    def _ping(self, label: str) -> None:
+        start = time.perf_counter()
+        try:
+            self.ping()
+        except Exception as e:
+            print(f"⚠️ {label} ping failed: {e}")
+            return
+        self.pings += 1
+        self.last_ping_ms = (time.perf_counter() - start) * 1000
+        print(f"🔥 {label} ping done in {self.last_ping_ms:.0f} ms")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            if self.active:
+                await run_in_threadpool(self._ping, "Keep-alive")
+
+    def start(self) -> None:
+        """Start the background loop (call from a startup event)"""
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stats(self) -> dict:
+        return {
+            "interval": self.interval,
+            "active": self.active,
+            "pings": self.pings,
+            "last_ping_ms": self.last_ping_ms,
+        }
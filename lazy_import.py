@@ -0,0 +1,68 @@
+"""
+Lazy imports for fast cold start
+Heavy optional modules (ollama, pyttsx3, faster_whisper, numpy) are only
+imported on first attribute access, so the server can bind its port right
+away. prewarm() imports them in a background thread afterwards so the
+first real request doesn't pay for it either.
+"""
+
+import importlib
+import threading
+import time
+from typing import Callable, Iterable, Optional
+
+
+class LazyModule:
+    """Stand-in for a module; the real import happens on first use"""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_module(name: str, eager: bool = False) -> LazyModule:
+    module = LazyModule(name)
+    if eager:
+        module._load()
+    return module
+
+
+def prewarm(modules: Iterable[LazyModule], then: Optional[Callable[[], None]] = None) -> threading.Thread:
+    """Import the given lazy modules (then run `then`) in a daemon thread"""
+
+    def run():
+        for module in modules:
+            start = time.perf_counter()
+            try:
+                module._load()
+                print(f"🔥 Pre-warmed {module._name} in {(time.perf_counter() - start) * 1000:.0f} ms")
+            except Exception as e:
+                print(f"⚠️ Pre-warm of {module._name} failed: {e}")
+        if then is not None:
+            try:
+                then()
+            except Exception as e:
+                print(f"⚠️ Pre-warm step failed: {e}")
+
+    thread = threading.Thread(target=run, name="prewarm", daemon=True)
+    thread.start()
+    return thread
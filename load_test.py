@@ -0,0 +1,154 @@
+"""
+Load generator for /api/stream_chat - finds the backend's saturation point
+
+Simulated sessions (each with its own session_id) talk in a loop: send a
+turn, read the SSE stream to the end, pause for a think time, repeat. The
+number of sessions ramps up in stages. For each stage it reports
+completed turns/sec, TTFT (first token frame) and full-turn latency
+percentiles, and how many turns were shed (429/503) or failed.
+
+The saturation point is the first stage where throughput stops growing
+(< 5% over the previous stage), p95 TTFT exceeds --slo-ms, or more than
+5% of turns fail or are shed.
+
+    python mock_llm_server.py --port 1234 --parallel 8 &
+    LM_STUDIO_BASE=http://127.0.0.1:1234 SESSION_RATE=100 python backend_realtime.py &
+    python load_test.py --stages 10,50,100,250,500,1000,2000 --stage-seconds 20
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import httpx
+
+TURNS = [
+    "yeah",
+    "oh really?",
+    "what do you think about rainy days?",
+    "I just got back from a long walk by the river",
+    "haha nice",
+    "can you explain why coffee keeps me awake?",
+    "I'm thinking about learning to cook this year",
+    "true",
+]
+
+
+class StageStats:
+    def __init__(self):
+        self.ttft = []
+        self.total = []
+        self.completed = 0
+        self.shed = 0
+        self.failed = 0
+
+    def percentile(self, values, p):
+        if not values:
+            return float("nan")
+        values = sorted(values)
+        return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def one_turn(client, url, session_id, text, stats):
+    start = time.perf_counter()
+    first = None
+    try:
+        async with client.stream("POST", url, json={"text": text, "session_id": session_id}) as response:
+            if response.status_code in (429, 503):
+                stats.shed += 1
+                return
+            if response.status_code != 200:
+                stats.failed += 1
+                return
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                frame = json.loads(line[6:])
+                if "error" in frame:
+                    stats.failed += 1
+                    return
+                if first is None and ("token" in frame or "done" in frame):
+                    first = time.perf_counter() - start
+                if frame.get("done"):
+                    break
+    except httpx.HTTPError:
+        stats.failed += 1
+        return
+    if first is None:
+        stats.failed += 1
+        return
+    stats.completed += 1
+    stats.ttft.append(first * 1000)
+    stats.total.append((time.perf_counter() - start) * 1000)
+
+
+async def session_loop(client, url, session_id, think, stop_at, stats, rng):
+    # Spread the first turns out so a new stage doesn't start as one burst
+    await asyncio.sleep(rng.uniform(0, think))
+    while time.perf_counter() < stop_at:
+        await one_turn(client, url, session_id, rng.choice(TURNS), stats)
+        await asyncio.sleep(rng.expovariate(1 / think) if think > 0 else 0)
+
+
+async def run(args):
+    url = args.url.rstrip("/") + "/api/stream_chat"
+    stages = [int(s) for s in args.stages.split(",")]
+    limits = httpx.Limits(max_connections=max(stages), max_keepalive_connections=max(stages))
+    timeout = httpx.Timeout(args.timeout)
+    rng = random.Random(args.seed)
+    results = []
+
+    print(f"Target {url}, think time ~{args.think}s, {args.stage_seconds}s per stage\n")
+    print(f"{'sessions':>8} {'turns/s':>8} {'TTFT p50':>9} {'TTFT p95':>9} {'turn p95':>9} "
+          f"{'done':>6} {'shed':>6} {'failed':>6}")
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        for sessions in stages:
+            stats = StageStats()
+            stop_at = time.perf_counter() + args.stage_seconds
+            tasks = [
+                asyncio.create_task(session_loop(
+                    client, url, f"load-{sessions}-{i}", args.think, stop_at, stats, random.Random(rng.random())
+                ))
+                for i in range(sessions)
+            ]
+            await asyncio.gather(*tasks)
+            throughput = stats.completed / args.stage_seconds
+            p95_ttft = stats.percentile(stats.ttft, 0.95)
+            attempted = stats.completed + stats.shed + stats.failed
+            bad = (stats.shed + stats.failed) / attempted if attempted else 0.0
+            results.append((sessions, throughput, p95_ttft, bad))
+            print(f"{sessions:8d} {throughput:8.1f} {stats.percentile(stats.ttft, 0.5):9.0f} {p95_ttft:9.0f} "
+                  f"{stats.percentile(stats.total, 0.95):9.0f} {stats.completed:6d} {stats.shed:6d} {stats.failed:6d}")
+
+    saturation = None
+    for i, (sessions, throughput, p95_ttft, bad) in enumerate(results):
+        flat = i > 0 and throughput < results[i - 1][1] * 1.05
+        if flat or p95_ttft > args.slo_ms or bad > 0.05:
+            saturation = (sessions, "throughput flat" if flat else "p95 TTFT over SLO" if p95_ttft > args.slo_ms
+                          else "shed/failed > 5%")
+            break
+    print()
+    if saturation:
+        best = max(results, key=lambda r: r[1])
+        print(f"Saturation at ~{saturation[0]} sessions ({saturation[1]}); "
+              f"peak {best[1]:.1f} turns/s at {best[0]} sessions")
+    else:
+        print("No saturation within the tested stages - add larger stages")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="backend base URL")
+    parser.add_argument("--stages", default="10,50,100,250,500,1000", help="comma-separated session counts")
+    parser.add_argument("--stage-seconds", type=float, default=20.0)
+    parser.add_argument("--think", type=float, default=2.0, help="mean seconds between a session's turns")
+    parser.add_argument("--slo-ms", type=float, default=1000.0, help="p95 TTFT target")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
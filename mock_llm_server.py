@@ -0,0 +1,273 @@
+"""
+Mock LM Studio / Ollama server for offline and load testing
+Speaks enough of both protocols for the two backends:
+
+    GET  /v1/models                  LM Studio / OpenAI model list
+    POST /v1/chat/completions        SSE stream ("stream": true) or one JSON reply
+    GET  /api/tags                   Ollama model list
+    POST /api/chat                   Ollama NDJSON stream or one JSON reply
+
+Replies are canned sentences sent a word at a time, honouring max_tokens /
+num_predict and stop sequences. Timing is modelled, not computed:
+
+    --ttft-ms       time to first token
+    --tps           tokens per second per stream
+    --jitter        +/- fraction applied to every delay
+    --parallel      concurrent generations ("GPU slots"); the rest queue,
+                    which is what makes saturation visible in load tests
+    --error-rate    share of requests answered with HTTP 500
+    --drop-rate     share of streams cut off halfway
+    --think-rate    share of replies wrapped in a <think>...</think> preamble
+    --replay        a session recording (session_replay.py): prompts found in
+                    it get the recorded tokens with the recorded timing
+
+Runs are replayable: with the same --seed, a given request always gets the
+same reply, delays and failures.
+
+    python mock_llm_server.py --port 1234 --ttft-ms 150 --tps 40
+    LM_STUDIO_BASE=http://127.0.0.1:1234 python backend_realtime.py
+    OLLAMA_HOST=http://127.0.0.1:1234 python backend_realtime_ollama.py
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+from typing import List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+MODEL_ID = "qwen3-0.6b"
+OLLAMA_MODEL = "phi3:mini"
+
+REPLIES = [
+    "Yeah, totally. I think that sounds like a great plan honestly.",
+    "Oh nice! I love that kind of thing. It always makes the day better.",
+    "Honestly, I guess it depends on the mood. Sometimes a quiet night in is the best.",
+    "Haha, fair enough. I would probably do the exact same thing.",
+    "That's a good question. I think it comes down to what feels right for you.",
+    "Totally get that. Mornings can be rough without coffee.",
+    "Oh really? I didn't know that. That's actually pretty cool.",
+    "I think you should go for it. Worst case, you learn something new.",
+]
+THINK = "<think>\nThe user is chatting casually. Keep it short and friendly.\n</think>\n\n"
+
+
+class MockConfig:
+    def __init__(self, ttft_ms=150.0, tps=40.0, jitter=0.2, parallel=4,
+                 error_rate=0.0, drop_rate=0.0, think_rate=0.0, seed=0, replay=None):
+        self.ttft_ms = ttft_ms
+        self.tps = tps
+        self.jitter = jitter
+        self.parallel = parallel
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.think_rate = think_rate
+        self.seed = seed
+        self.replay = replay
+
+
+class MockLLM:
+    def __init__(self, config: MockConfig):
+        self.config = config
+        self.slots = None   # created on the server's event loop
+        self.requests = 0
+        self.active = 0
+        self.queued = 0
+        self.errors = 0
+        self.drops = 0
+        self.replayed = 0
+        self.recorded = {}
+        if config.replay:
+            from session_replay import load_upstream
+            self.recorded = load_upstream(config.replay)
+
+    def _rng(self, body: dict) -> random.Random:
+        # Same seed + same request -> same reply, timing and failures
+        raw = json.dumps(body.get("messages", []), sort_keys=True) + str(self.config.seed)
+        return random.Random(int(hashlib.sha256(raw.encode()).hexdigest()[:16], 16))
+
+    def _delay(self, rng: random.Random, seconds: float) -> float:
+        j = self.config.jitter
+        return max(0.0, seconds * (1 + rng.uniform(-j, j)))
+
+    def plan(self, body: dict, max_tokens: Optional[int], stop: Optional[List[str]]):
+        """Pick the reply for this request: (tokens, rng, fail, drop_at, delays)"""
+        rng = self._rng(body)
+        if self.recorded:
+            from session_replay import prompt_key
+            replies = self.recorded.get(prompt_key(body.get("messages", [])))
+            if replies:
+                # Same prompt recorded more than once: hand the replies out in turn
+                tokens, gaps_ms = replies[0]
+                replies.rotate(-1)
+                self.replayed += 1
+                return tokens, rng, False, None, [gap / 1000 for gap in gaps_ms]
+        text = rng.choice(REPLIES)
+        if stop:
+            for s in stop:
+                if s and s in text:
+                    text = text.split(s, 1)[0]
+        if rng.random() < self.config.think_rate:
+            text = THINK + text
+        # One "token" per word (with its leading space) - close enough for timing
+        words = text.split(" ")
+        tokens = [words[0]] + [" " + w for w in words[1:]]
+        if max_tokens:
+            tokens = tokens[:max_tokens]
+        fail = rng.random() < self.config.error_rate
+        drop_at = len(tokens) // 2 if rng.random() < self.config.drop_rate else None
+        return tokens, rng, fail, drop_at, None
+
+    async def tokens(self, tokens: List[str], rng: random.Random, drop_at: Optional[int],
+                     delays: Optional[List[float]] = None):
+        """
+        Yield tokens with modelled TTFT and inter-token delay, holding a slot
+        (or with the given per-token delays, for recorded replies)
+        """
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.config.parallel)
+        self.queued += 1
+        async with self.slots:
+            self.queued -= 1
+            self.active += 1
+            try:
+                if delays is None:
+                    delays = [self._delay(rng, self.config.ttft_ms / 1000)]
+                    delays += [self._delay(rng, 1 / self.config.tps) for _ in tokens[1:]]
+                if not tokens and delays:
+                    await asyncio.sleep(delays[0])
+                for i, token in enumerate(tokens):
+                    if drop_at is not None and i == drop_at:
+                        self.drops += 1
+                        raise ConnectionError("mock stream dropped")
+                    await asyncio.sleep(delays[i])
+                    yield token
+            finally:
+                self.active -= 1
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "active": self.active,
+            "queued": self.queued,
+            "errors": self.errors,
+            "drops": self.drops,
+            "replayed": self.replayed,
+        }
+
+
+def create_app(config: MockConfig) -> FastAPI:
+    app = FastAPI(title="Mock LM Studio / Ollama")
+    llm = MockLLM(config)
+    app.state.llm = llm
+
+    def error():
+        llm.errors += 1
+        return JSONResponse({"error": "mock upstream error"}, status_code=500)
+
+    @app.get("/")
+    async def root():
+        return {"status": "running", "mock": True, **llm.stats()}
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": MODEL_ID, "object": "model", "owned_by": "mock"}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        llm.requests += 1
+        stop = body.get("stop")
+        tokens, rng, fail, drop_at, delays = llm.plan(body, body.get("max_tokens"), [stop] if isinstance(stop, str) else stop)
+        if fail:
+            return error()
+        created = int(time.time())
+
+        if not body.get("stream"):
+            text = "".join([t async for t in llm.tokens(tokens, rng, None, delays)])
+            return {
+                "id": "chatcmpl-mock", "object": "chat.completion", "created": created, "model": MODEL_ID,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {"completion_tokens": len(tokens)},
+            }
+
+        async def sse():
+            async for token in llm.tokens(tokens, rng, drop_at, delays):
+                chunk = {
+                    "id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": created, "model": MODEL_ID,
+                    "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(sse(), media_type="text/event-stream")
+
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": [{"name": OLLAMA_MODEL, "model": OLLAMA_MODEL, "size": 0, "digest": "mock", "details": {}}]}
+
+    @app.post("/api/chat")
+    async def ollama_chat(request: Request):
+        body = await request.json()
+        llm.requests += 1
+        options = body.get("options") or {}
+        tokens, rng, fail, drop_at, delays = llm.plan(body, options.get("num_predict"), options.get("stop"))
+        if fail:
+            return error()
+        model = body.get("model", OLLAMA_MODEL)
+
+        def message(content, done):
+            msg = {
+                "model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "message": {"role": "assistant", "content": content}, "done": done,
+            }
+            if done:
+                msg.update({"done_reason": "stop", "eval_count": len(tokens)})
+            return msg
+
+        if body.get("stream") is False:
+            text = "".join([t async for t in llm.tokens(tokens, rng, None, delays)])
+            return message(text, True)
+
+        async def ndjson():
+            async for token in llm.tokens(tokens, rng, drop_at, delays):
+                yield json.dumps(message(token, False)) + "\n"
+            yield json.dumps(message("", True)) + "\n"
+
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1234)
+    parser.add_argument("--ttft-ms", type=float, default=150.0)
+    parser.add_argument("--tps", type=float, default=40.0)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--parallel", type=int, default=4)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--think-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--replay", help="session recording to take replies and timing from")
+    args = parser.parse_args()
+
+    import uvicorn
+    config = MockConfig(
+        ttft_ms=args.ttft_ms, tps=args.tps, jitter=args.jitter, parallel=args.parallel,
+        error_rate=args.error_rate, drop_rate=args.drop_rate, think_rate=args.think_rate, seed=args.seed,
+        replay=args.replay,
+    )
+    print(f"🧪 Mock LLM on http://{args.host}:{args.port} "
+          f"(TTFT {args.ttft_ms:.0f} ms, {args.tps:.0f} tok/s, {args.parallel} slots)")
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
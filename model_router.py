@@ -0,0 +1,159 @@
+"""
+Latency-SLO router between a small and a large model
+Quick turns (backchannels, noise - see turn_budget.py) always go to the
+small model. Deeper turns go to the large model as long as its measured
+latency meets the SLO, otherwise to the small one, so a slow or busy
+large model costs some quality on a few turns instead of making every
+reply late.
+
+Latency is what the user waits for before the AI starts talking: time to
+first token plus the tokens of the first spoken sentence at the model's
+current decode speed. Both are tracked per model as an EWMA of live
+streams; non-streamed replies (observe_reply) update time to first token.
+A model that missed the SLO gets a probe turn every `recheck` seconds, so
+it can come back once it recovers.
+"""
+
+import threading
+import time
+from typing import Dict, Optional
+
+QUICK_KINDS = ("noise", "backchannel")
+
+
+class ModelStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.ttft_ms = None     # EWMA, None until the first sample
+        self.tps = None         # EWMA tokens/sec after the first token
+        self.samples = 0
+        self.errors = 0
+        self.routed = 0
+        self.last_sample = 0.0
+
+    def observe(self, ttft_ms: float, tps: Optional[float], alpha: float) -> None:
+        self.ttft_ms = ttft_ms if self.ttft_ms is None else (1 - alpha) * self.ttft_ms + alpha * ttft_ms
+        if tps:
+            self.tps = tps if self.tps is None else (1 - alpha) * self.tps + alpha * tps
+        self.samples += 1
+        self.last_sample = time.monotonic()
+
+    def predict_ms(self, tokens: int) -> Optional[float]:
+        """Expected wait for `tokens` tokens, or None with no data yet"""
+        if self.ttft_ms is None:
+            return None
+        decode_ms = tokens / self.tps * 1000 if self.tps else 0.0
+        return self.ttft_ms + decode_ms
+
+
+class ModelRouter:
+    """
+    small / large: model ids; without a large model everything goes to small
+    slo_ms: target wait until the first sentence is generated
+    first_sentence_tokens: tokens needed before TTS can start speaking
+    recheck: seconds before a model that missed the SLO gets a probe turn
+    """
+
+    def __init__(self, small: str, large: Optional[str] = None, slo_ms: float = 800.0,
+                 alpha: float = 0.3, first_sentence_tokens: int = 12, recheck: float = 30.0):
+        self.small = small
+        self.large = large or None
+        self.slo_ms = slo_ms
+        self.alpha = alpha
+        self.first_sentence_tokens = first_sentence_tokens
+        self.recheck = recheck
+        self._models: Dict[str, ModelStats] = {small: ModelStats(small)}
+        if self.large:
+            self._models[self.large] = ModelStats(self.large)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.large is not None
+
+    def choose(self, budget) -> str:
+        """Model for this turn (budget from classify_turn)"""
+        with self._lock:
+            model = self._choose(budget)
+            self._models[model].routed += 1
+            return model
+
+    def _choose(self, budget) -> str:
+        if not self.large or budget.kind in QUICK_KINDS:
+            return self.small
+        tokens = min(budget.max_tokens, self.first_sentence_tokens)
+        large = self._models[self.large]
+        predicted = large.predict_ms(tokens)
+        if predicted is None or predicted <= self.slo_ms:
+            return self.large
+        if time.monotonic() - large.last_sample > self.recheck:
+            # Stale estimate - send one turn to see if it has recovered
+            large.last_sample = time.monotonic()
+            return self.large
+        small_predicted = self._models[self.small].predict_ms(tokens)
+        if small_predicted is not None and small_predicted >= predicted:
+            # Both miss the SLO and the small one isn't faster either
+            return self.large
+        return self.small
+
+    def predicted_ttft_ms(self, budget) -> Optional[float]:
+        """Expected time to first token for this turn, without routing it"""
+        with self._lock:
+            model = self.small if not self.large or budget.kind in QUICK_KINDS else self.large
+            return self._models[model].ttft_ms
+
+    def observe(self, model: str, ttft: float, tokens: int, generation: float) -> None:
+        """
+        One finished stream: ttft and generation (first token to last) in
+        seconds, tokens = deltas received
+        """
+        stats = self._models.get(model)
+        if stats is None:
+            return
+        tps = (tokens - 1) / generation if tokens > 1 and generation > 0 else None
+        with self._lock:
+            stats.observe(ttft * 1000, tps, self.alpha)
+
+    def observe_reply(self, model: str, seconds: float, tokens: Optional[int] = None) -> None:
+        """
+        One non-streamed reply that took `seconds` in all. With a decode
+        speed from earlier streams the tokens after the first are taken off,
+        leaving the time to first token; without one the whole call counts
+        as time to first token, which is the wait of a client that only
+        starts speaking once the reply is complete.
+        """
+        stats = self._models.get(model)
+        if stats is None:
+            return
+        with self._lock:
+            if tokens and tokens > 1 and stats.tps:
+                seconds = max(0.0, seconds - (tokens - 1) / stats.tps)
+            stats.observe(seconds * 1000, None, self.alpha)
+
+    def failed(self, model: str) -> None:
+        """Upstream error - counts as a turn well over the SLO"""
+        stats = self._models.get(model)
+        if stats is None:
+            return
+        with self._lock:
+            stats.errors += 1
+            stats.observe(max(stats.ttft_ms or 0.0, self.slo_ms * 2), None, self.alpha)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "slo_ms": self.slo_ms,
+                "models": {
+                    name: {
+                        "ttft_ms": round(s.ttft_ms, 1) if s.ttft_ms is not None else None,
+                        "tokens_per_sec": round(s.tps, 1) if s.tps is not None else None,
+                        "predicted_ms": round(s.predict_ms(self.first_sentence_tokens), 1)
+                        if s.ttft_ms is not None else None,
+                        "samples": s.samples,
+                        "routed": s.routed,
+                        "errors": s.errors,
+                    }
+                    for name, s in self._models.items()
+                },
+            }
@@ -0,0 +1,117 @@
+"""
+Opt-in production runtime profile (RUNTIME_PROFILE=fast)
+The defaults favour portability: the stock asyncio loop, h11, stdlib json
+and CPython's default GC. Under load the token loop is what hurts. Every
+upstream chunk is parsed and every token is re-encoded as an SSE frame,
+and each turn allocates thousands of short-lived dicts and strings, so
+generation-0 collections run constantly and the occasional full
+collection walks every long-lived object the app has loaded.
+
+With the profile on:
+    uvloop + httptools    event loop and HTTP parser (uvicorn), if installed
+    orjson                SSE frames, upstream chunk parsing and JSON responses
+    GC                    bigger generation-0 threshold (GC_THRESHOLD), and
+                          gc.freeze() after warm-up so modules, models and
+                          caches loaded at startup are never scanned again
+
+Anything that isn't installed falls back to the default with a warning;
+without the profile everything behaves exactly as before.
+
+    pip install uvloop httptools orjson
+    RUNTIME_PROFILE=fast python backend_realtime.py
+"""
+
+import gc
+import json
+import os
+
+from starlette.responses import JSONResponse
+
+ENABLED = os.environ.get("RUNTIME_PROFILE", "").lower() in ("fast", "production", "1")
+GC_THRESHOLD = tuple(int(n) for n in os.environ.get("GC_THRESHOLD", "50000,20,100").split(","))
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FAST_JSON = ENABLED and orjson is not None
+_frozen = False
+
+
+def _orjson_dumps(obj) -> str:
+    return orjson.dumps(obj).decode("utf-8")
+
+
+# json.dumps / json.loads stand-ins for the hot paths (orjson.JSONDecodeError
+# is a json.JSONDecodeError, so existing except clauses still match)
+dumps = _orjson_dumps if FAST_JSON else json.dumps
+loads = orjson.loads if FAST_JSON else json.loads
+
+
+def sse(obj) -> str:
+    """One server-sent event frame"""
+    return f"data: {dumps(obj)}\n\n"
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson"""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+def response_class():
+    """default_response_class for FastAPI()"""
+    return FastJSONResponse if FAST_JSON else JSONResponse
+
+
+def server_options() -> dict:
+    """Extra uvicorn.run() arguments for the profile"""
+    if not ENABLED:
+        return {}
+    options = {}
+    for option, module in (("loop", "uvloop"), ("http", "httptools")):
+        try:
+            __import__(module)
+            options[option] = module
+        except ImportError:
+            print(f"⚠️ RUNTIME_PROFILE: {module} not installed, using uvicorn's default {option}")
+    return options
+
+
+def tune_gc() -> None:
+    """Apply GC_THRESHOLD (call once at startup)"""
+    if ENABLED:
+        gc.set_threshold(*GC_THRESHOLD)
+
+
+def freeze() -> None:
+    """
+    Move everything allocated so far into the permanent generation (call
+    after warm-up). Later collections only look at objects created since.
+    """
+    global _frozen
+    if ENABLED:
+        gc.collect()
+        gc.freeze()
+        _frozen = True
+
+
+def describe() -> str:
+    """One line for the startup banner"""
+    if not ENABLED:
+        return "default (set RUNTIME_PROFILE=fast for uvloop/orjson/GC tuning)"
+    parts = ["orjson" if FAST_JSON else "stdlib json (orjson not installed)"]
+    parts.append(f"gc threshold {GC_THRESHOLD}")
+    return "fast: " + ", ".join(parts)
+
+
+def stats() -> dict:
+    return {
+        "profile": "fast" if ENABLED else "default",
+        "json": "orjson" if FAST_JSON else "stdlib",
+        "gc_threshold": gc.get_threshold(),
+        "gc_frozen": gc.get_freeze_count() if _frozen else 0,
+        "gc_collections": [s["collections"] for s in gc.get_stats()],
+    }
@@ -0,0 +1,239 @@
+"""
+Long-term semantic memory per session
+The prompt only carries the last few history messages, so anything said
+more than a few exchanges ago is invisible to the model. This index keeps
+an embedding of every turn and, for each new user turn, finds the 1-3
+older turns most related to it so they can go back into the prompt.
+
+Embeddings come from a small CPU sentence-transformers model when it is
+installed (MEMORY_EMBED_MODEL, default all-MiniLM-L6-v2). Without it a
+hashing embedder is used: word and word-pair features hashed into a fixed
+number of dimensions. It only matches shared words, but needs nothing
+beyond NumPy. Unrelated words can land in the same bucket, so its hits
+must also share at least one actual word with the query.
+
+Each session's vectors live in one float32 array (normalised, so a dot
+product is the cosine similarity) that grows by doubling up to max_turns
+and then overwrites the oldest turn. Lookup is one matrix-vector product
+plus argpartition, about 0.1 ms per thousand turns.
+The least recently used session is dropped past max_sessions.
+"""
+
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from typing import List, Optional
+
+from lazy_import import lazy_module
+
+np = lazy_module("numpy")
+
+STOPWORDS = frozenset(
+    "a an the and or but so if to of in on at for with about from by is are was were be been am "
+    "i you he she it we they me my your our their this that these those do does did have has had "
+    "not no yes just really very what how why when where who can could would should will "
+    "it's i'm don't that's there here then than too also oh um uh like".split()
+)
+WORD = re.compile(r"[a-z0-9']+")
+
+
+class HashingEmbedder:
+    """Feature-hashed bag of words and word pairs"""
+
+    name = "hashing"
+    min_score = 0.3         # one shared word out of a handful; collisions alone rarely get here
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        words = [w for w in WORD.findall(text.lower()) if w not in STOPWORDS]
+        # Crude plural folding so "magnet" finds "magnets"
+        words = [w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w for w in words]
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def related(self, query: str, text: str) -> bool:
+        """At least one word in common, not just a hash bucket"""
+        return not set(self._features(query)).isdisjoint(
+            f for f in self._features(text) if " " not in f
+        )
+
+    def encode(self, texts: List[str]):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                h = zlib.crc32(feature.encode())
+                weight = 0.5 if " " in feature else 1.0
+                vectors[row, h % self.dim] += weight if h & 0x80000000 else -weight
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-9)
+
+
+class SentenceEmbedder:
+    """Small sentence-transformers model on the CPU"""
+
+    min_score = 0.35
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+
+        self.name = model_name
+        self._model = SentenceTransformer(model_name, device="cpu")
+        self.dim = self._model.get_sentence_embedding_dimension()
+
+    def related(self, query: str, text: str) -> bool:
+        return True
+
+    def encode(self, texts: List[str]):
+        return self._model.encode(texts, normalize_embeddings=True, convert_to_numpy=True).astype(np.float32)
+
+
+def load_embedder(model_name: Optional[str] = None):
+    """sentence-transformers model if available, otherwise the hashing embedder"""
+    if model_name and model_name != "hashing":
+        try:
+            return SentenceEmbedder(model_name)
+        except Exception as e:
+            print(f"⚠️ Embedding model {model_name} unavailable ({e}), using hashing embedder")
+    return HashingEmbedder()
+
+
+class _SessionIndex:
+    def __init__(self, dim: int, max_turns: int):
+        self.max_turns = max_turns
+        self.vectors = np.zeros((min(64, max_turns), dim), dtype=np.float32)
+        self.seq = np.zeros(len(self.vectors), dtype=np.int64)
+        self.texts: List[Optional[tuple]] = [None] * len(self.vectors)
+        self.count = 0          # turns added so far (also the next sequence number)
+
+    @property
+    def size(self) -> int:
+        return min(self.count, self.max_turns)
+
+    def add(self, vectors, entries: List[tuple]) -> None:
+        for vector, entry in zip(vectors, entries):
+            if self.count >= len(self.vectors) and len(self.vectors) < self.max_turns:
+                grow = min(len(self.vectors) * 2, self.max_turns)
+                self.vectors = np.resize(self.vectors, (grow, self.vectors.shape[1]))
+                self.seq = np.resize(self.seq, grow)
+                self.texts.extend([None] * (grow - len(self.texts)))
+            slot = self.count % self.max_turns
+            self.vectors[slot] = vector
+            self.seq[slot] = self.count
+            self.texts[slot] = entry
+            self.count += 1
+
+
+class SemanticMemory:
+    """
+    embedder: anything with .dim and .encode(list of str) -> normalised rows;
+    by default load_embedder(model_name) on first use
+    max_turns: vectors kept per session (oldest overwritten after that)
+    min_score: cosine similarity below which an old turn isn't worth
+    recalling (default: the embedder's own)
+    """
+
+    def __init__(self, embedder=None, model_name: Optional[str] = None, max_turns: int = 1000,
+                 max_sessions: int = 500, min_score: Optional[float] = None, max_chars: int = 300):
+        self._embedder = embedder
+        self.model_name = model_name
+        self.max_turns = max_turns
+        self.max_sessions = max_sessions
+        self.min_score = min_score
+        self.max_chars = max_chars
+        self._sessions: "OrderedDict[str, _SessionIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._last = (None, None)
+        self.lookups = 0
+        self.recalled = 0
+
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            with self._load_lock:
+                if self._embedder is None:
+                    self._embedder = load_embedder(self.model_name)
+        return self._embedder
+
+    def _embed(self, texts: List[str]):
+        # The user's turn is embedded when it is added and again for the
+        # lookup - keep the last one so that only costs once
+        last_text, last_vector = self._last
+        if len(texts) == 1 and texts[0] == last_text:
+            return last_vector[None, :]
+        vectors = self.embedder.encode(texts)
+        if len(texts) == 1:
+            self._last = (texts[0], vectors[0])
+        return vectors
+
+    def _index(self, session_id: str) -> _SessionIndex:
+        index = self._sessions.get(session_id)
+        if index is None:
+            index = self._sessions[session_id] = _SessionIndex(self.embedder.dim, self.max_turns)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        self._sessions.move_to_end(session_id)
+        return index
+
+    def extend(self, session_id: str, messages: List[dict]) -> None:
+        """Index messages ({"role", "content"}), oldest first"""
+        entries = [(m["role"], m["content"].strip()) for m in messages if m.get("content", "").strip()]
+        if not entries:
+            return
+        vectors = self._embed([text for _, text in entries])
+        with self._lock:
+            self._index(session_id).add(vectors, entries)
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._sessions
+
+    def add(self, session_id: str, role: str, text: str) -> None:
+        self.extend(session_id, [{"role": role, "content": text}])
+
+    def recall(self, session_id: str, text: str, k: int = 3, skip_last: int = 0) -> List[dict]:
+        """
+        Up to k older messages most related to `text`, oldest first.
+        The last `skip_last` messages (already in the prompt) are never
+        returned.
+        """
+        with self._lock:
+            index = self._sessions.get(session_id)
+            if index is None or k <= 0 or not text.strip():
+                return []
+            self.lookups += 1
+        query = self._embed([text.strip()])[0]
+        with self._lock:
+            size = index.size
+            scores = index.vectors[:size] @ query
+            scores[index.seq[:size] >= index.count - skip_last] = -1.0
+            k = min(k, size)
+            if k <= 0:
+                return []
+            top = np.argpartition(scores, -k)[-k:]
+            min_score = self.embedder.min_score if self.min_score is None else self.min_score
+            top = top[scores[top] >= min_score]
+            top = top[np.argsort(index.seq[top])]
+            hits = [index.texts[i] for i in top]
+        hits = [hit for hit in hits if self.embedder.related(text, hit[1])]
+        self.recalled += len(hits)
+        return [{"role": role, "content": content[:self.max_chars]} for role, content in hits]
+
+    def clear(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            turns = sum(index.size for index in self._sessions.values())
+            nbytes = sum(index.vectors.nbytes for index in self._sessions.values())
+        return {
+            "embedder": self._embedder.name if self._embedder else None,
+            "sessions": len(self._sessions),
+            "turns": turns,
+            "vector_mb": round(nbytes / 1e6, 2),
+            "lookups": self.lookups,
+            "recalled": self.recalled,
+        }
@@ -0,0 +1,103 @@
+"""
+Streaming early-stop on sentence completion
+Counts finished sentences as tokens arrive and reports when the configured
+count is reached, so the caller can close the upstream stream instead of
+letting the model ramble until max_tokens.
+
+A terminator only counts once the next non-space character shows up and
+it isn't lowercase, so "3.5", "e.g. this", "Dr. Smith", "U.S." and
+"well... maybe" are never cut. The whitespace after a terminator is held
+back until that decision is made (at most one token of delay).
+"""
+
+TERMINATORS = ".!?"
+CLOSERS = "\"')]”’"
+
+ABBREVIATIONS = {
+    "mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "vs", "etc", "e.g", "i.e",
+    "a.m", "p.m", "approx", "no", "u.s", "u.k", "inc", "ltd", "jan", "feb", "mar",
+    "apr", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec", "mt", "ft",
+}
+
+
+class SentenceStopper:
+    def __init__(self, max_sentences: int):
+        self.max_sentences = max_sentences
+        self.sentences = 0
+        self.done = False
+        self._word = ""         # current word, for the abbreviation check
+        self._word_before = ""  # word in front of the pending terminator
+        self._dots = 0
+        self._state = "text"    # text | terminator | space
+        self._held = ""
+
+    def feed(self, chunk: str) -> str:
+        """Add streamed text, return the part that is safe to emit now"""
+        if self.done or self.max_sentences <= 0:
+            return "" if self.done else chunk
+        out = []
+        for ch in chunk:
+            if self._state == "text":
+                out.append(ch)
+                if ch in TERMINATORS:
+                    self._word_before = self._word.lower()
+                    self._dots = 1 if ch == "." else 0
+                    self._state = "terminator"
+                elif ch.isspace():
+                    self._word = ""
+                else:
+                    self._word += ch
+            elif self._state == "terminator":
+                if ch in TERMINATORS or ch in CLOSERS:
+                    out.append(ch)
+                    self._dots += ch == "."
+                elif ch.isspace():
+                    self._held = ch
+                    self._state = "space"
+                else:
+                    # "3.5", "e.g", "U.S" - still inside the word
+                    out.append(ch)
+                    self._word += "." + ch if ch.isalnum() else ch
+                    self._state = "text"
+            else:
+                if ch.isspace():
+                    self._held += ch
+                    continue
+                if self._is_boundary(ch):
+                    self.sentences += 1
+                    if self.sentences >= self.max_sentences:
+                        self.done = True
+                        self._held = ""
+                        return "".join(out)
+                out.append(self._held)
+                out.append(ch)
+                self._held = ""
+                self._word = "" if ch.isspace() else ch
+                self._state = "text"
+                if ch in TERMINATORS:
+                    self._word_before = ""
+                    self._state = "terminator"
+        return "".join(out)
+
+    def _is_boundary(self, next_char: str) -> bool:
+        if next_char.islower():
+            return False
+        if self._dots >= 2:
+            # Ellipsis - "well... I guess"
+            return False
+        word = self._word_before.strip("\"'([“‘")
+        if word in ABBREVIATIONS:
+            return False
+        if len(word) == 1 and word.isalpha() and word != "i":
+            # Initials - "J. K. Rowling"
+            return False
+        return True
+
+    def flush(self) -> str:
+        """End of stream - release whatever was held back"""
+        if self.done:
+            return ""
+        if self._state in ("terminator", "space"):
+            self.sentences += 1
+        held, self._held = self._held, ""
+        return held
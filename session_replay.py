@@ -0,0 +1,575 @@
+"""
+Session record / replay for end-to-end regression benchmarks
+With SESSION_RECORD=session.jsonl.gz the backend writes every session's
+inputs to a compact JSON-lines file (gzipped when the name ends in .gz):
+
+    request     chat / stream / TTS / cancel / echo / clear calls with their bodies
+    ws          /ws/audio and /ws/tts messages, mic frames included (base64)
+    upstream    each model reply as tokens plus the gap before each one
+
+All events carry a millisecond offset from the start of the recording.
+Writes go through a queue to a background thread, like transcript_log.py,
+so recording costs the request path a queue.put().
+
+Replaying starts mock_llm_server.py with --replay (recorded prompts get the
+recorded tokens at the recorded pace), runs the backend under uvicorn
+against it, and sends the same requests and frames at the same offsets.
+The report has per-turn TTFT and turn time, TTS first-audio and total time,
+and STT finalisation time; diffing two reports from two builds shows what
+moved.
+
+    SESSION_RECORD=session.jsonl.gz python backend_realtime.py    # talk, then stop it
+    python session_replay.py replay session.jsonl.gz --out before.json
+    git checkout my-branch
+    python session_replay.py replay session.jsonl.gz --out after.json
+    python session_replay.py diff before.json after.json
+
+The WebSocket events need the `websockets` package (uvicorn uses it on the
+server side too); without it they are skipped.
+"""
+
+import argparse
+import asyncio
+import atexit
+import base64
+import gzip
+import itertools
+import json
+import os
+import queue
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+FORMAT_VERSION = 1
+STREAM_PATHS = ("/api/stream_chat", "/api/stream_chat_ai1")
+TURN_PATHS = STREAM_PATHS + ("/api/chat",)
+
+
+def prompt_key(messages: List[dict]) -> str:
+    """What a recorded upstream reply is matched on: the newest user message"""
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            return message.get("content", "")
+    return ""
+
+
+def _open(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def read_events(path: str) -> Iterator[dict]:
+    """Events in file order; a file cut off by a crash yields what was flushed"""
+    with _open(path, "r") as f:
+        try:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        except (EOFError, json.JSONDecodeError):
+            return
+
+
+def load_upstream(path: str) -> Dict[str, deque]:
+    """prompt -> recorded (tokens, gaps_ms) replies, oldest first"""
+    replies = defaultdict(deque)
+    for event in read_events(path):
+        if event.get("type") == "upstream":
+            replies[event["prompt"]].append((event["tokens"], event["gaps_ms"]))
+    return replies
+
+
+# -- recording ------------------------------------------------------------
+
+class SessionRecorder:
+    """
+    path: .jsonl or .jsonl.gz to write; empty gives a disabled recorder
+    whose methods do nothing (and upstream() returns the stream untouched)
+    """
+
+    def __init__(self, path: Optional[str] = None, flush_interval: float = 0.5):
+        self.path = os.path.abspath(path) if path else None
+        self.enabled = bool(path)
+        self.flush_interval = flush_interval
+        self.events = 0
+        self._start = time.perf_counter()
+        self._sockets = itertools.count(1)
+        if not self.enabled:
+            return
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="session-record", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+        self._put({"type": "header", "version": FORMAT_VERSION, "started": time.time()})
+
+    def _t(self) -> float:
+        return round((time.perf_counter() - self._start) * 1000, 1)
+
+    def _put(self, event: dict) -> None:
+        self.events += 1
+        self._queue.put(event)
+
+    def request(self, session_id: Optional[str], method: str, path: str,
+                body: Optional[dict] = None, params: Optional[dict] = None) -> None:
+        if not self.enabled:
+            return
+        event = {"t": self._t(), "type": "request", "session": session_id, "method": method, "path": path}
+        if body is not None:
+            event["json"] = body
+        if params:
+            event["params"] = params
+        self._put(event)
+
+    def socket(self) -> int:
+        """Id for one WebSocket connection's events"""
+        return next(self._sockets)
+
+    def ws(self, socket_id: int, session_id: Optional[str], path: str,
+           message: Optional[dict] = None, data: Optional[bytes] = None, close: bool = False) -> None:
+        if not self.enabled:
+            return
+        event = {"t": self._t(), "type": "ws", "socket": socket_id, "session": session_id, "path": path}
+        if message is not None:
+            event["json"] = message
+        if data is not None:
+            event["bytes"] = base64.b64encode(data).decode("ascii")
+        if close:
+            event["close"] = True
+        self._put(event)
+
+    def upstream(self, messages: List[dict], deltas: Iterable, content: Callable = lambda delta: delta):
+        """Wrap one upstream stream, recording each token and its arrival gap"""
+        if not self.enabled:
+            return deltas
+        return self._record_stream(prompt_key(messages), deltas, content)
+
+    def _record_stream(self, prompt, deltas, content):
+        t = self._t()
+        tokens, gaps = [], []
+        last = time.perf_counter()
+        try:
+            for delta in deltas:
+                text = content(delta)
+                if text:
+                    now = time.perf_counter()
+                    tokens.append(text)
+                    gaps.append(round((now - last) * 1000, 1))
+                    last = now
+                yield delta
+        finally:
+            # Partial when the stream was closed early - the replay stops there too
+            self._put({"t": t, "type": "upstream", "prompt": prompt, "tokens": tokens, "gaps_ms": gaps})
+
+    def completion(self, messages: List[dict], call: Callable, content: Callable = lambda reply: reply):
+        """Run one non-streaming upstream call, recording its latency and text"""
+        if not self.enabled:
+            return call()
+        t, start = self._t(), time.perf_counter()
+        reply = call()
+        try:
+            text = content(reply)
+        except Exception:
+            text = ""
+        elapsed = round((time.perf_counter() - start) * 1000, 1)
+        self._put({"t": t, "type": "upstream", "prompt": prompt_key(messages),
+                   "tokens": [text] if text else [], "gaps_ms": [elapsed] if text else []})
+        return reply
+
+    def _write_loop(self) -> None:
+        with _open(self.path, "w") as f:
+            while True:
+                batch = [self._queue.get()]
+                deadline = time.monotonic() + self.flush_interval
+                while batch[-1] is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(self._queue.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+                for event in batch:
+                    if event is not None:
+                        f.write(json.dumps(event, separators=(",", ":")) + "\n")
+                f.flush()
+                for _ in batch:
+                    self._queue.task_done()
+                if batch[-1] is None:
+                    return
+
+    def close(self) -> None:
+        """Write out everything queued and close the file"""
+        if self.enabled and self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(timeout=5)
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, "path": self.path, "events": self.events}
+
+
+# -- replay ---------------------------------------------------------------
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(proc, port, timeout=60.0) -> None:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"process exited with code {proc.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.05):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"port {port} did not accept connections in time")
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+class Replay:
+    """Sends one recording's events to a running backend, timing each response"""
+
+    def __init__(self, base_url: str, events: List[dict], speed: float = 1.0):
+        self.base_url = base_url.rstrip("/")
+        self.events = events
+        self.speed = speed
+        self.turns = []
+        self.tts = []
+        self.stt = []
+        self.skipped = defaultdict(int)
+        self._sockets = {}
+
+    async def run(self) -> None:
+        import httpx
+
+        try:
+            import websockets
+        except ImportError:
+            websockets = None
+        limits = httpx.Limits(max_connections=256, max_keepalive_connections=64)
+        tasks = []
+        async with httpx.AsyncClient(base_url=self.base_url, limits=limits, timeout=httpx.Timeout(60.0)) as client:
+            start = time.perf_counter()
+            for i, event in enumerate(self.events):
+                if event.get("type") not in ("request", "ws"):
+                    continue
+                delay = event["t"] / 1000 / self.speed - (time.perf_counter() - start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if event["type"] == "request":
+                    tasks.append(asyncio.create_task(self.request(client, i, event)))
+                elif websockets is None:
+                    self.skipped["ws (pip install websockets)"] += 1
+                else:
+                    await self.ws(websockets, i, event)
+            await asyncio.gather(*tasks)
+            for sock in self._sockets.values():
+                await sock["queue"].put(None)
+            await asyncio.gather(*(sock["task"] for sock in self._sockets.values()))
+
+    async def request(self, client, i, event) -> None:
+        path = event["path"]
+        body = event.get("json")
+        start = time.perf_counter()
+        row = {"i": i, "session": event.get("session"), "path": path}
+        if path in TURN_PATHS:
+            row["text"] = body.get("text", "")
+        try:
+            if path in STREAM_PATHS:
+                await self._stream_turn(client, body, row, start)
+                self.turns.append(row)
+                return
+            response = await client.request(event["method"], path, json=body, params=event.get("params"))
+            await response.aread()
+            row["status"] = response.status_code
+        except Exception as e:
+            row["status"] = f"error: {e}"
+        row["total_ms"] = (time.perf_counter() - start) * 1000
+        if path == "/api/chat":
+            self.turns.append(row)
+        elif path == "/api/tts":
+            row["chars"] = len(body.get("text", ""))
+            self.tts.append(row)
+
+    async def _stream_turn(self, client, body, row, start) -> None:
+        tokens = 0
+        try:
+            async with client.stream("POST", row["path"], json=body) as response:
+                row["status"] = response.status_code
+                async for line in response.aiter_lines():
+                    if not line.startswith("data: "):
+                        continue
+                    frame = json.loads(line[6:])
+                    if "filler" in frame:
+                        row["filler"] = frame["filler"]
+                    if "token" in frame or "done" in frame:
+                        row.setdefault("ttft_ms", (time.perf_counter() - start) * 1000)
+                        tokens += "token" in frame
+                    if "error" in frame:
+                        row["status"] = f"error: {frame['error']}"
+                    if frame.get("done"):
+                        row["reply"] = frame.get("full_text", "")
+                        break
+        except Exception as e:
+            row["status"] = f"error: {e}"
+        row["tokens"] = tokens
+        row["total_ms"] = (time.perf_counter() - start) * 1000
+
+    async def ws(self, websockets, i, event) -> None:
+        sock = self._sockets.get(event["socket"])
+        if sock is None:
+            url = "ws" + self.base_url[4:] + event["path"]
+            try:
+                conn = await websockets.connect(url, max_size=None)
+            except Exception as e:
+                self.skipped[f"ws connect failed ({e})"] += 1
+                return
+            sock = {"conn": conn, "path": event["path"], "pending": deque(), "queue": asyncio.Queue()}
+            sock["task"] = asyncio.create_task(self._ws_loop(sock))
+            self._sockets[event["socket"]] = sock
+        await sock["queue"].put((i, event))
+
+    async def _ws_loop(self, sock) -> None:
+        """Send one socket's events in order while a reader times the replies"""
+        reader = asyncio.create_task(self._ws_reader(sock))
+        conn = sock["conn"]
+        try:
+            while True:
+                item = await sock["queue"].get()
+                if item is None:
+                    break
+                i, event = item
+                if event.get("close"):
+                    break
+                if "bytes" in event:
+                    await conn.send(base64.b64decode(event["bytes"]))
+                    continue
+                message = event["json"]
+                if sock["path"] == "/ws/tts":
+                    sock["pending"].append({"i": i, "session": event.get("session"), "kind": message.get("type", "tts"),
+                                            "chars": len(message.get("text", "")), "start": time.perf_counter()})
+                elif message.get("type") == "stop":
+                    sock["pending"].append({"i": i, "session": event.get("session"), "start": time.perf_counter()})
+                await conn.send(json.dumps(message))
+            # Let outstanding replies arrive before closing
+            for _ in range(100):
+                if not sock["pending"]:
+                    break
+                await asyncio.sleep(0.05)
+        except Exception as e:
+            self.skipped[f"ws send failed ({e})"] += 1
+        finally:
+            await conn.close()
+            await reader
+
+    async def _ws_reader(self, sock) -> None:
+        pending = sock["pending"]
+        try:
+            async for message in sock["conn"]:
+                now = time.perf_counter()
+                if isinstance(message, bytes):
+                    if pending:
+                        pending[0].setdefault("first_audio_ms", (now - pending[0]["start"]) * 1000)
+                    continue
+                reply = json.loads(message)
+                kind = reply.get("type")
+                if sock["path"] == "/ws/tts" and kind in ("end", "error") and pending:
+                    row = pending.popleft()
+                    row["total_ms"] = (now - row.pop("start")) * 1000
+                    row["status"] = reply.get("message", "ok") if kind == "error" else "ok"
+                    self.tts.append(row)
+                elif sock["path"] == "/ws/audio" and kind in ("final", "error") and pending:
+                    row = pending.popleft()
+                    row["final_ms"] = (now - row.pop("start")) * 1000
+                    row["text"] = reply.get("text", reply.get("message", ""))
+                    self.stt.append(row)
+        except Exception:
+            pass
+
+    def report(self) -> dict:
+        def summary(rows, key):
+            values = [r[key] for r in rows if isinstance(r.get(key), (int, float))]
+            if not values:
+                return None
+            return {"n": len(values), "p50": percentile(values, 0.5), "p95": percentile(values, 0.95),
+                    "mean": statistics.fmean(values)}
+
+        metrics = {
+            "ttft_ms": summary(self.turns, "ttft_ms"),
+            "turn_ms": summary(self.turns, "total_ms"),
+            "tts_first_audio_ms": summary(self.tts, "first_audio_ms"),
+            "tts_ms": summary(self.tts, "total_ms"),
+            "stt_final_ms": summary(self.stt, "final_ms"),
+        }
+        return {
+            "turns": sorted(self.turns, key=lambda r: r["i"]),
+            "tts": sorted(self.tts, key=lambda r: r["i"]),
+            "stt": sorted(self.stt, key=lambda r: r["i"]),
+            "summary": {name: value for name, value in metrics.items() if value},
+            "skipped": dict(self.skipped),
+        }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        result = subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True)
+        return result.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def replay(args) -> dict:
+    events = list(read_events(args.recording))
+    if not events or events[0].get("type") != "header":
+        raise SystemExit(f"{args.recording} is not a session recording")
+    here = os.path.dirname(os.path.abspath(__file__))
+    mock_port, port = free_port(), free_port()
+    mock = subprocess.Popen(
+        [sys.executable, os.path.join(here, "mock_llm_server.py"), "--port", str(mock_port),
+         "--replay", args.recording, "--jitter", "0", "--parallel", str(args.parallel)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    backend = None
+    try:
+        wait_for_port(mock, mock_port)
+        mock_url = f"http://127.0.0.1:{mock_port}"
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ)
+            env.update({
+                "LM_STUDIO_BASE": mock_url,
+                "OLLAMA_HOST": mock_url,
+                "SESSION_STORE": "memory://",
+                "TRANSCRIPT_LOG": os.path.join(tmp, "transcripts.db"),
+                "KEEPALIVE_INTERVAL": "0",
+                "SESSION_RECORD": "",
+            })
+            backend = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", f"{args.module}:app", "--port", str(port), "--log-level", "warning"],
+                cwd=here, env=env, stdout=subprocess.DEVNULL if args.quiet else None,
+                stderr=subprocess.DEVNULL if args.quiet else None,
+            )
+            wait_for_port(backend, port)
+            run = Replay(f"http://127.0.0.1:{port}", events, args.speed)
+            started = time.time()
+            asyncio.run(run.run())
+    finally:
+        for proc in (backend, mock):
+            if proc is not None:
+                proc.terminate()
+                proc.wait()
+
+    report = run.report()
+    report.update({
+        "recording": os.path.abspath(args.recording),
+        "module": args.module,
+        "revision": git_revision(),
+        "started": started,
+        "speed": args.speed,
+    })
+    return report
+
+
+def _ms(value) -> str:
+    return f"{value:8.0f}" if isinstance(value, (int, float)) else f"{'-':>8}"
+
+
+def print_report(report: dict) -> None:
+    print(f"{'event':>6} {'session':12s} {'TTFT':>8} {'turn':>8} {'tokens':>6}  text")
+    for row in report["turns"]:
+        status = "" if row.get("status") == 200 else f"  [{row.get('status')}]"
+        print(f"{row['i']:6d} {str(row['session'])[:12]:12s} {_ms(row.get('ttft_ms'))} {_ms(row.get('total_ms'))} "
+              f"{row.get('tokens', 0):6d}  {row['text'][:40]}{status}")
+    for name, rows, key in (("TTS", report["tts"], "first_audio_ms"), ("STT", report["stt"], "final_ms")):
+        if rows:
+            print(f"\n{name}: {len(rows)} requests")
+    print(f"\n{'metric':20s} {'n':>5} {'p50':>8} {'p95':>8} {'mean':>8}")
+    for name, s in report["summary"].items():
+        print(f"{name:20s} {s['n']:5d} {_ms(s['p50'])} {_ms(s['p95'])} {_ms(s['mean'])}")
+    for reason, count in report.get("skipped", {}).items():
+        print(f"⚠️ skipped {count} event(s): {reason}")
+
+
+def diff(base: dict, new: dict, threshold: float, min_ms: float) -> bool:
+    """Print per-turn and summary deltas; True if any summary metric regressed"""
+    print(f"base {base.get('revision')}  vs  new {new.get('revision')}\n")
+    new_turns = {row["i"]: row for row in new["turns"]}
+    print(f"{'event':>6} {'TTFT':>8} {'Δ':>7} {'turn':>8} {'Δ':>7}  text")
+    for row in base["turns"]:
+        other = new_turns.get(row["i"])
+        if other is None:
+            continue
+        cells = []
+        for key in ("ttft_ms", "total_ms"):
+            a, b = row.get(key), other.get(key)
+            delta = f"{b - a:+7.0f}" if a is not None and b is not None else f"{'-':>7}"
+            cells.append(f"{_ms(b)} {delta}")
+        print(f"{row['i']:6d} {' '.join(cells)}  {row.get('text', '')[:40]}")
+
+    regressed = False
+    print(f"\n{'metric':20s} {'base p50':>9} {'new p50':>8} {'base p95':>9} {'new p95':>8}")
+    for name in sorted(set(base["summary"]) | set(new["summary"])):
+        a, b = base["summary"].get(name), new["summary"].get(name)
+        if not a or not b:
+            print(f"{name:20s} {'(only in ' + ('new' if b else 'base') + ')':>36}")
+            continue
+        flags = []
+        for p in ("p50", "p95"):
+            if b[p] - a[p] > min_ms and b[p] > a[p] * (1 + threshold):
+                flags.append(p)
+        regressed = regressed or bool(flags)
+        mark = f"  ⚠️ slower ({', '.join(flags)})" if flags else ""
+        print(f"{name:20s} {a['p50']:9.0f} {b['p50']:8.0f} {a['p95']:9.0f} {b['p95']:8.0f}{mark}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("replay", help="replay a recording against the mock model")
+    run.add_argument("recording")
+    run.add_argument("--module", default="backend_realtime")
+    run.add_argument("--out", help="write the report as JSON")
+    run.add_argument("--speed", type=float, default=1.0, help="2 = replay at twice the recorded pace")
+    run.add_argument("--parallel", type=int, default=4, help="mock upstream slots")
+    run.add_argument("--quiet", action="store_true", help="hide the backend's output")
+    compare = commands.add_parser("diff", help="compare two replay reports")
+    compare.add_argument("base")
+    compare.add_argument("new")
+    compare.add_argument("--threshold", type=float, default=0.10, help="relative slowdown that counts (0.10 = 10%%)")
+    compare.add_argument("--min-ms", type=float, default=5.0, help="ignore smaller absolute slowdowns")
+    args = parser.parse_args()
+
+    if args.command == "replay":
+        report = replay(args)
+        print_report(report)
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+            print(f"\n📝 Report written to {args.out}")
+    else:
+        with open(args.base, encoding="utf-8") as f:
+            base = json.load(f)
+        with open(args.new, encoding="utf-8") as f:
+            new = json.load(f)
+        if diff(base, new, args.threshold, args.min_ms):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
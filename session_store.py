@@ -0,0 +1,306 @@
+"""
+Shared session state for the real-time backends
+History, small caches and cancellation flags live here so that any
+uvicorn worker can serve any session.
+
+Every append and every clear bumps the session's history version, so a
+client that knows its version can be sent only what was appended since
+(see history_delta in the backends).
+
+Store URLs:
+    memory://                 - in-process (single worker only)
+    sqlite:///sessions.db     - local shared store, works across workers
+    redis://localhost:6379/0  - optional, needs the `redis` package
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+DEFAULT_SESSION = "default"
+
+
+class SessionStore(ABC):
+    """Interface shared by every store backend"""
+
+    @abstractmethod
+    def get_history(self, session_id: str, last: Optional[int] = None) -> List[dict]:
+        ...
+
+    @abstractmethod
+    def append_history(self, session_id: str, message: dict, max_len: int) -> None:
+        ...
+
+    @abstractmethod
+    def clear_history(self, session_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def history_version(self, session_id: str) -> int:
+        ...
+
+    @abstractmethod
+    def cache_get(self, key: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def cache_set(self, key: str, value: str, ttl: float = 60.0) -> None:
+        ...
+
+    @abstractmethod
+    def set_cancel(self, session_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def clear_cancel(self, session_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def is_cancelled(self, session_id: str) -> bool:
+        ...
+
+
+class MemorySessionStore(SessionStore):
+    """Plain dicts - same behaviour as the old module-level globals"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._history = {}
+        self._versions = {}
+        self._cache = {}
+        self._cancelled = set()
+
+    def get_history(self, session_id, last=None):
+        with self._lock:
+            history = self._history.get(session_id, [])
+            return list(history[-last:] if last else history)
+
+    def append_history(self, session_id, message, max_len):
+        with self._lock:
+            history = self._history.setdefault(session_id, [])
+            history.append(message)
+            if len(history) > max_len:
+                del history[:-max_len]
+            self._versions[session_id] = self._versions.get(session_id, 0) + 1
+
+    def clear_history(self, session_id):
+        with self._lock:
+            self._history.pop(session_id, None)
+            self._versions[session_id] = self._versions.get(session_id, 0) + 1
+
+    def history_version(self, session_id):
+        with self._lock:
+            return self._versions.get(session_id, 0)
+
+    def cache_get(self, key):
+        with self._lock:
+            item = self._cache.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.time():
+                del self._cache[key]
+                return None
+            return value
+
+    def cache_set(self, key, value, ttl=60.0):
+        with self._lock:
+            self._cache[key] = (value, time.time() + ttl)
+
+    def set_cancel(self, session_id):
+        with self._lock:
+            self._cancelled.add(session_id)
+
+    def clear_cancel(self, session_id):
+        with self._lock:
+            self._cancelled.discard(session_id)
+
+    def is_cancelled(self, session_id):
+        return session_id in self._cancelled
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    SQLite in WAL mode - a local stand-in for Redis
+    Every worker process opens the same file; one connection per thread.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                message TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS history_session ON history (session_id, id);
+            CREATE TABLE IF NOT EXISTS history_version (
+                session_id TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS cancel (
+                session_id TEXT PRIMARY KEY
+            );
+            """
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_history(self, session_id, last=None):
+        if last:
+            rows = self._conn().execute(
+                "SELECT message FROM (SELECT id, message FROM history WHERE session_id = ? "
+                "ORDER BY id DESC LIMIT ?) ORDER BY id",
+                (session_id, last),
+            ).fetchall()
+        else:
+            rows = self._conn().execute(
+                "SELECT message FROM history WHERE session_id = ? ORDER BY id",
+                (session_id,),
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def append_history(self, session_id, message, max_len):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO history (session_id, message) VALUES (?, ?)",
+                (session_id, json.dumps(message)),
+            )
+            conn.execute(
+                "DELETE FROM history WHERE session_id = ? AND id NOT IN "
+                "(SELECT id FROM history WHERE session_id = ? ORDER BY id DESC LIMIT ?)",
+                (session_id, session_id, max_len),
+            )
+            self._bump_version(conn, session_id)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def clear_history(self, session_id):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM history WHERE session_id = ?", (session_id,))
+            self._bump_version(conn, session_id)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _bump_version(self, conn, session_id):
+        conn.execute(
+            "INSERT INTO history_version (session_id, version) VALUES (?, 1) "
+            "ON CONFLICT (session_id) DO UPDATE SET version = version + 1",
+            (session_id,),
+        )
+
+    def history_version(self, session_id):
+        row = self._conn().execute(
+            "SELECT version FROM history_version WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def cache_get(self, key):
+        row = self._conn().execute(
+            "SELECT value, expires FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return row[0]
+
+    def cache_set(self, key, value, ttl=60.0):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+            (key, value, time.time() + ttl),
+        )
+
+    def set_cancel(self, session_id):
+        self._conn().execute("INSERT OR IGNORE INTO cancel (session_id) VALUES (?)", (session_id,))
+
+    def clear_cancel(self, session_id):
+        self._conn().execute("DELETE FROM cancel WHERE session_id = ?", (session_id,))
+
+    def is_cancelled(self, session_id):
+        row = self._conn().execute(
+            "SELECT 1 FROM cancel WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row is not None
+
+
+class RedisSessionStore(SessionStore):
+    """Redis-compatible adapter (Redis, KeyDB, Valkey, ...)"""
+
+    def __init__(self, url: str):
+        import redis
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+
+    def get_history(self, session_id, last=None):
+        start = -last if last else 0
+        items = self._redis.lrange(f"history:{session_id}", start, -1)
+        return [json.loads(item) for item in items]
+
+    def append_history(self, session_id, message, max_len):
+        key = f"history:{session_id}"
+        pipe = self._redis.pipeline()
+        pipe.rpush(key, json.dumps(message))
+        pipe.ltrim(key, -max_len, -1)
+        pipe.incr(f"history_version:{session_id}")
+        pipe.execute()
+
+    def clear_history(self, session_id):
+        pipe = self._redis.pipeline()
+        pipe.delete(f"history:{session_id}")
+        pipe.incr(f"history_version:{session_id}")
+        pipe.execute()
+
+    def history_version(self, session_id):
+        return int(self._redis.get(f"history_version:{session_id}") or 0)
+
+    def cache_get(self, key):
+        return self._redis.get(f"cache:{key}")
+
+    def cache_set(self, key, value, ttl=60.0):
+        self._redis.set(f"cache:{key}", value, px=int(ttl * 1000))
+
+    def set_cancel(self, session_id):
+        self._redis.set(f"cancel:{session_id}", 1, ex=300)
+
+    def clear_cancel(self, session_id):
+        self._redis.delete(f"cancel:{session_id}")
+
+    def is_cancelled(self, session_id):
+        return bool(self._redis.exists(f"cancel:{session_id}"))
+
+
+def create_store(url: str) -> SessionStore:
+    """Build a store from a URL (memory://, sqlite:///path, redis://...)"""
+    if not url or url.startswith("memory://"):
+        return MemorySessionStore()
+    if url.startswith("sqlite:///"):
+        path = url[len("sqlite:///"):] or "sessions.db"
+        return SQLiteSessionStore(os.path.abspath(path))
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisSessionStore(url)
+    raise ValueError(f"Unsupported session store URL: {url}")
@@ -0,0 +1,172 @@
+"""
+Single-flight coalescing for identical upstream calls
+When several sessions send exactly the same request at the same time
+(the demo pages open on many screens, health pings from every open tab),
+only the first one goes to LM Studio / Ollama. Everyone else attaches to
+that call:
+
+    do(key, fn)             blocking call - followers wait for the leader's result
+    stream(key, producer)   streaming call - one upstream stream fans out to
+                            every subscriber; late joiners get a replay of the
+                            chunks so far, then follow live
+
+The stream producer runs in its own thread, so a subscriber that leaves
+(client gone, early stop, cancel) doesn't break the others. The upstream
+is closed once the last subscriber leaves. Keys should cover everything
+that changes the output: the exact messages plus sampling params.
+"""
+
+import hashlib
+import json
+import threading
+from typing import Any, Callable, Dict, Iterator
+
+
+def flight_key(*parts) -> str:
+    """Stable key for JSON-able request parts (url, payload, ...)"""
+    raw = json.dumps(parts, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Flight:
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.abandoned = False
+        self.cond = threading.Condition()
+
+
+class Subscription:
+    """Iterator over one flight's chunks; close() to leave early"""
+
+    def __init__(self, group: "SingleFlight", key: str, flight: _Flight, leader: bool):
+        self.leader = leader    # False if this joined a call already in flight
+        self._group = group
+        self._key = key
+        self._flight = flight
+        self._pos = 0
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        flight = self._flight
+        with flight.cond:
+            flight.cond.wait_for(lambda: self._pos < len(flight.chunks) or flight.done)
+            if self._pos < len(flight.chunks):
+                chunk = flight.chunks[self._pos]
+                self._pos += 1
+                return chunk
+        self.close()
+        if flight.error is not None:
+            raise flight.error
+        raise StopIteration
+
+    def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._group._leave(self._key, self._flight)
+
+    def __del__(self):
+        self.close()
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.followers += 1
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def stream(self, key: str, producer: Callable[[], Iterator]) -> Subscription:
+        """
+        producer() opens the upstream and yields chunks; it only runs for
+        the first caller with this key
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.leaders += 1
+            else:
+                self.followers += 1
+            flight.subscribers += 1
+        if leader:
+            threading.Thread(target=self._produce, args=(key, flight, producer), daemon=True).start()
+        return Subscription(self, key, flight, leader)
+
+    def _produce(self, key: str, flight: _Flight, producer: Callable[[], Iterator]) -> None:
+        upstream = None
+        try:
+            upstream = producer()
+            for chunk in upstream:
+                with flight.cond:
+                    flight.chunks.append(chunk)
+                    flight.cond.notify_all()
+                if flight.abandoned:
+                    break
+        except Exception as e:
+            flight.error = e
+        finally:
+            if upstream is not None and hasattr(upstream, "close"):
+                upstream.close()
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            with flight.cond:
+                flight.done = True
+                flight.cond.notify_all()
+
+    def _leave(self, key: str, flight: _Flight) -> None:
+        with self._lock:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                # Nobody is listening - stop the upstream, and don't let a
+                # new request join a stream that is about to be cut short
+                flight.abandoned = True
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._flights) + len(self._calls),
+            "leaders": self.leaders,
+            "followers": self.followers,
+        }
@@ -0,0 +1,160 @@
+"""
+Streaming Whisper transcription with word-timestamp stitching
+Audio goes into an AudioRingBuffer and is cut into overlapping windows.
+Each window is transcribed with word timestamps. Overlapping windows are
+merged by time, not by comparing text: every window owns the part of
+the timeline up to half the overlap before its right edge. Words past
+that point are held back and re-read by the next window, which has
+better context for them. Each window only looks at its own words, so
+the cost per window stays the same as the transcript grows. A phrase
+the speaker really repeats shows up twice; a phrase that only the
+overlap repeated is counted once. Punctuation doesn't matter.
+"""
+
+import re
+import threading
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from audio_ring import AudioRingBuffer
+from lazy_import import lazy_module
+
+faster_whisper = lazy_module("faster_whisper")
+_models = {}
+_models_lock = threading.Lock()
+
+_NORMALIZE_RE = re.compile(r"[^\w']+")
+
+
+def _normalize(word: str) -> str:
+    return _NORMALIZE_RE.sub("", word.lower())
+
+
+def load_model(size: str = "tiny", device: str = "cpu", compute_type: str = "int8"):
+    """One WhisperModel per (size, device, compute_type), shared by every stream in the process"""
+    key = (size, device, compute_type)
+    with _models_lock:
+        if key not in _models:
+            _models[key] = faster_whisper.WhisperModel(size, device=device, compute_type=compute_type)
+        return _models[key]
+
+
+class TranscriptStitcher:
+    """
+    overlap: seconds shared by consecutive windows
+    min_overlap: an identical word that overlaps the previous one in time
+                 by more than this is the same word seen by both windows
+                 (timestamp jitter at the cut), not a real repetition
+    """
+
+    def __init__(self, overlap: float, min_overlap: float = 0.05):
+        self.overlap = overlap
+        self.min_overlap = min_overlap
+        self.committed_until = 0.0
+        self.words = []
+        self._last_word = ""
+        self._last_end = -1.0
+
+    def add_window(self, window_start: float, window_duration: float,
+                   words: Iterable[Tuple[float, float, str]], final: bool = False) -> List[str]:
+        """
+        words: (start, end, text) relative to the window start.
+        Returns the newly committed words.
+        """
+        cut = float("inf") if final else window_start + window_duration - self.overlap / 2
+        new_words = []
+        for start, end, text in words:
+            start += window_start
+            end += window_start
+            middle = (start + end) / 2
+            if middle < self.committed_until:
+                continue  # already owned by the previous window
+            if middle >= cut:
+                break     # next window will see this word with more context
+            text = text.strip()
+            norm = _normalize(text)
+            if not norm:
+                continue
+            if norm == self._last_word and start < self._last_end - self.min_overlap:
+                continue  # same word straddling the cut point
+            new_words.append(text)
+            self._last_word = norm
+            self._last_end = end
+        self.committed_until = max(self.committed_until, cut)
+        self.words.extend(new_words)
+        return new_words
+
+    @property
+    def text(self) -> str:
+        return " ".join(self.words)
+
+    def reset(self) -> None:
+        self.__init__(self.overlap, self.min_overlap)
+
+
+class StreamingTranscriber:
+    """Ring buffer + faster-whisper + stitcher for one audio stream"""
+
+    def __init__(self, model, samplerate: int = 16000, window: float = 3.0, overlap: float = 1.0,
+                 language: str = "en", beam_size: int = 3, max_seconds: Optional[float] = None):
+        self.model = model
+        self.samplerate = samplerate
+        self.window_size = int(window * samplerate)
+        self.overlap_size = int(overlap * samplerate)
+        self.language = language
+        self.beam_size = beam_size
+        # max_seconds: most unread audio the ring holds before dropping the oldest.
+        # The backends write and transcribe on one task, so a window plus one
+        # message is the most ever queued; a concurrent writer (tes.py) that
+        # keeps talking while Whisper runs needs more
+        if max_seconds is None:
+            max_seconds = window + 0.25
+        self.ring = AudioRingBuffer(max(self.window_size, int(max_seconds * samplerate)))
+        self.stitcher = TranscriptStitcher(overlap)
+        self._segment = np.empty(self.window_size, dtype=np.float32)
+
+    def write(self, samples: np.ndarray) -> None:
+        self.ring.write(samples)
+
+    def _transcribe(self, audio: np.ndarray, start_sample: int, final: bool) -> List[str]:
+        segment = self._segment[:len(audio)]
+        peak = max(float(audio.max()), -float(audio.min())) if len(audio) else 0.0
+        np.multiply(audio, 1.0 / (peak + 1e-9), out=segment)
+        segments, _ = self.model.transcribe(
+            segment, language=self.language, beam_size=self.beam_size, word_timestamps=True
+        )
+        words = [(w.start, w.end, w.word) for seg in segments for w in (seg.words or [])]
+        return self.stitcher.add_window(
+            start_sample / self.samplerate, len(audio) / self.samplerate, words, final=final
+        )
+
+    def process(self, wait: bool = False, timeout: float = None) -> List[str]:
+        """Transcribe every full window available (or wait for one). Returns new words"""
+        new_words = []
+        while True:
+            if wait and not new_words:
+                window = self.ring.wait_window(self.window_size, timeout)
+            else:
+                window = self.ring.window(self.window_size)
+            if window is None:
+                return new_words
+            start = self.ring.position
+            # Copy out of the ring first so the writer can't overwrite the window
+            audio = self._segment
+            np.copyto(audio, window)
+            self.ring.advance(self.window_size - self.overlap_size)
+            new_words += self._transcribe(audio, start, final=False)
+
+    def finish(self) -> List[str]:
+        """End of stream - transcribe what's left and commit the held-back tail"""
+        new_words = self.process()
+        start = self.ring.position
+        rest = self.ring.flush()
+        if len(rest) > self.samplerate // 10:
+            audio = self._segment[:len(rest)]
+            np.copyto(audio, rest)
+            new_words += self._transcribe(audio, start, final=True)
+        else:
+            new_words += self.stitcher.add_window(start / self.samplerate, 0.0, [], final=True)
+        return new_words
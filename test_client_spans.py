@@ -0,0 +1,36 @@
+"""
+Test: POST /api/traces with client attrs named like record()'s own
+arguments ("name", "source", "start_us") must be stored, not a 500.
+
+    python -m pytest test_client_spans.py
+"""
+
+import os
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    from fastapi.testclient import TestClient
+
+    os.environ.setdefault("TRANSCRIPT_LOG", str(tmp_path_factory.mktemp("log") / "transcripts.db"))
+    import backend_realtime
+
+    # No upstream needed - only the trace endpoints are used
+    return TestClient(backend_realtime.app)
+
+
+def test_reserved_attr_names(client):
+    attrs = {"name": "override", "source": "page", "start_us": 1, "turn_id": "x", "engine": "browser"}
+    reply = client.post("/api/traces", json={
+        "turn_id": "client-attrs",
+        "spans": [{"name": "playback", "start_ms": 1_700_000_000_000, "duration_ms": 250, "attrs": attrs}],
+    })
+    assert reply.status_code == 200
+
+    spans = client.get("/api/traces", params={"turn_id": "client-attrs"}).json()["traces"][0]["spans"]
+    assert spans[0]["name"] == "playback"
+    assert spans[0]["source"] == "client"
+    assert spans[0]["duration_us"] == 250_000
+    assert spans[0]["attrs"] == attrs
@@ -0,0 +1,85 @@
+"""
+Test: fillers for a client that only uses /api/chat (like app_fastapi.js)
+The router's time-to-first-token prediction must come from non-streamed
+replies too, otherwise pick_filler() never finds the model slow to start.
+
+Runs the LM Studio backend in-process against mock_llm_server.py with a
+300 ms time to first token:
+
+    python -m pytest test_filler_prediction.py
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+class SilentVoice:
+    """Stand-in TTS voice so the filler bank is ready without a TTS engine"""
+
+    name = "silent"
+    sample_rate = 16000
+
+    def synthesize(self, text):
+        return np.zeros(1600, dtype=np.float32)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def backend(tmp_path_factory):
+    port = free_port()
+    mock = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, "mock_llm_server.py"), "--port", str(port),
+         "--ttft-ms", "300", "--tps", "100", "--jitter", "0"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+        os.environ.setdefault("TRANSCRIPT_LOG", str(tmp_path_factory.mktemp("log") / "transcripts.db"))
+        import backend_realtime
+        # Set after import - another test may have imported the module already
+        backend_realtime.LM_STUDIO_BASE = f"http://127.0.0.1:{port}"
+        backend_realtime.LM_STUDIO_URL = f"{backend_realtime.LM_STUDIO_BASE}/v1/chat/completions"
+        backend_realtime.FILLER_TTFT_MS = 200
+        backend_realtime.filler_bank.warm(SilentVoice())
+        yield backend_realtime
+    finally:
+        mock.terminate()
+        mock.wait()
+
+
+def test_chat_only_turns_get_a_filler(backend, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    # Only the /api/chat turns below may feed the router
+    monkeypatch.setattr(backend.keepalive, "warm_up", lambda: None)
+    budget = backend.degrade.budget(backend.classify_turn("why is the sky blue?"))
+    assert backend.pick_filler("chat-only", budget, SilentVoice.name) is None
+
+    with TestClient(backend.app) as client:
+        for text in ("why is the sky blue?", "how does a rainbow form?"):
+            reply = client.post("/api/chat", json={"text": text, "session_id": "chat-only"})
+            assert reply.status_code == 200
+
+    assert (backend.router.predicted_ttft_ms(budget) or 0) >= 200
+    assert backend.pick_filler("chat-only", budget, SilentVoice.name) in backend.filler_bank.fillers[budget.kind]
@@ -0,0 +1,129 @@
+"""
+Per-turn latency tracing
+Every user turn gets a turn id. The client sends it (body field `turn_id`
+or `X-Turn-Id` header) with /api/stream_chat and the TTS requests, or the
+server makes one and returns it in the `X-Turn-Id` response header.
+Server stages (admission wait, prompt build, upstream TTFT, think-tag
+buffering, generation, TTS) are recorded as spans under that id. The
+browser posts its own spans (speech recognition, queue wait, playback).
+
+Spans go into a fixed-size in-process ring buffer, so tracing costs a few
+microseconds per span and never grows memory. /api/traces dumps recent
+turns as JSON, or in Chrome trace format for chrome://tracing / Perfetto
+(one row per turn, server and client as separate lanes).
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Optional
+
+TURN_HEADER = "X-Turn-Id"
+
+
+def new_turn_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def now_us() -> int:
+    """Wall clock in microseconds - comparable with the browser's Date.now()"""
+    return time.time_ns() // 1000
+
+
+class Tracer:
+    def __init__(self, capacity: int = 4096):
+        self._spans = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def record(self, turn_id: Optional[str], name: str, start_us: int, end_us: int,
+               source: str = "server", **attrs) -> None:
+        self.add(turn_id, name, start_us, end_us, source, attrs)
+
+    def add(self, turn_id: Optional[str], name: str, start_us: int, end_us: int,
+            source: str, attrs: dict) -> None:
+        """record() with attrs as one dict - for attrs from clients, whose keys may be anything"""
+        if not turn_id:
+            return
+        span = {
+            "turn_id": turn_id,
+            "name": name,
+            "source": source,
+            "start_us": int(start_us),
+            "duration_us": max(0, int(end_us - start_us)),
+            "attrs": attrs,
+        }
+        with self._lock:
+            self._spans.append(span)
+
+    @contextmanager
+    def span(self, turn_id: Optional[str], name: str, **attrs):
+        """Time a block; the yielded dict can take extra attrs"""
+        start = now_us()
+        try:
+            yield attrs
+        finally:
+            self.record(turn_id, name, start, now_us(), **attrs)
+
+    async def mark_first(self, turn_id: Optional[str], name: str, chunks):
+        """Pass an async iterator through, recording the time until its first item"""
+        start = now_us()
+        first = True
+        async for chunk in chunks:
+            if first:
+                self.record(turn_id, name, start, now_us())
+                first = False
+            yield chunk
+
+    def _turns(self, limit: int, turn_id: Optional[str]) -> "OrderedDict[str, list]":
+        with self._lock:
+            spans = list(self._spans)
+        turns = OrderedDict()
+        for span in spans:
+            if turn_id is None or span["turn_id"] == turn_id:
+                turns.setdefault(span["turn_id"], []).append(span)
+        # Newest turns last; keep the last `limit`
+        while len(turns) > limit:
+            turns.popitem(last=False)
+        return turns
+
+    def traces(self, limit: int = 50, turn_id: Optional[str] = None) -> list:
+        result = []
+        for tid, spans in self._turns(limit, turn_id).items():
+            spans.sort(key=lambda s: s["start_us"])
+            start = spans[0]["start_us"]
+            end = max(s["start_us"] + s["duration_us"] for s in spans)
+            result.append({
+                "turn_id": tid,
+                "start_us": start,
+                "duration_ms": (end - start) / 1000,
+                "spans": [
+                    {**s, "offset_ms": (s["start_us"] - start) / 1000, "duration_ms": s["duration_us"] / 1000}
+                    for s in spans
+                ],
+            })
+        return result
+
+    def chrome_trace(self, limit: int = 50, turn_id: Optional[str] = None) -> dict:
+        """Chrome trace event format: one process per turn, server/client threads"""
+        lanes = {"server": 1, "client": 2}
+        events = []
+        for pid, (tid, spans) in enumerate(self._turns(limit, turn_id).items(), start=1):
+            events.append({"ph": "M", "name": "process_name", "pid": pid, "tid": 0,
+                           "args": {"name": f"turn {tid}"}})
+            for source, lane in lanes.items():
+                events.append({"ph": "M", "name": "thread_name", "pid": pid, "tid": lane,
+                               "args": {"name": source}})
+            for span in spans:
+                events.append({
+                    "name": span["name"],
+                    "cat": span["source"],
+                    "ph": "X",
+                    "ts": span["start_us"],
+                    "dur": span["duration_us"],
+                    "pid": pid,
+                    "tid": lanes.get(span["source"], 3),
+                    "args": span["attrs"],
+                })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
@@ -0,0 +1,171 @@
+"""
+Persistent conversation log
+Append-only SQLite table (WAL mode) written in batches by a background
+thread, so the request path only pays for a queue.put(). Supports fast
+tail reads to rebuild context after a restart and cursor-based pages for
+GET /api/history. Reads first flush whatever is still queued, so they see
+every append and clear made before them. Clearing a session appends a
+marker row instead of deleting anything.
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Tuple
+
+CLEAR_MARKER = "__clear__"
+
+
+class TranscriptLog:
+    def __init__(self, path: str, batch_size: int = 256, flush_interval: float = 0.2):
+        self.path = os.path.abspath(path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._local = threading.local()
+        self._conn().executescript(
+            """
+            CREATE TABLE IF NOT EXISTS transcript (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                ts REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS transcript_session ON transcript (session_id, id);
+            CREATE INDEX IF NOT EXISTS transcript_role ON transcript (session_id, role, id);
+            """
+        )
+        self._writer = threading.Thread(target=self._write_loop, name="transcript-log", daemon=True)
+        self._writer.start()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # -- write path -------------------------------------------------------
+
+    def append(self, session_id: str, message: dict) -> None:
+        """Queue a message for writing - never blocks on disk"""
+        self._queue.put((session_id, message.get("role", ""), message.get("content", ""), time.time()))
+
+    def clear(self, session_id: str) -> None:
+        """Mark the session as cleared; older rows stay on disk"""
+        self._queue.put((session_id, CLEAR_MARKER, "", time.time()))
+
+    def flush(self) -> None:
+        """Block until everything queued so far is on disk"""
+        if not self._writer.is_alive():
+            return
+        # Ends the writer's current batch early instead of waiting out
+        # flush_interval, and is set once that batch is committed
+        written = threading.Event()
+        self._queue.put(written)
+        written.wait(timeout=5)
+
+    def close(self) -> None:
+        """Write out everything queued and stop the writer"""
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(timeout=5)
+
+    def _write_loop(self) -> None:
+        conn = self._conn()
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and isinstance(batch[-1], tuple):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            rows = [row for row in batch if isinstance(row, tuple)]
+            try:
+                if rows:
+                    conn.execute("BEGIN")
+                    conn.executemany(
+                        "INSERT INTO transcript (session_id, role, content, ts) VALUES (?, ?, ?, ?)",
+                        rows,
+                    )
+                    conn.execute("COMMIT")
+            except Exception as e:
+                print(f"⚠️ Transcript log write failed ({len(rows)} rows): {e}")
+                try:
+                    conn.execute("ROLLBACK")
+                except sqlite3.Error:
+                    pass
+            finally:
+                for item in batch:
+                    if isinstance(item, threading.Event):
+                        item.set()
+                    self._queue.task_done()
+            if batch[-1] is None:
+                return
+
+    # -- read path --------------------------------------------------------
+
+    def _start_id(self, session_id: str) -> int:
+        row = self._conn().execute(
+            "SELECT MAX(id) FROM transcript WHERE session_id = ? AND role = ?",
+            (session_id, CLEAR_MARKER),
+        ).fetchone()
+        return row[0] or 0
+
+    def tail(self, session_id: str, n: int) -> List[dict]:
+        """Last n messages since the last clear, oldest first"""
+        self.flush()
+        rows = self._conn().execute(
+            "SELECT role, content FROM transcript WHERE session_id = ? AND id > ? "
+            "ORDER BY id DESC LIMIT ?",
+            (session_id, self._start_id(session_id), n),
+        ).fetchall()
+        return [{"role": role, "content": content} for role, content in reversed(rows)]
+
+    def since(self, session_id: str, after: int, limit: int) -> Tuple[List[dict], int, bool]:
+        """
+        Up to `limit` newest messages after row id `after`, oldest first.
+        Returns (messages, newest row id, cleared) - cleared means the
+        session was cleared after `after`, and the messages start there.
+        """
+        self.flush()
+        start = self._start_id(session_id)
+        rows = self._conn().execute(
+            "SELECT id, role, content FROM transcript WHERE session_id = ? AND id > ? "
+            "ORDER BY id DESC LIMIT ?",
+            (session_id, max(start, after), limit),
+        ).fetchall()
+        newest = rows[0][0] if rows else max(start, after)
+        return [{"role": role, "content": content} for _, role, content in reversed(rows)], newest, start > after
+
+    def page(self, session_id: str, limit: int = 40,
+             before: Optional[int] = None) -> Tuple[List[dict], Optional[int]]:
+        """
+        One page of history, newest page first, messages oldest first.
+        Returns (messages, next_before); pass next_before back to get the
+        previous page, None means there is nothing older.
+        """
+        self.flush()
+        start = self._start_id(session_id)
+        rows = self._conn().execute(
+            "SELECT id, role, content, ts FROM transcript WHERE session_id = ? AND id > ? "
+            "AND id < ? ORDER BY id DESC LIMIT ?",
+            (session_id, start, before if before is not None else 1 << 62, limit + 1),
+        ).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        messages = [
+            {"id": row_id, "role": role, "content": content, "ts": ts}
+            for row_id, role, content, ts in reversed(rows)
+        ]
+        next_before = rows[-1][0] if has_more and rows else None
+        return messages, next_before
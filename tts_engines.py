@@ -0,0 +1,172 @@
+"""
+Pluggable TTS engines
+Every engine turns text into mono float32 audio. `stream()` yields chunks
+as they are synthesised, so /ws/tts can send the first frames before the
+whole reply is done. Engines that can only render a full clip (pyttsx3)
+yield it as one chunk.
+
+    pyttsx3  system voices (SAPI5 / NSSpeechSynthesizer / eSpeak), baseline
+    piper    Piper neural voices (ONNX, runs on CPU), one chunk per sentence
+
+Engines are created once per process by get_engine() and shared by all
+requests.
+"""
+
+import io
+import os
+import tempfile
+import threading
+import wave
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional
+
+from lazy_import import lazy_module
+from audio_codec import float_to_pcm16, resample, wav_to_float
+
+np = lazy_module("numpy")
+pyttsx3 = lazy_module("pyttsx3")
+
+PIPER_MODEL = os.environ.get("PIPER_MODEL", "en_US-lessac-medium.onnx")
+
+
+def float_to_wav(audio, sample_rate: int) -> bytes:
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(float_to_pcm16(audio))
+    return buf.getvalue()
+
+
+class TTSEngine:
+    name = "base"
+    sample_rate = 22050   # fixed per engine instance; every chunk is at this rate
+
+    def stream(self, text: str) -> Iterator:
+        """Yield float32 chunks at self.sample_rate as they are ready"""
+        raise NotImplementedError
+
+    def synthesize(self, text: str):
+        chunks = list(self.stream(text))
+        return np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.float32)
+
+    def synthesize_wav(self, text: str) -> bytes:
+        audio = self.synthesize(text)
+        return float_to_wav(audio, self.sample_rate)
+
+
+class Pyttsx3Engine(TTSEngine):
+    """The original /api/tts path - renders the whole clip to a temp WAV"""
+
+    name = "pyttsx3"
+
+    def __init__(self, rate: int = 160, volume: float = 1.0):
+        self.rate = rate
+        self.volume = volume
+        self._lock = threading.Lock()   # pyttsx3 engines are not thread-safe
+
+    def _render(self, text: str) -> bytes:
+        with self._lock:
+            engine = pyttsx3.init()
+
+            # Optimize for natural speech
+            engine.setProperty('rate', self.rate)  # Slightly faster for natural flow
+            engine.setProperty('volume', self.volume)
+
+            with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as temp_audio:
+                engine.save_to_file(text, temp_audio.name)
+                engine.runAndWait()
+                temp_path = temp_audio.name
+
+        with open(temp_path, 'rb') as f:
+            audio_data = f.read()
+
+        os.unlink(temp_path)
+        return audio_data
+
+    def stream(self, text: str) -> Iterator:
+        audio, rate = wav_to_float(self._render(text))
+        yield resample(audio, rate, self.sample_rate)
+
+    def synthesize_wav(self, text: str) -> bytes:
+        # Already a WAV - skip the decode/encode round trip
+        return self._render(text)
+
+
+class PiperEngine(TTSEngine):
+    """Piper voice (pip install piper-tts) - yields audio sentence by sentence"""
+
+    name = "piper"
+
+    def __init__(self, model_path: str = PIPER_MODEL):
+        from piper import PiperVoice
+        self.voice = PiperVoice.load(model_path)
+        self.sample_rate = self.voice.config.sample_rate
+
+    def stream(self, text: str) -> Iterator:
+        if hasattr(self.voice, "synthesize_stream_raw"):
+            # piper-tts 1.2: raw int16 bytes, one sentence at a time
+            for raw in self.voice.synthesize_stream_raw(text):
+                yield np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+        else:
+            # piper-tts 1.3+: AudioChunk objects, one sentence at a time
+            for chunk in self.voice.synthesize(text):
+                yield np.asarray(chunk.audio_float_array, dtype=np.float32)
+
+
+ENGINES = {
+    "pyttsx3": Pyttsx3Engine,
+    "piper": PiperEngine,
+}
+
+_instances: Dict[str, TTSEngine] = {}
+_instances_lock = threading.Lock()
+
+
+def get_engine(name: str) -> TTSEngine:
+    """Shared engine instance for this process (loaded on first use)"""
+    if name not in ENGINES:
+        raise ValueError(f"Unknown TTS engine '{name}' (choose from {', '.join(ENGINES)})")
+    with _instances_lock:
+        if name not in _instances:
+            _instances[name] = ENGINES[name]()
+        return _instances[name]
+
+
+def engine_names() -> List[str]:
+    return list(ENGINES)
+
+
+class ClipCache:
+    """LRU of whole synthesised clips, keyed by engine and text"""
+
+    def __init__(self, max_clips: int = 256):
+        self.max_clips = max_clips
+        self._clips: "OrderedDict[tuple, object]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, engine: str, text: str) -> Optional[object]:
+        key = (engine, text.strip().lower())
+        with self._lock:
+            audio = self._clips.get(key)
+            if audio is None:
+                self.misses += 1
+                return None
+            self._clips.move_to_end(key)
+            self.hits += 1
+            return audio
+
+    def put(self, engine: str, text: str, chunks: list) -> None:
+        if not chunks or self.max_clips <= 0:
+            return
+        audio = chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+        with self._lock:
+            self._clips[(engine, text.strip().lower())] = audio
+            while len(self._clips) > self.max_clips:
+                self._clips.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"clips": len(self._clips), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,70 @@
+"""
+Cheap per-turn input classifier
+Picks the generation budget (max_tokens / num_predict) and stop sequences
+from the user's text, so a "yeah" doesn't get the same 50-token budget as
+"why do you think that happened?". Mirrors the frontend's
+shouldRespondVerbally() noise check.
+"""
+
+import re
+from typing import List, NamedTuple, Optional
+
+
+class TurnBudget(NamedTuple):
+    kind: str
+    max_tokens: int
+    stop: List[str]
+    max_sentences: int
+
+
+# kind -> (max_tokens, stop sequences, sentences before early stop)
+BUDGETS = {
+    "noise": (8, ["\n"], 1),          # "test test test"
+    "backchannel": (16, ["\n"], 1),   # "yeah", "oh really", "hmm"
+    "chat": (35, ["\n\n"], 2),        # normal statement
+    "deep": (50, ["\n\n"], 3),        # questions, opinions, explanations
+}
+
+BACKCHANNEL_WORDS = {
+    "yeah", "yes", "yep", "yup", "no", "nope", "nah", "ok", "okay", "sure", "right",
+    "cool", "nice", "wow", "oh", "ah", "uh", "um", "hmm", "mhm", "huh", "really",
+    "true", "totally", "exactly", "lol", "haha", "hi", "hey", "hello", "bye",
+    "thanks", "thank", "you", "i", "see", "got", "it", "same", "agreed", "damn",
+}
+
+DEEP_KEYWORDS = (
+    "why", "how do", "how does", "how did", "how can", "how come", "how would", "how should",
+    "how to", "explain", "what do you think", "what's your", "whats your",
+    "tell me", "opinion", "should i", "do you think", "would you", "advice",
+    "difference between", "what if", "describe", "recommend",
+)
+
+_WORD_RE = re.compile(r"[a-z']+")
+_DEEP_RE = re.compile(r"\b(?:" + "|".join(re.escape(k) for k in DEEP_KEYWORDS) + r")\b")
+
+
+def _budget(kind: str, cap: Optional[int]) -> TurnBudget:
+    max_tokens, stop, max_sentences = BUDGETS[kind]
+    return TurnBudget(kind, min(max_tokens, cap) if cap else max_tokens, stop, max_sentences)
+
+
+def classify_turn(text: str, cap: Optional[int] = None) -> TurnBudget:
+    """
+    Classify one user turn - O(len(text)), no model calls
+    cap: the backend's own max_tokens ceiling, applied on top of BUDGETS
+    """
+    lower = text.lower().strip()
+    words = _WORD_RE.findall(lower)
+
+    # Same rule as shouldRespondVerbally(): one word repeated 3+ times is noise
+    if len(words) >= 3 and len(set(words)) == 1:
+        return _budget("noise", cap)
+
+    # Silence nudges ("...") and short reactions
+    if not words or (len(words) <= 3 and all(w in BACKCHANNEL_WORDS for w in words)):
+        return _budget("backchannel", cap)
+
+    if "?" in lower or _DEEP_RE.search(lower) or len(words) >= 20:
+        return _budget("deep", cap)
+
+    return _budget("chat", cap)